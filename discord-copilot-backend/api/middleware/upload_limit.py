@@ -0,0 +1,50 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import get_settings
+
+settings = get_settings()
+
+UPLOAD_PATH = "/api/knowledge/upload"
+MULTIPART_OVERHEAD = 64 * 1024  # Boundaries, part headers and the small form fields
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Enforce the upload size limit on the raw request body, before
+    python-multipart parses (and spools) the form: a Content-Length over the
+    limit is refused up front, and a body without one is cut off with 413 as
+    soon as it crosses the limit. The route still checks the file's own size.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.max_body = settings.max_upload_size_mb * 1024 * 1024 + MULTIPART_OVERHEAD
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"File size exceeds {settings.max_upload_size_mb}MB limit")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != UPLOAD_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body:
+            response = JSONResponse({"detail": self._too_large().detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # Raised inside body parsing, so FastAPI answers with the 413
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
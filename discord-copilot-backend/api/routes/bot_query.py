@@ -1,8 +1,15 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from db.supabase_client import get_supabase
-from services.rag_service import search_knowledge
+from services.context_assembler import context_assembler
+from services.embedding_cache import embedding_cache
+from services.answer_cache import answer_cache
+from bot.memory_summarizer import memory_summarizer
+from bot.discord_bot import bot
+from services.llm_scheduler import llm_scheduler, SchedulerBusy, current_guild
+from services.model_router import model_router
+from services.openrouter import OpenRouterClient
 from config import get_settings
+from uuid import UUID
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +21,8 @@ router = APIRouter(prefix="/api/bot", tags=["bot"])
 class BotQueryRequest(BaseModel):
     query: str
     channel_id: str
+    guild_id: str = ""
+    document_ids: list[UUID] | None = None  # Restrict knowledge search to these documents (malformed ids are a 422)
 
 
 class KnowledgeChunk(BaseModel):
@@ -27,6 +36,7 @@ class BotQueryResponse(BaseModel):
     conversation_memory: str
     relevant_knowledge: list[KnowledgeChunk]
     is_allowed_channel: bool
+    timings: dict[str, float] = {}
 
 
 @router.post("/query", response_model=BotQueryResponse)
@@ -35,59 +45,55 @@ async def bot_query(request: BotQueryRequest):
     Internal endpoint for Discord bot to get complete context
     No authentication required (internal use only)
     """
-    supabase = get_supabase()
+    current_guild.set(request.guild_id)
+    
+    # Canonical string form, as both the database and the local index store document ids;
+    # an empty list means no restriction on either path
+    document_ids = [str(document_id) for document_id in request.document_ids] if request.document_ids else None
     
     try:
-        # 1. Check if channel is allowed
-        channel_response = supabase.table("allowed_channels").select("channel_id").eq(
-            "channel_id", request.channel_id
-        ).execute()
-        
-        is_allowed = len(channel_response.data) > 0
-        
-        if not is_allowed:
-            return BotQueryResponse(
-                system_instructions="",
-                conversation_memory="",
-                relevant_knowledge=[],
-                is_allowed_channel=False
-            )
-        
-        # 2. Get system instructions
-        instructions_response = supabase.table("system_instructions").select(
-            "instructions"
-        ).order("updated_at", desc=True).limit(1).execute()
-        
-        system_instructions = "You are a helpful Discord assistant."
-        if instructions_response.data:
-            system_instructions = instructions_response.data[0]["instructions"]
-        
-        # 3. Get conversation memory
-        memory_response = supabase.table("conversation_memory").select(
-            "summary"
-        ).limit(1).execute()
-        
-        conversation_memory = "No conversation history yet."
-        if memory_response.data:
-            conversation_memory = memory_response.data[0]["summary"]
-        
-        # 4. Search knowledge base
-        knowledge_chunks = await search_knowledge(request.query, settings.top_k_retrieval)
+        # Allow-list gate, then instructions/memory/knowledge fetched concurrently
+        context = await context_assembler.assemble(
+            request.query,
+            request.channel_id,
+            request.guild_id,
+            document_ids=document_ids
+        )
         
         return BotQueryResponse(
-            system_instructions=system_instructions,
-            conversation_memory=conversation_memory,
+            system_instructions=context["system_instructions"],
+            conversation_memory=context["conversation_memory"],
             relevant_knowledge=[
                 KnowledgeChunk(
                     text=chunk["text"],
                     source=chunk["source"],
                     similarity=chunk["similarity"]
                 )
-                for chunk in knowledge_chunks
+                for chunk in context["relevant_knowledge"]
             ],
-            is_allowed_channel=True
+            is_allowed_channel=context["is_allowed_channel"],
+            timings=context["timings"]
         )
     
+    except SchedulerBusy as e:
+        raise HTTPException(status_code=503, detail=f"Provider busy, try again shortly: {str(e)}")
+    
     except Exception as e:
         logger.error(f"Bot query failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process bot query: {str(e)}")
+
+
+@router.get("/stats")
+async def bot_stats():
+    """
+    Cache and provider queue statistics for the bot pipeline (internal diagnostics)
+    """
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "memory_summarizer": memory_summarizer.stats(),
+        "in_flight": bot.in_flight.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "models": model_router.stats(),
+        "openrouter": OpenRouterClient.stats()
+    }
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from api.middleware.auth import get_current_user
-from db.supabase_client import get_supabase
+from db import repository
+from services.config_cache import config_cache
 from datetime import datetime
 
 router = APIRouter(prefix="/api/channels", tags=["channels"])
@@ -10,12 +11,18 @@ router = APIRouter(prefix="/api/channels", tags=["channels"])
 class ChannelCreate(BaseModel):
     channel_id: str
     channel_name: str | None = None
+    collection: str | None = None
+
+
+class ChannelUpdate(BaseModel):
+    collection: str | None = None
 
 
 class ChannelResponse(BaseModel):
     id: str
     channel_id: str
     channel_name: str | None
+    collection: str | None = None
     added_at: datetime
     added_by: str | None
 
@@ -25,11 +32,8 @@ async def list_channels():
     """
     List all allowed Discord channels (public for bot access)
     """
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("allowed_channels").select("*").order("added_at", desc=True).execute()
-        return response.data
+        return await repository.list_channels()
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch channels: {str(e)}")
@@ -43,19 +47,19 @@ async def add_channel(
     """
     Add a Discord channel to the allow-list (requires authentication)
     """
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("allowed_channels").insert({
-            "channel_id": channel.channel_id,
-            "channel_name": channel.channel_name,
-            "added_by": current_user["user_id"]
-        }).execute()
+        created = await repository.add_channel(
+            channel.channel_id,
+            channel.channel_name,
+            current_user["user_id"],
+            channel.collection
+        )
         
-        if not response.data:
+        if not created:
             raise HTTPException(status_code=500, detail="Failed to add channel")
         
-        return response.data[0]
+        config_cache.invalidate_channels()
+        return created
     
     except Exception as e:
         # Handle unique constraint violation
@@ -64,6 +68,30 @@ async def add_channel(
         raise HTTPException(status_code=500, detail=f"Failed to add channel: {str(e)}")
 
 
+@router.patch("/{channel_id}", response_model=ChannelResponse)
+async def update_channel(
+    channel_id: str,
+    update: ChannelUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Scope a channel's knowledge search to one collection, or null for all (requires authentication)
+    """
+    try:
+        updated = await repository.set_channel_collection(channel_id, update.collection)
+        
+        if not updated:
+            raise HTTPException(status_code=404, detail="Channel not found")
+        
+        config_cache.invalidate_channels()
+        return updated
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update channel: {str(e)}")
+
+
 @router.delete("/{channel_id}")
 async def remove_channel(
     channel_id: str,
@@ -72,14 +100,13 @@ async def remove_channel(
     """
     Remove a Discord channel from the allow-list (requires authentication)
     """
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("allowed_channels").delete().eq("channel_id", channel_id).execute()
+        removed = await repository.remove_channel(channel_id)
         
-        if not response.data:
+        if not removed:
             raise HTTPException(status_code=404, detail="Channel not found")
         
+        config_cache.invalidate_channels()
         return {"message": "Channel removed successfully"}
     
     except Exception as e:
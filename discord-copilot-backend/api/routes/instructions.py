@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from api.middleware.auth import get_current_user
-from db.supabase_client import get_supabase
+from db import repository
+from services.config_cache import config_cache
 from datetime import datetime
 
 router = APIRouter(prefix="/api/instructions", tags=["instructions"])
@@ -23,15 +24,13 @@ async def get_instructions():
     """
     Get current system instructions (public endpoint for bot access)
     """
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("system_instructions").select("*").order("updated_at", desc=True).limit(1).execute()
+        instructions = await repository.get_latest_instructions()
         
-        if not response.data:
+        if not instructions:
             raise HTTPException(status_code=404, detail="No system instructions found")
         
-        return response.data[0]
+        return instructions
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch instructions: {str(e)}")
@@ -45,30 +44,15 @@ async def update_instructions(
     """
     Update system instructions (requires authentication)
     """
-    supabase = get_supabase()
-    
     try:
-        # Check if any instructions exist
-        existing = supabase.table("system_instructions").select("id").limit(1).execute()
-        
-        if existing.data:
-            # Update existing
-            response = supabase.table("system_instructions").update({
-                "instructions": update.instructions,
-                "updated_at": datetime.utcnow().isoformat(),
-                "updated_by": current_user["user_id"]
-            }).eq("id", existing.data[0]["id"]).execute()
-        else:
-            # Insert new
-            response = supabase.table("system_instructions").insert({
-                "instructions": update.instructions,
-                "updated_by": current_user["user_id"]
-            }).execute()
+        # Update the existing row, or insert the first one
+        saved = await repository.save_instructions(update.instructions, current_user["user_id"])
         
-        if not response.data:
+        if not saved:
             raise HTTPException(status_code=500, detail="Failed to update instructions")
         
-        return response.data[0]
+        config_cache.invalidate_instructions()
+        return saved
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update instructions: {str(e)}")
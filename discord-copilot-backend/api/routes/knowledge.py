@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from pydantic import BaseModel
 from api.middleware.auth import get_current_user
 from db.supabase_client import get_supabase
-from services.pdf_processor import process_pdf_document
+from db import repository
+from services.pdf_processor import process_pdf_document, remove_spool_file
+from services.answer_cache import answer_cache
+from services.local_vector_index import local_vector_index
+from config import get_settings
 from datetime import datetime
+from urllib.parse import quote
+import aiofiles
+import asyncio
+import hashlib
+import httpx
 import uuid
 
+settings = get_settings()
+
 router = APIRouter(prefix="/api/knowledge", tags=["knowledge"])
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
 
 class DocumentResponse(BaseModel):
     id: str
@@ -17,6 +30,76 @@ class DocumentResponse(BaseModel):
     upload_date: datetime
     uploaded_by: str | None
     status: str
+    content_hash: str | None = None
+    collection: str = repository.DEFAULT_COLLECTION
+
+
+async def _spool_upload(file: UploadFile, max_size: int) -> tuple[str, int, str]:
+    """
+    Stream an upload to a temp file in fixed-size chunks, computing its size
+    and sha256 as it goes, so memory stays flat regardless of file size.
+    Returns (spool_path, file_size, sha256_hex).
+    """
+    hasher = hashlib.sha256()
+    file_size = 0
+    
+    async with aiofiles.tempfile.NamedTemporaryFile(
+        "wb", prefix="upload_", suffix=".pdf", dir=settings.upload_spool_dir, delete=False
+    ) as spool:
+        spool_path = spool.name
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size exceeds {settings.max_upload_size_mb}MB limit"
+                    )
+                hasher.update(chunk)
+                await spool.write(chunk)
+        except BaseException:
+            remove_spool_file(spool_path)
+            raise
+    
+    return spool_path, file_size, hasher.hexdigest()
+
+
+def _upload_to_storage(storage_path: str, spool_path: str):
+    """Upload the spooled file to Supabase Storage, streaming from disk"""
+    with open(spool_path, "rb") as pdf_file:
+        get_supabase().storage.from_("documents").upload(
+            storage_path,
+            pdf_file,
+            {"content-type": "application/pdf"}
+        )
+
+
+async def _download_to_spool(storage_path: str) -> str:
+    """
+    Stream a stored PDF from Supabase Storage into a spool file in
+    fixed-size chunks (as uploads are spooled) and return its path
+    """
+    url = f"{settings.supabase_url}/storage/v1/object/documents/{quote(storage_path)}"
+    headers = {
+        "apikey": settings.supabase_service_role_key,
+        "Authorization": f"Bearer {settings.supabase_service_role_key}"
+    }
+    
+    async with aiofiles.tempfile.NamedTemporaryFile(
+        "wb", prefix="upload_", suffix=".pdf", dir=settings.upload_spool_dir, delete=False
+    ) as spool:
+        spool_path = spool.name
+        try:
+            async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
+                async with client.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(UPLOAD_CHUNK_SIZE):
+                        await spool.write(chunk)
+        except BaseException:
+            remove_spool_file(spool_path)
+            raise
+    
+    return spool_path
 
 
 @router.get("/list", response_model=list[DocumentResponse])
@@ -24,11 +107,8 @@ async def list_documents(current_user: dict = Depends(get_current_user)):
     """
     List all uploaded PDF documents
     """
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("pdf_documents").select("*").order("upload_date", desc=True).execute()
-        return response.data
+        return await repository.list_documents()
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch documents: {str(e)}")
@@ -38,59 +118,95 @@ async def list_documents(current_user: dict = Depends(get_current_user)):
 async def upload_document(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    collection: str = Form(repository.DEFAULT_COLLECTION),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Upload a PDF document for processing
+    Upload a PDF document for processing into a knowledge collection
+    Oversized request bodies are refused by UploadSizeLimitMiddleware before
+    the form is parsed; the file's own size is checked again while spooling
     """
     # Validate file type
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    # Validate file size (10MB max)
-    content = await file.read()
-    file_size = len(content)
-    max_size = 10 * 1024 * 1024  # 10MB
-    
-    if file_size > max_size:
-        raise HTTPException(status_code=400, detail="File size exceeds 10MB limit")
-    
-    supabase = get_supabase()
+    # Spool to disk, validating file size as we go
+    max_size = settings.max_upload_size_mb * 1024 * 1024
+    spool_path, file_size, content_hash = await _spool_upload(file, max_size)
     
     try:
         # Generate unique filename
         doc_id = str(uuid.uuid4())
         storage_path = f"pdfs/{doc_id}_{file.filename}"
         
-        # Upload to Supabase Storage
-        storage_response = supabase.storage.from_("documents").upload(
+        # Upload to Supabase Storage (sync client, so keep it off the event loop)
+        await asyncio.to_thread(_upload_to_storage, storage_path, spool_path)
+        
+        # Create database record
+        document = await repository.create_document(
+            doc_id,
+            file.filename,
             storage_path,
-            content,
-            {"content-type": "application/pdf"}
+            file_size,
+            current_user["user_id"],
+            content_hash=content_hash,
+            collection=collection
         )
         
-        # Create database record
-        db_response = supabase.table("pdf_documents").insert({
-            "id": doc_id,
-            "filename": file.filename,
-            "file_path": storage_path,
-            "file_size": file_size,
-            "uploaded_by": current_user["user_id"],
-            "status": "processing"
-        }).execute()
-        
-        if not db_response.data:
+        if not document:
             raise HTTPException(status_code=500, detail="Failed to create document record")
         
-        # Process PDF in background
-        background_tasks.add_task(process_pdf_document, doc_id, storage_path, content)
+        # Process PDF in background (it reads the spooled file and removes it when done)
+        background_tasks.add_task(process_pdf_document, doc_id, spool_path)
         
-        return db_response.data[0]
+        return document
     
     except Exception as e:
+        remove_spool_file(spool_path)
         raise HTTPException(status_code=500, detail=f"Failed to upload document: {str(e)}")
 
 
+@router.post("/{document_id}/reprocess", response_model=DocumentResponse)
+async def reprocess_document(
+    document_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Re-run processing for a document (e.g. after a failed ingestion)
+    Embeddings computed by the earlier run are reused, so only the remainder is embedded
+    A document that is already processing is rejected with 409
+    """
+    try:
+        file_path = await repository.get_document_path(document_id)
+        
+        if not file_path:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        # Claimed atomically, so two requests can't start overlapping runs
+        document = await repository.start_document_processing(document_id)
+        if not document:
+            raise HTTPException(status_code=409, detail="Document is already being processed")
+        
+        try:
+            spool_path = await _download_to_spool(file_path)
+        except BaseException:
+            await repository.set_document_status(document_id, "failed")
+            raise
+        
+        answer_cache.bump_knowledge_revision()
+        await local_vector_index.sync_document(document_id)
+        
+        background_tasks.add_task(process_pdf_document, document_id, spool_path)
+        
+        return document
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reprocess document: {str(e)}")
+
+
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: str,
@@ -103,25 +219,25 @@ async def delete_document(
     
     try:
         # Get document info
-        doc_response = supabase.table("pdf_documents").select("file_path").eq("id", document_id).execute()
+        file_path = await repository.get_document_path(document_id)
         
-        if not doc_response.data:
+        if not file_path:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        file_path = doc_response.data[0]["file_path"]
-        
         # Delete from storage
         try:
-            supabase.storage.from_("documents").remove([file_path])
+            await asyncio.to_thread(supabase.storage.from_("documents").remove, [file_path])
         except:
             pass  # Continue even if storage deletion fails
         
         # Delete from database (chunks will be deleted via CASCADE)
-        delete_response = supabase.table("pdf_documents").delete().eq("id", document_id).execute()
+        deleted = await repository.delete_document(document_id)
         
-        if not delete_response.data:
+        if not deleted:
             raise HTTPException(status_code=404, detail="Document not found")
         
+        answer_cache.bump_knowledge_revision()
+        await local_vector_index.sync_document(document_id)
         return {"message": "Document deleted successfully"}
     
     except Exception as e:
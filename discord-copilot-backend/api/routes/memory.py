@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from api.middleware.auth import get_current_user
-from db.supabase_client import get_supabase
+from db import repository
+from services.context_assembler import DEFAULT_MEMORY
 from datetime import datetime
 
 router = APIRouter(prefix="/api/memory", tags=["memory"])
@@ -9,6 +10,8 @@ router = APIRouter(prefix="/api/memory", tags=["memory"])
 
 class MemoryResponse(BaseModel):
     id: str
+    guild_id: str = ""
+    channel_id: str = ""
     summary: str
     last_updated: datetime
     message_count: int
@@ -17,27 +20,40 @@ class MemoryResponse(BaseModel):
 class MemoryUpdate(BaseModel):
     summary: str
     message_count: int
+    guild_id: str = ""
+    channel_id: str = ""
 
 
 @router.get("", response_model=MemoryResponse)
-async def get_memory():
+async def get_memory(guild_id: str = "", channel_id: str | None = None):
     """
-    Get current conversation memory (public endpoint for bot access)
+    Get conversation memory (public endpoint for bot access)
+    With channel_id, returns that conversation; otherwise the most recently updated one
     """
-    supabase = get_supabase()
-    
     try:
-        response = supabase.table("conversation_memory").select("*").limit(1).execute()
+        if channel_id is not None:
+            # Create default memory for the conversation if none exists
+            return await repository.ensure_memory(guild_id, channel_id, DEFAULT_MEMORY)
+        
+        memory = await repository.get_latest_memory()
         
-        if not response.data:
+        if not memory:
             # Create default memory if none exists
-            default = supabase.table("conversation_memory").insert({
-                "summary": "No conversation history yet.",
-                "message_count": 0
-            }).execute()
-            return default.data[0]
+            return await repository.ensure_memory("", "", DEFAULT_MEMORY)
         
-        return response.data[0]
+        return memory
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch memory: {str(e)}")
+
+
+@router.get("/list", response_model=list[MemoryResponse])
+async def list_memories():
+    """
+    List memory for every conversation, most recently active first
+    """
+    try:
+        return await repository.list_memories()
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch memory: {str(e)}")
@@ -48,54 +64,39 @@ async def update_memory(update: MemoryUpdate):
     """
     Update conversation memory (used by bot, no auth required)
     """
-    supabase = get_supabase()
-    
     try:
-        # Get existing memory
-        existing = supabase.table("conversation_memory").select("id").limit(1).execute()
+        # Single atomic upsert; message_count is set, not incremented
+        saved = await repository.upsert_memory(
+            update.guild_id,
+            update.channel_id,
+            update.summary,
+            update.message_count,
+            increment=False
+        )
         
-        if existing.data:
-            # Update existing
-            response = supabase.table("conversation_memory").update({
-                "summary": update.summary,
-                "message_count": update.message_count,
-                "last_updated": datetime.utcnow().isoformat()
-            }).eq("id", existing.data[0]["id"]).execute()
-        else:
-            # Insert new
-            response = supabase.table("conversation_memory").insert({
-                "summary": update.summary,
-                "message_count": update.message_count
-            }).execute()
-        
-        if not response.data:
+        if not saved:
             raise HTTPException(status_code=500, detail="Failed to update memory")
         
-        return response.data[0]
+        return saved
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update memory: {str(e)}")
 
 
 @router.delete("")
-async def reset_memory(current_user: dict = Depends(get_current_user)):
+async def reset_memory(
+    guild_id: str = "",
+    channel_id: str | None = None,
+    current_user: dict = Depends(get_current_user)
+):
     """
     Reset conversation memory (requires authentication)
+    With channel_id, resets that conversation only; otherwise every conversation
     """
-    supabase = get_supabase()
-    
     try:
-        # Get existing memory
-        existing = supabase.table("conversation_memory").select("id").limit(1).execute()
+        reset_count = await repository.reset_memory(DEFAULT_MEMORY, guild_id, channel_id)
         
-        if existing.data:
-            # Reset to default
-            response = supabase.table("conversation_memory").update({
-                "summary": "No conversation history yet.",
-                "message_count": 0,
-                "last_updated": datetime.utcnow().isoformat()
-            }).eq("id", existing.data[0]["id"]).execute()
-            
+        if reset_count:
             return {"message": "Memory reset successfully"}
         else:
             raise HTTPException(status_code=404, detail="No memory found to reset")
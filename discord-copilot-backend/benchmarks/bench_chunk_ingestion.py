@@ -0,0 +1,94 @@
+"""
+Chunk ingestion benchmark: Supabase REST batch inserts vs. binary COPY.
+
+Inserts a synthetic corpus of chunks with random 1536-dim embeddings under
+a throwaway pdf_documents row, once per path, and deletes it afterwards.
+Needs the usual .env (SUPABASE_*, DATABASE_URL) pointing at a scratch project.
+
+Run from discord-copilot-backend/:
+    python -m benchmarks.bench_chunk_ingestion --chunks 10000
+"""
+from db import repository
+from db.supabase_client import PostgresPool, get_supabase
+from config import get_settings
+import numpy as np
+import argparse
+import asyncio
+import time
+import uuid
+
+settings = get_settings()
+
+REST_BATCH_SIZE = 50  # What process_pdf_document used before COPY
+
+
+def make_chunks(count: int, seed: int = 7) -> list:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, settings.embedding_dimensions), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [
+        {
+            "text": f"Synthetic benchmark chunk {i}. " + "lorem ipsum dolor sit amet " * 80,
+            "chunk_index": i,
+            "page_number": i // 4 + 1,
+            "embedding": vectors[i]
+        }
+        for i in range(count)
+    ]
+
+
+def insert_via_rest(document_id: str, chunks: list):
+    """The previous path: JSON-serialized embeddings through PostgREST, 50 rows per request"""
+    supabase = get_supabase()
+    rows = [
+        {
+            "document_id": document_id,
+            "chunk_text": chunk["text"],
+            "chunk_index": chunk["chunk_index"],
+            "page_number": chunk["page_number"],
+            "embedding": chunk["embedding"].tolist()
+        }
+        for chunk in chunks
+    ]
+    for i in range(0, len(rows), REST_BATCH_SIZE):
+        supabase.table("document_chunks").insert(rows[i:i + REST_BATCH_SIZE]).execute()
+
+
+async def run(chunk_count: int, skip_rest: bool):
+    chunks = make_chunks(chunk_count)
+    document_id = str(uuid.uuid4())
+    await repository.create_document(document_id, "benchmark.pdf", "benchmark/benchmark.pdf", 0, None, status="benchmark")
+
+    try:
+        results = {}
+
+        if not skip_rest:
+            started = time.perf_counter()
+            await asyncio.to_thread(insert_via_rest, document_id, chunks)
+            results["rest (batches of 50)"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        copied = await repository.copy_chunks(document_id, chunks)  # Replaces the REST rows
+        results["copy (binary, 1 txn)"] = time.perf_counter() - started
+        assert copied == chunk_count
+
+        print(f"{chunk_count} chunks x {settings.embedding_dimensions} dims")
+        for name, elapsed in results.items():
+            print(f"  {name:<22} {elapsed:>8.2f}s  {chunk_count / elapsed:>9.0f} chunks/s")
+
+    finally:
+        await repository.delete_document(document_id)
+        await PostgresPool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--skip-rest", action="store_true", help="Only time the COPY path")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.chunks, args.skip_rest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Chunker microbenchmark and invariant checks.
+
+Times the previous sentence-splitting chunker against services.chunker on
+synthetic pages that mix prose, long unpunctuated runs (tables, code,
+numeric tables) and paragraph breaks, at growing input sizes so non-linear behaviour shows up.
+For every run it also checks the chunker's properties:
+  - no chunk exceeds chunk_size tokens
+  - consecutive chunks share at most overlap tokens (the previous chunk's tail)
+  - every word of the input appears, in order
+  - page numbers never go backwards
+
+Run from discord-copilot-backend/:
+    python -m benchmarks.bench_chunker --pages 50 100 200 400
+"""
+from services.chunker import iter_chunks
+from services.tokenizer import count_tokens
+import argparse
+import random
+import string
+import time
+
+SENTENCES = [
+    "Rule {n} says the bot answers questions about the server.",
+    "Moderators can add channel {n} to the allow-list!",
+    "Is handbook {n} split into chunks and embedded?",
+    "Retrieval for query {n} uses cosine similarity with a keyword index alongside it.",
+]
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 600, overlap: int = 100) -> list:
+    """The previous chunker: '. ' splits, 4 chars per token, list.insert(0) overlap"""
+    chars_per_chunk = chunk_size * 4
+    overlap_chars = overlap * 4
+    sentences = text.replace('\n', ' ').split('. ')
+    chunks = []
+    current_chunk = []
+    current_length = 0
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current_length + len(sentence) > chars_per_chunk and current_chunk:
+            chunks.append('. '.join(current_chunk) + '.')
+            overlap_sentences = []
+            overlap_length = 0
+            for sent in reversed(current_chunk):
+                if overlap_length + len(sent) <= overlap_chars:
+                    overlap_sentences.insert(0, sent)
+                    overlap_length += len(sent)
+                else:
+                    break
+            current_chunk = overlap_sentences
+            current_length = overlap_length
+        current_chunk.append(sentence)
+        current_length += len(sentence)
+    if current_chunk:
+        chunks.append('. '.join(current_chunk) + '.')
+    return chunks
+
+
+def make_pages(page_count: int, seed: int = 3) -> list:
+    """Synthetic pages; every word is unique so overlaps can be located exactly"""
+    rng = random.Random(seed)
+    counter = iter(range(10 ** 9))
+    pages = []
+    for page_number in range(1, page_count + 1):
+        paragraphs = []
+        for _ in range(rng.randint(2, 6)):
+            kind = rng.random()
+            if kind < 0.7:
+                paragraphs.append(" ".join(
+                    rng.choice(SENTENCES).format(n=next(counter))
+                    for _ in range(rng.randint(3, 12))
+                ))
+            elif kind < 0.8:
+                # Table or code: no sentence boundaries at all
+                paragraphs.append("\n".join(
+                    " | ".join(f"cell{next(counter)}" for _ in range(8))
+                    for _ in range(rng.randint(20, 120))
+                ))
+            elif kind < 0.9:
+                # Numeric table: a leading space costs cl100k an extra token per number
+                paragraphs.append("\n".join(
+                    " ".join(f"{next(counter)}.{rng.randint(0, 99):02d}" for _ in range(8))
+                    for _ in range(rng.randint(20, 120))
+                ))
+            else:
+                # Unbroken run (base64, long URLs)
+                paragraphs.append("".join(rng.choices(string.ascii_letters, k=rng.randint(2000, 6000))))
+        pages.append((page_number, "\n\n".join(paragraphs)))
+    return pages
+
+
+def check_invariants(pages: list, chunks: list, chunk_size: int, overlap: int) -> float:
+    """Assert the chunker's properties; returns the fraction of chunk pairs that overlap"""
+    assert chunks, "no chunks produced"
+
+    for chunk in chunks:
+        tokens = count_tokens(chunk["text"])
+        assert tokens <= chunk_size, f"chunk of {tokens} tokens exceeds {chunk_size}"
+
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current["page_number"] >= previous["page_number"], "page numbers went backwards"
+
+    # Rebuild the input from the chunks, skipping each chunk's overlapped prefix
+    # (words are unique, so the longest suffix/prefix match is the overlap)
+    chunk_words = []
+    overlapping = 0
+    for chunk in chunks:
+        words = chunk["text"].split()
+        shared = 0
+        for size in range(min(len(words), len(chunk_words)), 0, -1):
+            if chunk_words[-size:] == words[:size]:
+                shared = size
+                break
+        if shared:
+            overlapping += 1
+            shared_tokens = count_tokens(" ".join(words[:shared]))
+            assert shared_tokens <= overlap, f"overlap of {shared_tokens} tokens exceeds {overlap}"
+        chunk_words.extend(words[shared:])
+
+    source_words = [word for _, text in pages for word in text.split()]
+    # Unbroken runs are cut mid-word, so compare with whitespace removed
+    assert "".join(chunk_words) == "".join(source_words), "chunks do not cover the input in order"
+
+    return overlapping / max(len(chunks) - 1, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 100, 200, 400])
+    parser.add_argument("--chunk-size", type=int, default=600)
+    parser.add_argument("--overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'MB':>6} {'legacy s':>9} {'max tok':>8} {'chunker s':>10} {'max tok':>8} {'chunks':>7} {'overlap':>8} {'us/KB':>7}")
+    for page_count in args.pages:
+        pages = make_pages(page_count)
+        size = sum(len(text) for _, text in pages)
+
+        started = time.perf_counter()
+        legacy = [chunk for _, text in pages for chunk in legacy_chunk_text(text, args.chunk_size, args.overlap)]
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        chunks = list(iter_chunks(pages, args.chunk_size, args.overlap))
+        chunker_time = time.perf_counter() - started
+
+        overlapping = check_invariants(pages, chunks, args.chunk_size, args.overlap)
+
+        print(
+            f"{page_count:>6} {size / 1e6:>6.2f} "
+            f"{legacy_time:>9.3f} {max(count_tokens(c) for c in legacy):>8} "
+            f"{chunker_time:>10.3f} {max(count_tokens(c['text']) for c in chunks):>8} "
+            f"{len(chunks):>7} {overlapping:>7.0%} {chunker_time * 1e6 / (size / 1024):>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+PDF extraction throughput benchmark.
+
+Compares the old single-pass, in-process extraction with the process-pool
+page-range extraction on synthetic multi-hundred-page PDFs.
+
+Run from discord-copilot-backend/:
+    python -m benchmarks.bench_pdf_extraction --pages 300 --workers 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.synthetic_pdf import make_pdf
+from services.pdf_extraction import extract_page_range, extract_pages, count_pages
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+
+def extract_serial(pdf: bytes):
+    """Baseline: every page in the calling process"""
+    return extract_page_range(pdf, 0, count_pages(pdf))
+
+
+async def extract_parallel(pdf: bytes, workers: int, pages_per_task: int):
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Warm the pool so worker start-up isn't billed to the first document
+        await asyncio.gather(*(
+            asyncio.get_running_loop().run_in_executor(executor, count_pages, pdf)
+            for _ in range(workers)
+        ))
+
+        started = time.perf_counter()
+        pages = await extract_pages(pdf, executor, pages_per_task)
+        return pages, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 600])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-task", type=int, default=25)
+    parser.add_argument("--blank-every", type=int, default=20, help="Every Nth page is blank (0 disables)")
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'MB':>6} {'serial s':>9} {'pages/s':>8} {'pool s':>8} {'pages/s':>8} {'speedup':>8}")
+    for page_count in args.pages:
+        pdf = make_pdf(page_count, blank_every=args.blank_every)
+
+        started = time.perf_counter()
+        serial_pages = extract_serial(pdf)
+        serial_time = time.perf_counter() - started
+
+        parallel_pages, parallel_time = asyncio.run(
+            extract_parallel(pdf, args.workers, args.pages_per_task)
+        )
+        assert parallel_pages == serial_pages, "parallel extraction diverged from serial"
+
+        print(
+            f"{page_count:>6} {len(pdf) / 1e6:>6.2f} "
+            f"{serial_time:>9.2f} {page_count / serial_time:>8.0f} "
+            f"{parallel_time:>8.2f} {page_count / parallel_time:>8.0f} "
+            f"{serial_time / parallel_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Vector search recall and latency benchmark.
+
+Samples query vectors from the stored corpus (perturbed with noise so they
+are not exact matches), computes the exact top-k with a sequential scan,
+then measures recall@k and latency of the approximate index across a sweep
+of ef_search (HNSW) / probes (IVFFlat) values.
+
+Run from discord-copilot-backend/:
+    python -m benchmarks.bench_vector_recall --queries 200 -k 5 --sweep 10 20 40 80 160
+"""
+from db.supabase_client import PostgresPool, get_db_pool
+from db.repository import set_vector_search_params
+from db.vector_index import get_status
+import numpy as np
+import argparse
+import asyncio
+import time
+
+TOP_K_SQL = """
+    SELECT id FROM document_chunks
+    ORDER BY embedding <=> $1
+    LIMIT $2
+"""
+
+
+async def exact_top_k(conn, query, k: int) -> list:
+    async with conn.transaction():
+        # Disable index scans so the planner does an exact sequential scan
+        await conn.execute("SET LOCAL enable_indexscan = off")
+        rows = await conn.fetch(TOP_K_SQL, query, k)
+    return [row["id"] for row in rows]
+
+
+async def approx_top_k(conn, query, k: int, setting: int) -> tuple:
+    async with conn.transaction():
+        await set_vector_search_params(conn, ef_search=setting, probes=setting)
+        started = time.perf_counter()
+        rows = await conn.fetch(TOP_K_SQL, query, k)
+        elapsed = time.perf_counter() - started
+    return [row["id"] for row in rows], elapsed
+
+
+async def run(query_count: int, k: int, sweep: list, noise: float):
+    pool = await get_db_pool()
+    status = await get_status()
+    index = status["index"] or {}
+    print(f"corpus: {status['row_count']} chunks, index: {index.get('method')} {index.get('lists', '')}")
+
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT embedding FROM document_chunks TABLESAMPLE SYSTEM (10) LIMIT $1",
+            query_count
+        )
+        if not rows:
+            print("No chunks to sample; upload some documents first.")
+            return
+
+        rng = np.random.default_rng(11)
+        queries = []
+        for row in rows:
+            vector = np.asarray(row["embedding"], dtype=np.float32)
+            vector = vector + rng.normal(0, noise, vector.shape).astype(np.float32)
+            queries.append(vector / np.linalg.norm(vector))
+
+        truth = []
+        exact_times = []
+        for query in queries:
+            started = time.perf_counter()
+            truth.append(set(await exact_top_k(conn, query, k)))
+            exact_times.append(time.perf_counter() - started)
+
+        print(f"exact scan: p50 {np.percentile(exact_times, 50) * 1000:.1f}ms  p95 {np.percentile(exact_times, 95) * 1000:.1f}ms")
+        print(f"{'ef_search/probes':>16} {f'recall@{k}':>10} {'p50 ms':>8} {'p95 ms':>8}")
+
+        for setting in sweep:
+            recalls = []
+            latencies = []
+            for query, expected in zip(queries, truth):
+                found, elapsed = await approx_top_k(conn, query, k, setting)
+                recalls.append(len(expected & set(found)) / max(len(expected), 1))
+                latencies.append(elapsed)
+
+            print(
+                f"{setting:>16} {np.mean(recalls):>10.3f} "
+                f"{np.percentile(latencies, 50) * 1000:>8.2f} {np.percentile(latencies, 95) * 1000:>8.2f}"
+            )
+
+
+async def _main(args):
+    try:
+        await run(args.queries, args.k, args.sweep, args.noise)
+    finally:
+        await PostgresPool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--sweep", type=int, nargs="+", default=[10, 20, 40, 80, 160])
+    parser.add_argument("--noise", type=float, default=0.02, help="Std-dev of noise added to sampled vectors")
+    args = parser.parse_args()
+
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
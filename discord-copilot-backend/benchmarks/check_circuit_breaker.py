@@ -0,0 +1,135 @@
+"""
+Circuit breaker checks for services.openrouter.
+
+Drives OpenRouterTransport over an httpx.MockTransport (no network) through
+its state machine:
+  - consecutive 5xx responses open the circuit, which then fails fast
+  - after reset_seconds one half-open probe goes through; success closes it
+  - a failed probe reopens the circuit
+  - a cancelled probe (e.g. a hedge loser) frees the slot instead of
+    leaving the circuit half-open forever
+
+Run from discord-copilot-backend/:
+    python -m benchmarks.check_circuit_breaker
+"""
+from services.openrouter import CircuitBreaker, OpenRouterTransport
+import asyncio
+import httpx
+import time
+
+FAILURES = 3
+RESET_SECONDS = 0.05
+
+
+class Upstream:
+    """Mock upstream: answers with status, or hangs until cancelled when hang is set"""
+
+    def __init__(self):
+        self.status = 200
+        self.hang = False
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.hang:
+            await asyncio.Event().wait()
+        return httpx.Response(self.status, json={})
+
+
+def make_transport(upstream: Upstream) -> OpenRouterTransport:
+    transport = OpenRouterTransport(CircuitBreaker(FAILURES, RESET_SECONDS))
+    transport._transport = httpx.MockTransport(upstream)
+    return transport
+
+
+async def send(transport: OpenRouterTransport) -> int:
+    response = await transport.handle_async_request(httpx.Request("POST", "https://openrouter.test/chat/completions"))
+    return response.status_code
+
+
+async def open_circuit(transport: OpenRouterTransport, upstream: Upstream):
+    upstream.status = 500
+    for _ in range(FAILURES):
+        await send(transport)
+    assert transport.breaker.state == CircuitBreaker.OPEN, transport.breaker.state
+
+
+async def wait_for_reset():
+    await asyncio.sleep(RESET_SECONDS * 1.5)
+
+
+async def check_opens_and_fails_fast():
+    upstream = Upstream()
+    transport = make_transport(upstream)
+    await open_circuit(transport, upstream)
+
+    calls = upstream.calls
+    assert await send(transport) == 503
+    assert upstream.calls == calls, "an open circuit must not reach the upstream"
+
+
+async def check_probe_closes():
+    upstream = Upstream()
+    transport = make_transport(upstream)
+    await open_circuit(transport, upstream)
+    await wait_for_reset()
+
+    upstream.status = 200
+    assert await send(transport) == 200
+    assert transport.breaker.state == CircuitBreaker.CLOSED, transport.breaker.state
+
+
+async def check_failed_probe_reopens():
+    upstream = Upstream()
+    transport = make_transport(upstream)
+    await open_circuit(transport, upstream)
+    await wait_for_reset()
+
+    assert await send(transport) == 500
+    assert transport.breaker.state == CircuitBreaker.OPEN, transport.breaker.state
+
+
+async def check_cancelled_probe_is_released():
+    upstream = Upstream()
+    transport = make_transport(upstream)
+    await open_circuit(transport, upstream)
+    await wait_for_reset()
+
+    # The probe hangs and is cancelled, as a hedge loser would be
+    upstream.hang = True
+    probe = asyncio.create_task(send(transport))
+    await asyncio.sleep(0.01)
+    assert transport.breaker.state == CircuitBreaker.HALF_OPEN, transport.breaker.state
+    probe.cancel()
+    try:
+        await probe
+    except asyncio.CancelledError:
+        pass
+
+    # The next call must be allowed through as the new probe and close the circuit
+    upstream.hang = False
+    upstream.status = 200
+    calls = upstream.calls
+    assert await send(transport) == 200, "a cancelled probe left the circuit stuck half-open"
+    assert upstream.calls == calls + 1
+    assert transport.breaker.state == CircuitBreaker.CLOSED, transport.breaker.state
+
+
+async def run():
+    for check in (
+        check_opens_and_fails_fast,
+        check_probe_closes,
+        check_failed_probe_reopens,
+        check_cancelled_probe_is_released
+    ):
+        started = time.perf_counter()
+        await check()
+        print(f"{check.__name__:<36} ok ({(time.perf_counter() - started) * 1000:.0f} ms)")
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Fake OpenRouter (OpenAI-compatible) server for load tests.
+
+Serves /chat/completions (plain JSON and SSE streaming) and /embeddings with
+configurable latency, so the real client stack (shared transport, circuit
+breaker, scheduler, model routing, hedging) can be exercised without
+spending provider credits.
+
+Embeddings are deterministic bag-of-words vectors: each word maps to a fixed
+random unit vector and a text embeds to their normalized sum. Texts that
+share words are therefore similar, which keeps retrieval and the semantic
+answer cache meaningful.
+
+Used in-process (on its own thread and event loop) by benchmarks.load_test,
+or standalone on its own core:
+    python -m benchmarks.fake_openrouter --port 8100 --first-token-ms 400
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from functools import lru_cache
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_embedding(text: str, dimensions: int) -> np.ndarray:
+    """Deterministic unit vector; texts sharing words point the same way"""
+    words = WORD.findall(text.lower())
+    if not words:
+        words = ["empty"]
+    vector = np.sum([_word_vector(word, dimensions) for word in words], axis=0)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenRouter:
+    """
+    Latency model: chat responses take first_token_ms (per-model override in
+    model_first_token_ms) and then token_ms per streamed token; embeddings
+    take embedding_ms plus embedding_item_ms per input. Every delay is
+    multiplied by a random factor in [1 - jitter, 1 + jitter], and
+    error_rate of requests fail with a 500.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = 1536,
+        first_token_ms: float = 300.0,
+        token_ms: float = 15.0,
+        response_tokens: int = 60,
+        embedding_ms: float = 40.0,
+        embedding_item_ms: float = 0.2,
+        jitter: float = 0.3,
+        error_rate: float = 0.0,
+        model_first_token_ms: Optional[Dict[str, float]] = None
+    ):
+        self.dimensions = dimensions
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.response_tokens = response_tokens
+        self.embedding_ms = embedding_ms
+        self.embedding_item_ms = embedding_item_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.model_first_token_ms = model_first_token_ms or {}
+
+        self.chat_requests = 0
+        self.embedding_requests = 0
+        self.embedded_texts = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self.app = FastAPI()
+        self.app.post("/chat/completions")(self.chat_completions)
+        self.app.post("/embeddings")(self.embeddings)
+
+    async def _sleep(self, ms: float):
+        if ms > 0:
+            await asyncio.sleep(ms / 1000 * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _fail(self) -> Optional[JSONResponse]:
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return JSONResponse({"error": {"message": "fake upstream error"}}, status_code=500)
+        return None
+
+    def _answer_tokens(self, model: str) -> List[str]:
+        return [f"token{i} " for i in range(self.response_tokens - 1)] + [f"({model})"]
+
+    def _track(self, delta: int):
+        self.in_flight += delta
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        self.chat_requests += 1
+
+        failure = self._fail()
+        if failure is not None:
+            return failure
+
+        first_token_ms = self.model_first_token_ms.get(model, self.first_token_ms)
+        tokens = self._answer_tokens(model)
+        if body.get("max_tokens"):
+            tokens = tokens[:body["max_tokens"]]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            self._track(1)
+            try:
+                await self._sleep(first_token_ms + self.token_ms * len(tokens))
+            finally:
+                self._track(-1)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+            }
+
+        async def events():
+            self._track(1)
+            try:
+                await self._sleep(first_token_ms)
+                for i, token in enumerate(tokens):
+                    if i:
+                        await self._sleep(self.token_ms)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                self._track(-1)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(self, request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self.embedding_requests += 1
+        self.embedded_texts += len(texts)
+
+        failure = self._fail()
+        if failure is not None:
+            return failure
+
+        self._track(1)
+        try:
+            await self._sleep(self.embedding_ms + self.embedding_item_ms * len(texts))
+        finally:
+            self._track(-1)
+
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(text, self.dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+        }
+
+    def stats(self) -> dict:
+        return {
+            "chat_requests": self.chat_requests,
+            "embedding_requests": self.embedding_requests,
+            "embedded_texts": self.embedded_texts,
+            "errors": self.errors,
+            "max_in_flight": self.max_in_flight
+        }
+
+
+async def serve(fake: FakeOpenRouter, host: str = "127.0.0.1", port: int = 0):
+    """Start the fake server in this event loop; returns (uvicorn server, task, base URL)"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(fake.app, host=host, port=port, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()  # Surface bind errors
+        await asyncio.sleep(0.01)
+
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://{host}:{port}"
+
+
+def serve_in_thread(fake: FakeOpenRouter, host: str = "127.0.0.1") -> Tuple[str, Callable[[], None]]:
+    """Start the fake server on its own thread and event loop, keeping its work off the caller's loop; returns (base URL, stop)"""
+    started: Future = Future()
+
+    async def run():
+        try:
+            server, task, url = await serve(fake, host)
+        except BaseException as e:
+            started.set_exception(e)
+            raise
+        started.set_result((server, url))
+        await task
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),), name="fake-openrouter", daemon=True)
+    thread.start()
+    server, url = started.result(timeout=30)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+
+    return url, stop
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser):
+    """Latency options shared by this server and the load test"""
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--embedding-ms", type=float, default=40.0)
+    parser.add_argument("--jitter", type=float, default=0.3, help="Random +/- fraction applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--model-first-token-ms", nargs="*", default=[], metavar="MODEL=MS",
+        help="Per-model first-token latency, e.g. slow/model=3000 (to exercise hedging)"
+    )
+
+
+def from_arguments(args: argparse.Namespace, dimensions: int) -> FakeOpenRouter:
+    return FakeOpenRouter(
+        dimensions=dimensions,
+        first_token_ms=args.first_token_ms,
+        token_ms=args.token_ms,
+        response_tokens=args.response_tokens,
+        embedding_ms=args.embedding_ms,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        model_first_token_ms={
+            model: float(ms) for model, ms in (item.rsplit("=", 1) for item in args.model_first_token_ms)
+        }
+    )
+
+
+async def run(args: argparse.Namespace):
+    fake = from_arguments(args, args.dimensions)
+    server, task, url = await serve(fake, args.host, args.port)
+    print(f"Fake OpenRouter listening on {url} (set OPENROUTER_BASE_URL={url})")
+    try:
+        await task
+    finally:
+        print(fake.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    add_latency_arguments(parser)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+In-memory stand-in for the Supabase tables used on the bot's hot path.
+
+Covers the allow-list, system instructions, conversation memory, the query
+embedding cache and the search RPCs (search_documents, lexical and hybrid
+search, with the same filters and similarity floor as the SQL functions).
+install() swaps these functions into db.repository, so the real services
+call them unchanged. Every call sleeps db_latency_ms to stand in for the
+round trip.
+"""
+from benchmarks.fake_openrouter import fake_embedding
+from db import repository
+from services.rag_service import fuse_rankings
+from config import get_settings
+from typing import Dict, List, Optional
+import numpy as np
+import asyncio
+import random
+import time
+import uuid
+
+settings = get_settings()
+
+# Words of each synthetic topic; chunks and questions are built from them
+TOPIC_WORDS = ["rule", "channel", "moderator", "handbook", "role", "ban", "event", "schedule"]
+FILLER = ["the", "server", "members", "should", "always", "check", "before", "posting"]
+
+
+def topic_words(topic: int) -> List[str]:
+    return [f"{word}{topic}" for word in TOPIC_WORDS]
+
+
+class InMemoryStore:
+    def __init__(self, dimensions: int, db_latency_ms: float = 2.0):
+        self.dimensions = dimensions
+        self.db_latency_ms = db_latency_ms
+
+        self.channels: Dict[str, Optional[str]] = {}
+        self.instructions = "You are a helpful Discord assistant. Answer from the knowledge provided."
+        self.memories: Dict[tuple, dict] = {}
+        self.query_embeddings: Dict[str, List[float]] = {}
+
+        self.chunks: List[dict] = []
+        self._matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self._positions: Dict[uuid.UUID, int] = {}
+        self.calls: Dict[str, int] = {}
+
+    def seed(self, channel_ids: List[str], topics: int, chunks_per_topic: int, seed: int = 11):
+        """Allow the channels and load chunks_per_topic chunks for each topic"""
+        rng = random.Random(seed)
+        self.channels = {channel_id: None for channel_id in channel_ids}
+
+        vectors = []
+        for topic in range(topics):
+            words = topic_words(topic)
+            document_id = str(uuid.uuid4())
+            for page in range(chunks_per_topic):
+                text = " ".join(rng.choice(words + FILLER) for _ in range(120))
+                self.chunks.append({
+                    "id": uuid.uuid4(),
+                    "document_id": document_id,
+                    "chunk_text": text,
+                    "page_number": page + 1,
+                    "filename": f"handbook-{topic}.pdf",
+                    "collection": repository.DEFAULT_COLLECTION,
+                    "tokens": set(text.split())
+                })
+                vectors.append(fake_embedding(text, self.dimensions))
+
+        self._matrix = np.stack(vectors) if vectors else self._matrix
+        self._positions = {chunk["id"]: i for i, chunk in enumerate(self.chunks)}
+
+    async def _round_trip(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.db_latency_ms:
+            await asyncio.sleep(self.db_latency_ms / 1000)
+
+    # ------------------------------------------------------------------
+    # Config, memory and query embedding cache
+    # ------------------------------------------------------------------
+
+    async def get_channel_collections(self) -> Dict[str, Optional[str]]:
+        await self._round_trip("get_channel_collections")
+        return dict(self.channels)
+
+    async def is_channel_allowed(self, channel_id: str) -> bool:
+        await self._round_trip("is_channel_allowed")
+        return channel_id in self.channels
+
+    async def get_latest_instructions(self) -> Optional[dict]:
+        await self._round_trip("get_latest_instructions")
+        return {"instructions": self.instructions}
+
+    async def get_memory(self, guild_id: str, channel_id: str) -> Optional[dict]:
+        await self._round_trip("get_memory")
+        memory = self.memories.get((guild_id, channel_id))
+        return dict(memory) if memory else None
+
+    async def upsert_memory(self, guild_id: str, channel_id: str, summary: str, message_count: int = 1, increment: bool = True) -> dict:
+        await self._round_trip("upsert_memory")
+        memory = self.memories.setdefault((guild_id, channel_id), {"guild_id": guild_id, "channel_id": channel_id, "message_count": 0})
+        memory["summary"] = summary
+        memory["message_count"] = memory["message_count"] + message_count if increment else message_count
+        memory["last_updated"] = time.time()
+        return dict(memory)
+
+    async def get_cached_query_embedding(self, cache_key: str, ttl_seconds: int) -> Optional[List[float]]:
+        await self._round_trip("get_cached_query_embedding")
+        return self.query_embeddings.get(cache_key)
+
+    async def put_cached_query_embedding(self, cache_key: str, model: str, embedding: List[float]):
+        await self._round_trip("put_cached_query_embedding")
+        self.query_embeddings[cache_key] = embedding
+
+    async def purge_query_embedding_cache(self, ttl_seconds: int) -> int:
+        await self._round_trip("purge_query_embedding_cache")
+        return 0
+
+    # ------------------------------------------------------------------
+    # Search RPCs
+    # ------------------------------------------------------------------
+
+    def _candidates(self, collection: Optional[str], document_ids: Optional[List[str]]) -> np.ndarray:
+        return np.array([
+            i for i, chunk in enumerate(self.chunks)
+            if (collection is None or chunk["collection"] == collection)
+            and (not document_ids or chunk["document_id"] in document_ids)
+        ], dtype=np.int64)
+
+    @staticmethod
+    def _row(chunk: dict, **extra) -> dict:
+        return {
+            "id": chunk["id"],
+            "chunk_text": chunk["chunk_text"],
+            "page_number": chunk["page_number"],
+            "filename": chunk["filename"],
+            **extra
+        }
+
+    def _vector_rows(self, query_embedding, match_count, min_similarity, collection, document_ids) -> List[dict]:
+        candidates = self._candidates(collection, document_ids)
+        if not len(candidates):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self._matrix[candidates] @ (query / np.linalg.norm(query))
+        order = np.argsort(-similarities)[:match_count]
+        return [
+            self._row(self.chunks[candidates[i]], similarity=float(similarities[i]))
+            for i in order
+            if min_similarity is None or similarities[i] >= min_similarity
+        ]
+
+    def _lexical_rows(self, query_text, match_count, collection, document_ids) -> List[dict]:
+        terms = set(query_text.lower().split())
+        scored = []
+        for i in self._candidates(collection, document_ids):
+            overlap = len(terms & self.chunks[i]["tokens"])
+            if overlap:
+                scored.append((overlap, i))
+        scored.sort(reverse=True)
+        return [self._row(self.chunks[i]) for _, i in scored[:match_count]]
+
+    async def search_documents(
+        self,
+        query_embedding: List[float],
+        match_count: int,
+        min_similarity: Optional[float] = None,
+        collection: Optional[str] = None,
+        document_ids: Optional[List[str]] = None
+    ) -> List[dict]:
+        await self._round_trip("search_documents")
+        return self._vector_rows(query_embedding, match_count, min_similarity, collection, document_ids)
+
+    async def lexical_search_documents(
+        self,
+        query_text: str,
+        match_count: int,
+        collection: Optional[str] = None,
+        document_ids: Optional[List[str]] = None
+    ) -> List[dict]:
+        await self._round_trip("lexical_search_documents")
+        return self._lexical_rows(query_text, match_count, collection, document_ids)
+
+    async def hybrid_search_documents(
+        self,
+        query_text: str,
+        query_embedding: List[float],
+        match_count: int,
+        min_similarity: Optional[float] = None,
+        collection: Optional[str] = None,
+        document_ids: Optional[List[str]] = None
+    ) -> List[dict]:
+        await self._round_trip("hybrid_search_documents")
+        candidate_count = settings.hybrid_candidate_count
+        rows = fuse_rankings(
+            self._vector_rows(query_embedding, candidate_count, min_similarity, collection, document_ids),
+            self._lexical_rows(query_text, candidate_count, collection, document_ids),
+            settings.hybrid_rrf_k,
+            match_count
+        )
+        # Like the SQL function, every fused row carries its cosine similarity
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query)
+        for row in rows:
+            if row["similarity"] is None:
+                row["similarity"] = float(self._matrix[self._positions[row["id"]]] @ query)
+        return rows
+
+    def install(self):
+        """Route db.repository's hot-path functions to this store"""
+        for name in (
+            "get_channel_collections", "is_channel_allowed", "get_latest_instructions",
+            "get_memory", "upsert_memory",
+            "get_cached_query_embedding", "put_cached_query_embedding", "purge_query_embedding_cache",
+            "search_documents", "lexical_search_documents", "hybrid_search_documents"
+        ):
+            setattr(repository, name, getattr(self, name))
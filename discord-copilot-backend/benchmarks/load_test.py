@@ -0,0 +1,389 @@
+"""
+End-to-end load test of the bot's message path, with no provider or database.
+
+Starts the fake OpenRouter server (benchmarks.fake_openrouter) and points the
+shared OpenRouter client at it, routes db.repository's hot path to an
+in-memory store (benchmarks.fake_store), then fires bursts of fake Discord
+mentions through the real DiscordBot.on_message. Everything between the
+message and the reply is the production code: single-flight, answer cache,
+context assembly, prompt budgets, scheduler, model routing and hedging,
+streaming edits and memory summaries.
+
+Reported per run:
+  - throughput (messages completed per second)
+  - p50/p95/p99 latency to the first reply and to the complete answer
+  - reply outcomes, provider request counts and the bot's cache/queue stats
+  - event loop lag: how late a 10ms heartbeat wakes up, i.e. how long the
+    loop was busy; the run fails if any beat lags more than
+    --max-loop-lag-ms (the fake server runs on its own thread and loop, so
+    only the bot's work and the fake Discord/database calls count)
+
+With --target api the same bursts go through POST /api/bot/query instead
+(context assembly only, no generation).
+
+Run from discord-copilot-backend/ (no .env needed):
+    python -m benchmarks.load_test --bursts 10 --burst-size 50 --interval 1.0
+    python -m benchmarks.load_test --reply-models fast/model,slow/model --model-first-token-ms slow/model=4000
+"""
+import os
+
+# The settings object requires these; nothing here connects to them
+for _name, _value in {
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_SERVICE_ROLE_KEY": "load-test",
+    "SUPABASE_ANON_KEY": "load-test",
+    "DATABASE_URL": "postgresql://load-test@localhost/unused",
+    "DISCORD_BOT_TOKEN": "load-test",
+    "OPENROUTER_API_KEY": "load-test",
+    "LLM_PROVIDER": "fake/model",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from benchmarks.fake_openrouter import add_latency_arguments, from_arguments, serve_in_thread
+from benchmarks.fake_store import InMemoryStore, topic_words
+from config import get_settings
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import argparse
+import asyncio
+import json
+import random
+import time
+
+settings = get_settings()
+
+
+# ---------------------------------------------------------------------------
+# Fake Discord objects (just what on_message touches)
+# ---------------------------------------------------------------------------
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class FakeSentMessage:
+    def __init__(self, channel: "FakeChannel", content: str):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content: str):
+        await self.channel.api_call()
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, api_ms: float):
+        self.id = channel_id
+        self.api_ms = api_ms
+
+    async def api_call(self):
+        if self.api_ms:
+            await asyncio.sleep(self.api_ms / 1000)
+
+    @asynccontextmanager
+    async def typing(self):
+        yield
+
+    async def send(self, content: str) -> FakeSentMessage:
+        await self.api_call()
+        return FakeSentMessage(self, content)
+
+
+class FakeMessage:
+    """A mention of the bot; records when the first reply went out"""
+
+    def __init__(self, message_id: int, content: str, author: FakeUser, bot_user: FakeUser, channel: FakeChannel, guild: FakeGuild):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.mentions = [bot_user]
+        self.channel = channel
+        self.guild = guild
+        self.first_reply_at: Optional[float] = None
+        self.replies: List[FakeSentMessage] = []
+
+    async def reply(self, content: str) -> FakeSentMessage:
+        await self.channel.api_call()
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+        sent = FakeSentMessage(self.channel, content)
+        self.replies.append(sent)
+        return sent
+
+
+# ---------------------------------------------------------------------------
+# Workload
+# ---------------------------------------------------------------------------
+
+def make_questions(count: int, topics: int, seed: int = 5) -> List[str]:
+    """Distinct questions, each six words of one topic (so retrieval finds that topic)"""
+    rng = random.Random(seed)
+    questions = set()
+    while len(questions) < count:
+        topic = rng.randrange(topics)
+        questions.add(" ".join(rng.sample(topic_words(topic), 6)) + "?")
+    return sorted(questions)
+
+
+class LoopLagProbe:
+    """
+    Heartbeat on the event loop: each beat records how late it woke, i.e.
+    how long the loop was busy with other work. A synchronous call on the
+    loop (a download, a numpy rebuild) shows up as a spike in every reply.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - due))
+
+    def start(self):
+        self._task = asyncio.create_task(self._beat())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def outcome(message: FakeMessage) -> str:
+    from bot.discord_bot import NOT_ALLOWED_RESPONSE
+    from bot.llm_client import BUSY_RESPONSE, FALLBACK_RESPONSE
+
+    if not message.replies:
+        return "no_reply"
+    first = message.replies[0].content
+    if first == BUSY_RESPONSE:
+        return "busy"
+    if first == FALLBACK_RESPONSE:
+        return "fallback"
+    if first == NOT_ALLOWED_RESPONSE:
+        return "not_allowed"
+    if first.startswith("❌"):
+        return "error"
+    return "answered"
+
+
+async def drive_bot(args, questions: List[str], channels: List[FakeChannel], guilds: List[FakeGuild]) -> tuple:
+    """Send the bursts through on_message; returns (first reply latencies, total latencies, outcomes, elapsed)"""
+    from bot.discord_bot import bot
+
+    bot_user = FakeUser(10_000, "copilot")
+    bot._connection.user = bot_user
+    users = [FakeUser(20_000 + i, f"user{i}") for i in range(args.users)]
+    rng = random.Random(args.seed)
+
+    first_reply, total, outcomes = [], [], {}
+    message_ids = iter(range(1, 10 ** 9))
+
+    async def one(message: FakeMessage):
+        started = time.perf_counter()
+        await bot.on_message(message)
+        finished = time.perf_counter()
+        total.append(finished - started)
+        first_reply.append((message.first_reply_at or finished) - started)
+        result = outcome(message)
+        outcomes[result] = outcomes.get(result, 0) + 1
+
+    tasks = []
+    started = time.perf_counter()
+    for burst in range(args.bursts):
+        for _ in range(args.burst_size):
+            channel = rng.choice(channels)
+            message = FakeMessage(
+                next(message_ids),
+                f"<@{bot_user.id}> {rng.choice(questions)}",
+                rng.choice(users),
+                bot_user,
+                channel,
+                guilds[channel.id % len(guilds)]
+            )
+            tasks.append(asyncio.create_task(one(message)))
+        if burst < args.bursts - 1:
+            await asyncio.sleep(args.interval)
+    await asyncio.gather(*tasks)
+    return first_reply, total, outcomes, time.perf_counter() - started
+
+
+async def drive_api(args, questions: List[str], channels: List[FakeChannel], guilds: List[FakeGuild]) -> tuple:
+    """Send the bursts through POST /api/bot/query (context assembly only)"""
+    from main import app
+    import httpx
+
+    rng = random.Random(args.seed)
+    latencies, outcomes = [], {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-test") as client:
+        async def one(payload: dict):
+            started = time.perf_counter()
+            response = await client.post("/api/bot/query", json=payload)
+            latencies.append(time.perf_counter() - started)
+            key = str(response.status_code)
+            outcomes[key] = outcomes.get(key, 0) + 1
+
+        tasks = []
+        started = time.perf_counter()
+        for burst in range(args.bursts):
+            for _ in range(args.burst_size):
+                channel = rng.choice(channels)
+                tasks.append(asyncio.create_task(one({
+                    "query": rng.choice(questions),
+                    "channel_id": str(channel.id),
+                    "guild_id": str(guilds[channel.id % len(guilds)].id)
+                })))
+            if burst < args.bursts - 1:
+                await asyncio.sleep(args.interval)
+        await asyncio.gather(*tasks)
+
+    return latencies, latencies, outcomes, time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# Run
+# ---------------------------------------------------------------------------
+
+async def run(args):
+    fake = from_arguments(args, settings.embedding_dimensions)
+    stop_server = None
+    if args.openrouter_url:
+        settings.openrouter_base_url = args.openrouter_url
+    else:
+        settings.openrouter_base_url, stop_server = serve_in_thread(fake)
+
+    store = InMemoryStore(settings.embedding_dimensions, db_latency_ms=args.db_ms)
+    channel_ids = [100 + i for i in range(args.channels)]
+    store.seed([str(channel_id) for channel_id in channel_ids[:args.channels - args.disallowed_channels]], args.topics, args.chunks_per_topic)
+    store.install()
+
+    # Imported after the store is installed and settings are final
+    from services.openrouter import OpenRouterClient
+    from services.model_router import model_router, REPLY
+    from services.llm_scheduler import llm_scheduler
+    from services.answer_cache import answer_cache
+    from services.embedding_cache import embedding_cache
+    from bot.memory_summarizer import memory_summarizer
+    from bot.discord_bot import bot
+
+    if args.reply_models:
+        model_router.models[REPLY] = args.reply_models.split(",")
+    settings.llm_streaming = not args.no_streaming
+    settings.discord_stream_edit_interval = args.edit_interval
+    settings.answer_cache_enabled = not args.no_answer_cache
+
+    OpenRouterClient.open()
+    memory_summarizer.start()
+
+    channels = [FakeChannel(channel_id, args.discord_ms) for channel_id in channel_ids]
+    guilds = [FakeGuild(900 + i) for i in range(args.guilds)]
+    questions = make_questions(args.distinct_questions, args.topics)
+
+    drive = drive_api if args.target == "api" else drive_bot
+    print(
+        f"target={args.target} bursts={args.bursts}x{args.burst_size} every {args.interval}s, "
+        f"{args.channels} channels / {args.guilds} guilds, {len(questions)} distinct questions, "
+        f"first token {args.first_token_ms}ms, embedding {args.embedding_ms}ms, db {args.db_ms}ms"
+    )
+    # One message first, so lazy imports and first connections don't count as loop lag
+    await drive(argparse.Namespace(**{**vars(args), "bursts": 1, "burst_size": 1}), questions, channels, guilds)
+    answer_cache.clear()
+
+    probe = LoopLagProbe()
+    probe.start()
+    first_reply, total, outcomes, elapsed = await drive(args, questions, channels, guilds)
+    await probe.stop()
+
+    completed = len(total)
+    print(f"\n{completed} messages in {elapsed:.2f}s: {completed / elapsed:.1f} msg/s")
+    print(f"{'latency (ms)':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, samples in (("first reply", first_reply), ("complete", total), ("loop lag", probe.lags)):
+        print(
+            f"{name:<16} {percentile(samples, 0.50) * 1000:>8.0f} {percentile(samples, 0.95) * 1000:>8.0f} "
+            f"{percentile(samples, 0.99) * 1000:>8.0f} {max(samples, default=0.0) * 1000:>8.0f}"
+        )
+    print(f"outcomes: {json.dumps(outcomes, sort_keys=True)}")
+
+    await memory_summarizer.stop()
+    print(f"fake openrouter: {json.dumps(fake.stats()) if stop_server is not None else 'external'}")
+    if args.verbose:
+        print(json.dumps({
+            "in_flight": bot.in_flight.stats(),
+            "embedding_cache": embedding_cache.stats(),
+            "answer_cache": answer_cache.stats(),
+            "memory_summarizer": memory_summarizer.stats(),
+            "llm_scheduler": llm_scheduler.stats(),
+            "models": model_router.stats(),
+            "openrouter": OpenRouterClient.stats(),
+            "store_calls": store.calls
+        }, indent=2, default=str))
+
+    await OpenRouterClient.close()
+    if stop_server is not None:
+        await asyncio.to_thread(stop_server)
+
+    # A burst's handlers all start in one tick, so single beats normally lag
+    # tens of ms at burst arrivals; a blocking call on the reply path adds up
+    # across the burst and shows as hundreds
+    worst = max(probe.lags, default=0.0) * 1000
+    if worst > args.max_loop_lag_ms:
+        raise SystemExit(f"FAIL: event loop lagged {worst:.1f}ms (limit {args.max_loop_lag_ms:.0f}ms)")
+    print(
+        f"event loop lag p50 {percentile(probe.lags, 0.50) * 1000:.1f}ms, p95 {percentile(probe.lags, 0.95) * 1000:.1f}ms, "
+        f"max {worst:.1f}ms (limit {args.max_loop_lag_ms:.0f}ms)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["bot", "api"], default="bot")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=40, help="Messages sent at once per burst")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between bursts")
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--disallowed-channels", type=int, default=0, help="Channels left off the allow-list")
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--distinct-questions", type=int, default=60, help="Fewer means more duplicates (coalescing, caches)")
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--chunks-per-topic", type=int, default=50)
+    parser.add_argument("--db-ms", type=float, default=2.0, help="Simulated database round trip")
+    parser.add_argument("--discord-ms", type=float, default=50.0, help="Simulated Discord API call (reply, send, edit)")
+    parser.add_argument("--edit-interval", type=float, default=settings.discord_stream_edit_interval)
+    parser.add_argument("--no-streaming", action="store_true")
+    parser.add_argument("--no-answer-cache", action="store_true")
+    parser.add_argument("--reply-models", default="", help="Comma-separated reply models (default: LLM_PROVIDER)")
+    parser.add_argument("--openrouter-url", default="", help="Use an already running fake server instead of an in-process one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-loop-lag-ms", type=float, default=100.0, help="Fail if any heartbeat is delayed longer")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Also print the bot's cache, queue and model stats")
+    add_latency_arguments(parser)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Minimal synthetic PDF writer for benchmarks (no extra dependencies).
+"""
+import random
+
+WORDS = (
+    "server channel moderator role permission message thread voice event rule "
+    "member invite ban kick mute report handbook policy guideline support ticket "
+    "billing refund account password login security error code command bot"
+).split()
+
+
+def _page_stream(rng: random.Random, lines: int) -> bytes:
+    parts = ["BT", "/F1 10 Tf", "12 TL", "40 780 Td"]
+    for _ in range(lines):
+        line = " ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "."
+        parts.append(f"({line}) Tj T*")
+    parts.append("ET")
+    return "\n".join(parts).encode("latin-1")
+
+
+def make_pdf(page_count: int, lines_per_page: int = 55, blank_every: int = 0, seed: int = 42) -> bytes:
+    """
+    Build a PDF with page_count pages of random text.
+    If blank_every > 0, every Nth page has no text (exercises the per-page fallback).
+    """
+    rng = random.Random(seed)
+    objects = []
+
+    # 1: catalog, 2: pages tree, 3: font; pages and their content streams follow
+    first_page_obj = 4
+    page_ids = [first_page_obj + 2 * i for i in range(page_count)]
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for i, page_id in enumerate(page_ids):
+        blank = blank_every > 0 and (i + 1) % blank_every == 0
+        stream = b"" if blank else _page_stream(rng, lines_per_page)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+
+    return bytes(out)
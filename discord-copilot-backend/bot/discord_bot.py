@@ -2,14 +2,72 @@ import discord
 from discord.ext import commands
 import httpx
 from config import get_settings
-from bot.llm_client import llm_client
-from db.supabase_client import get_supabase
+from bot.llm_client import llm_client, FALLBACK_RESPONSE, BUSY_RESPONSE, INTERRUPTED_NOTICE, StreamInterrupted
+from bot.memory_summarizer import memory_summarizer
+from services.context_assembler import context_assembler
+from services.prompt_builder import prompt_builder
+from services.answer_cache import answer_cache
+from services.config_cache import config_cache
+from services.rag_service import embed_query
+from services.embedding_cache import normalize_query
+from services.single_flight import SingleFlight
+from services.llm_scheduler import SchedulerBusy, current_guild
+from services.metrics import bot_metrics, BOT_MESSAGES
+from typing import AsyncIterator, Optional, Tuple
 import logging
 import asyncio
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+DISCORD_MESSAGE_LIMIT = 2000
+NOT_ALLOWED_RESPONSE = "❌ This channel is not configured for bot responses. Please ask an admin to add it to the allow-list."
+
+
+class _SharedReply:
+    """
+    Answer text as generation produces it. Generation only appends here (no
+    Discord I/O), so one message failing to post or edit never reaches the
+    other messages coalesced onto the same answer.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self._done = False
+        self._interrupted = False
+        self._error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+    
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    def append(self, text: str):
+        self.text += text
+        self._notify()
+    
+    def finish(self, interrupted: bool = False, error: Optional[BaseException] = None):
+        if not self._done:
+            self._done, self._interrupted, self._error = True, interrupted, error
+            self._notify()
+    
+    async def deltas(self) -> AsyncIterator[str]:
+        """Yield the text as it grows (everything new since the last read at once)"""
+        read = 0
+        while True:
+            changed = self._changed
+            if read < len(self.text):
+                delta, read = self.text[read:], len(self.text)
+                yield delta
+                continue
+            if self._done:
+                if self._error is not None:
+                    raise self._error
+                if self._interrupted:
+                    raise StreamInterrupted("generation broke off")
+                return
+            await changed.wait()
+
 
 class DiscordBot(commands.Bot):
     """Discord bot with RAG-powered responses"""
@@ -22,6 +80,16 @@ class DiscordBot(commands.Bot):
         super().__init__(command_prefix="!", intents=intents)
         
         self.api_base_url = "http://localhost:8000"  # FastAPI running locally
+        self.in_flight = SingleFlight()
+    
+    async def setup_hook(self):
+        """Start background workers once the bot's event loop is running"""
+        memory_summarizer.start()
+    
+    async def close(self):
+        """Flush queued memory updates before disconnecting"""
+        await memory_summarizer.stop()
+        await super().close()
     
     async def on_ready(self):
         """Called when bot is ready"""
@@ -44,8 +112,10 @@ class DiscordBot(commands.Bot):
             logger.info("   ↪ Bot not mentioned, ignoring")
             return
         
-        # Get channel ID
+        # Get channel and guild IDs (memory is kept per conversation)
         channel_id = str(message.channel.id)
+        guild_id = str(message.guild.id) if message.guild else ""
+        current_guild.set(guild_id)  # Provider calls for this message count against the guild's limit
         
         # Remove bot mention from message
         query = message.content.replace(f'<@{self.user.id}>', '').strip()
@@ -57,153 +127,226 @@ class DiscordBot(commands.Bot):
         try:
             # Show typing indicator
             async with message.channel.typing():
-                # Get context from API
-                context = await self._get_bot_context(query, channel_id)
-                
-                # Check if channel is allowed
-                if not context["is_allowed_channel"]:
-                    await message.reply("❌ This channel is not configured for bot responses. Please ask an admin to add it to the allow-list.")
-                    return
-                
-                # Assemble prompt
-                prompt = self._assemble_prompt(
-                    context["system_instructions"],
-                    context["conversation_memory"],
-                    context["relevant_knowledge"],
-                    query
-                )
-                
-                # Generate response using LLM
-                response = await llm_client.generate_response(prompt, query)
-                
-                # Send response (split if too long)
-                await self._send_response(message, response)
-                
-                # Update conversation memory
-                await self._update_memory(query, response, context["conversation_memory"])
+                with bot_metrics.stage("message"):
+                    # Identical questions already in flight in this channel share one answer
+                    # generation; each message then posts its own reply from it
+                    reply = _SharedReply()
+                    answer, leader = self.in_flight.join(
+                        (channel_id, normalize_query(query)),
+                        lambda: self._answer(query, channel_id, guild_id, reply)
+                    )
+                    if not leader:
+                        BOT_MESSAGES.labels("coalesced").inc()
+                    
+                    if leader and settings.llm_streaming:
+                        # Post early and edit as text arrives
+                        try:
+                            await self._stream_response(message, reply.deltas())
+                        except BaseException:
+                            answer.cancel()  # Only stops waiting: generation goes on for the others
+                            raise
+                        await answer
+                    else:
+                        await self._send_response(message, await answer)
+        
+        except SchedulerBusy:
+            # Shed by admission control: answer fast instead of queueing behind the spike
+            BOT_MESSAGES.labels("busy").inc()
+            await message.reply(BUSY_RESPONSE)
         
         except Exception as e:
             logger.error(f"Error handling message: {str(e)}")
+            BOT_MESSAGES.labels("error").inc()
             await message.reply("❌ Sorry, I encountered an error processing your request.")
     
-    async def _get_bot_context(self, query: str, channel_id: str) -> dict:
-        """Get context from FastAPI bot query endpoint"""
-        from services.rag_service import search_knowledge
-        from db.supabase_client import get_supabase
+    async def _answer(self, query: str, channel_id: str, guild_id: str, reply: _SharedReply) -> str:
+        """
+        Generate the answer to one question into reply, once for all coalesced
+        duplicates (no Discord I/O here); returns the full reply text to post
+        """
+        try:
+            response = await self._generate(query, channel_id, guild_id, reply)
+        except BaseException as e:
+            reply.finish(error=e)
+            raise
+        reply.finish()
+        return response
+    
+    async def _generate(self, query: str, channel_id: str, guild_id: str, reply: _SharedReply) -> str:
+        # Near-duplicate questions are answered from the semantic cache (no retrieval, no LLM call)
+        with bot_metrics.stage("answer_cache"):
+            cache_key = await self._answer_cache_key(channel_id, query)
+            cached = answer_cache.get(channel_id, *cache_key) if cache_key is not None else None
+        if cached is not None:
+            BOT_MESSAGES.labels("cached").inc()
+            reply.append(cached)
+            memory_summarizer.enqueue(guild_id, channel_id, query, cached)
+            return cached
         
-        # Call directly without HTTP overhead
-        supabase = get_supabase()
+        # Get context (shared with /api/bot/query)
+        context = await context_assembler.assemble(query, channel_id, guild_id)
         
         # Check if channel is allowed
-        channel_response = supabase.table("allowed_channels").select("channel_id").eq(
-            "channel_id", channel_id
-        ).execute()
-        
-        is_allowed = len(channel_response.data) > 0
-        
-        if not is_allowed:
-            return {
-                "system_instructions": "",
-                "conversation_memory": "",
-                "relevant_knowledge": [],
-                "is_allowed_channel": False
-            }
-        
-        # Get system instructions
-        instructions_response = supabase.table("system_instructions").select(
-            "instructions"
-        ).order("updated_at", desc=True).limit(1).execute()
-        
-        system_instructions = "You are a helpful Discord assistant."
-        if instructions_response.data:
-            system_instructions = instructions_response.data[0]["instructions"]
-        
-        # Get conversation memory
-        memory_response = supabase.table("conversation_memory").select(
-            "summary"
-        ).limit(1).execute()
-        
-        conversation_memory = "No conversation history yet."
-        if memory_response.data:
-            conversation_memory = memory_response.data[0]["summary"]
-        
-        # Search knowledge base
-        knowledge_chunks = await search_knowledge(query, settings.top_k_retrieval)
-        
-        return {
-            "system_instructions": system_instructions,
-            "conversation_memory": conversation_memory,
-            "relevant_knowledge": knowledge_chunks,
-            "is_allowed_channel": True
-        }
-    
-    def _assemble_prompt(
-        self,
-        system_instructions: str,
-        conversation_memory: str,
-        knowledge_chunks: list,
-        query: str
-    ) -> str:
-        """Assemble complete prompt for LLM"""
-        prompt_parts = [system_instructions]
-        
-        # Add conversation context
-        if conversation_memory and conversation_memory != "No conversation history yet.":
-            prompt_parts.append(f"\n**Previous Conversation Summary:**\n{conversation_memory}")
-        
-        # Add relevant knowledge
-        if knowledge_chunks:
-            knowledge_text = "\n**Relevant Knowledge:**\n"
-            for chunk in knowledge_chunks:
-                if chunk["similarity"] > 0.5:  # Only include relevant chunks
-                    knowledge_text += f"\n[From {chunk['source']}]\n{chunk['text']}\n"
-            
-            if len(knowledge_text) > len("\n**Relevant Knowledge:**\n"):
-                prompt_parts.append(knowledge_text)
-        
-        return "\n\n".join(prompt_parts)
-    
-    async def _send_response(self, message: discord.Message, response: str):
-        """Send response, splitting if necessary (Discord 2000 char limit)"""
-        if len(response) <= 2000:
-            await message.reply(response)
+        if not context["is_allowed_channel"]:
+            BOT_MESSAGES.labels("not_allowed").inc()
+            reply.append(NOT_ALLOWED_RESPONSE)
+            return NOT_ALLOWED_RESPONSE
+        
+        # Assemble prompt within the token budget
+        with bot_metrics.stage("prompt_build"):
+            prompt = prompt_builder.build(
+                context["system_instructions"],
+                context["conversation_memory"],
+                context["relevant_knowledge"],
+                query
+            )
+        
+        # Generate response using LLM
+        if settings.llm_streaming:
+            try:
+                async for delta in llm_client.stream_response(prompt, query):
+                    reply.append(delta)
+            except StreamInterrupted:
+                # Cut off mid-answer: shown with a notice, but never cached or remembered
+                reply.finish(interrupted=True)
+                BOT_MESSAGES.labels("interrupted").inc()
+                return reply.text + INTERRUPTED_NOTICE
+            response = reply.text
         else:
-            # Split into chunks
-            chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-            for chunk in chunks:
-                await message.channel.send(chunk)
+            response = await llm_client.generate_response(prompt, query)
+            reply.append(response)
+        
+        if not response.strip():
+            # The model finished without any text: don't leave the user unanswered
+            response = FALLBACK_RESPONSE
+        
+        if response == BUSY_RESPONSE:
+            BOT_MESSAGES.labels("busy").inc()
+            return response
+        
+        if response == FALLBACK_RESPONSE:
+            # No answer: nothing to cache or to remember
+            BOT_MESSAGES.labels("fallback").inc()
+            return response
+        
+        BOT_MESSAGES.labels("answered").inc()
+        
+        # Never cache an empty reply: every near-duplicate question would get it too
+        if cache_key is not None and response.strip():
+            answer_cache.put(channel_id, query, cache_key[0], response, cache_key[1])
+        
+        # Queue the exchange for the background memory summarizer (once, not per coalesced duplicate)
+        memory_summarizer.enqueue(guild_id, channel_id, query, response)
+        return response
     
-    async def _update_memory(self, user_query: str, bot_response: str, current_memory: str):
-        """Update conversation memory"""
+    async def _answer_cache_key(self, channel_id: str, query: str) -> Optional[Tuple[list, tuple]]:
+        """
+        Query embedding and answer version for the answer cache, or None if the
+        cache is disabled, the channel is not allowed, or embedding failed
+        """
+        if not settings.answer_cache_enabled or not await config_cache.is_channel_allowed(channel_id):
+            return None
         try:
-            supabase = get_supabase()
-            
-            # Get current memory record (include 'id' for update)
-            memory_data = supabase.table("conversation_memory").select("id, message_count").limit(1).execute()
-            
-            # Generate new summary
-            new_exchange = f"User: {user_query}\nAssistant: {bot_response}"
-            new_summary = await llm_client.generate_memory_summary(current_memory, new_exchange)
-            
-            if memory_data.data:
-                # Update existing record
-                message_count = (memory_data.data[0].get("message_count") or 0) + 1
-                supabase.table("conversation_memory").update({
-                    "summary": new_summary,
-                    "message_count": message_count,
-                    "last_updated": "now()"
-                }).eq("id", memory_data.data[0]["id"]).execute()
-                logger.info(f"✅ Memory updated. Message count: {message_count}")
-            else:
-                # Create new memory record if none exists
-                supabase.table("conversation_memory").insert({
-                    "summary": new_summary,
-                    "message_count": 1
-                }).execute()
-                logger.info("✅ Created new memory record")
-        
+            # Version first: an answer must never be newer than the knowledge it is filed under
+            version = answer_cache.version(await config_cache.get_instructions())
+            return await embed_query(query), version
+        except SchedulerBusy:
+            raise
         except Exception as e:
-            logger.error(f"Failed to update memory: {str(e)}")
+            logger.warning(f"Answer cache lookup skipped: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _split_point(text: str) -> int:
+        """Find where to cut text that overflows one Discord message, preferring a line or word break"""
+        limit = DISCORD_MESSAGE_LIMIT
+        for separator in ("\n", " "):
+            cut = text.rfind(separator, limit - 200, limit)
+            if cut > 0:
+                return cut + 1
+        return limit
+    
+    async def _stream_response(self, message: discord.Message, stream) -> Tuple[str, bool]:
+        """
+        Stream a response into Discord: post as soon as text arrives, then edit
+        the message at a rate-limit-safe cadence, rolling over to a new message
+        at the 2000 char limit. Returns (response text, complete): the text is
+        FALLBACK_RESPONSE (posted) if the stream produced none, and complete is
+        False if the stream broke off, in which case the notice is appended.
+        """
+        loop = asyncio.get_running_loop()
+        full_text = ""
+        buffer = ""          # Text belonging to the current Discord message
+        shown = ""           # What the current Discord message displays
+        current = None       # Current Discord message being edited
+        replied = False
+        last_edit = 0.0
+        
+        async def publish(text: str):
+            nonlocal current, replied, shown, last_edit
+            with bot_metrics.stage("discord_send"):
+                if current is None:
+                    # First message replies to the user, rollovers continue in channel
+                    if not replied:
+                        current = await message.reply(text)
+                        replied = True
+                    else:
+                        current = await message.channel.send(text)
+                else:
+                    await current.edit(content=text)
+            shown = text
+            last_edit = loop.time()
+        
+        async def roll_over():
+            # Roll over to a new message at the Discord limit
+            nonlocal buffer, current, shown
+            while len(buffer) > DISCORD_MESSAGE_LIMIT:
+                cut = self._split_point(buffer)
+                await publish(buffer[:cut])
+                buffer = buffer[cut:]
+                current = None
+                shown = ""
+        
+        complete = True
+        try:
+            async for delta in stream:
+                full_text += delta
+                buffer += delta
+                await roll_over()
+                
+                if not buffer.strip():
+                    continue
+                
+                if current is None or loop.time() - last_edit >= settings.discord_stream_edit_interval:
+                    await publish(buffer)
+        
+        except StreamInterrupted:
+            # Tell the user the answer is cut off instead of passing it off as whole
+            complete = False
+            buffer += INTERRUPTED_NOTICE
+            await roll_over()
+        
+        # Final flush so the message ends with the complete text
+        if buffer.strip() and buffer != shown:
+            await publish(buffer)
+        
+        if complete and not full_text.strip():
+            # The model finished without any text: don't leave the user unanswered
+            await publish(FALLBACK_RESPONSE)
+            return FALLBACK_RESPONSE, True
+        
+        return full_text, complete
+    
+    async def _send_response(self, message: discord.Message, response: str):
+        """Send response, splitting if necessary (Discord 2000 char limit)"""
+        with bot_metrics.stage("discord_send"):
+            if len(response) <= 2000:
+                await message.reply(response)
+            else:
+                # Split into chunks
+                chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
+                for chunk in chunks:
+                    await message.channel.send(chunk)
 
 
 # Global bot instance
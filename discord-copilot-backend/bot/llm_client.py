@@ -1,44 +1,153 @@
 from config import get_settings
-from openai import AsyncOpenAI
+from services.llm_scheduler import llm_scheduler, Priority, SchedulerBusy
+from services.model_router import model_router, REPLY, SUMMARY
+from services.openrouter import get_openrouter
+from services.metrics import bot_metrics
+from openai import AsyncStream
+from typing import AsyncIterator, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again later."
+BUSY_RESPONSE = "⏳ I'm handling a lot of questions right now. Please try again in a moment."
+INTERRUPTED_NOTICE = "\n\n⚠️ *Response interrupted, please ask again.*"
+
+
+class StreamInterrupted(Exception):
+    """A streamed response failed after some of its text was already yielded"""
+
 
 class LLMClient:
     """Unified LLM client using OpenRouter"""
     
-    def __init__(self):
-        # OpenRouter uses OpenAI-compatible API
-        self.client = AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=settings.openrouter_api_key,
-        )
-        self.model = settings.llm_provider
+    @property
+    def client(self):
+        # OpenRouter uses OpenAI-compatible API (one client shared with embeddings)
+        return get_openrouter()
+    
+    @staticmethod
+    def _messages(system_prompt: str, user_message: str) -> list:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+    
+    async def _open_stream(self, model: str, messages: list, **kwargs) -> Tuple[str, AsyncIterator, AsyncStream]:
+        """
+        Open a stream and read up to its first text delta (what the hedging
+        budget and the model latency measure, so every chat call streams)
+        """
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+        chunks = stream.__aiter__()
+        try:
+            async for chunk in chunks:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    return delta, chunks, stream
+            return "", chunks, stream
+        except BaseException:
+            # Lost the hedge race or failed: release the connection
+            await stream.close()
+            raise
+    
+    @staticmethod
+    async def _close_stream(opened: Tuple[str, AsyncIterator, AsyncStream]):
+        await opened[2].close()
+    
+    @staticmethod
+    async def _read_stream(opened: Tuple[str, AsyncIterator, AsyncStream]) -> str:
+        """Read an opened stream to the end and return the whole text"""
+        first_delta, chunks, stream = opened
+        parts = [first_delta]
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+        finally:
+            await stream.close()
+        return "".join(parts)
     
     async def generate_response(self, system_prompt: str, user_message: str) -> str:
         """
-        Generate a response using OpenRouter
+        Generate a response using OpenRouter (hedged across the reply models)
+        Streamed internally, so hedging races the first token as in stream_response
+        and a long answer is never mistaken for a slow model
         """
+        messages = self._messages(system_prompt, user_message)
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ]
-            )
-            
-            return response.choices[0].message.content
+            async with llm_scheduler.slot(Priority.INTERACTIVE):
+                with bot_metrics.stage("llm_generation"):
+                    with bot_metrics.stage("llm_first_token"):
+                        opened = await model_router.run(
+                            REPLY,
+                            lambda model: self._open_stream(model, messages),
+                            hedge_after=settings.llm_hedge_after_seconds,
+                            discard=self._close_stream,
+                            hedge_slot=lambda: llm_scheduler.try_slot(Priority.INTERACTIVE)
+                        )
+                    return await self._read_stream(opened)
+        
+        except SchedulerBusy:
+            return BUSY_RESPONSE
         
         except Exception as e:
             logger.error(f"LLM generation failed: {str(e)}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again later."
+            return FALLBACK_RESPONSE
+    
+    async def stream_response(self, system_prompt: str, user_message: str) -> AsyncIterator[str]:
+        """
+        Stream a response from OpenRouter, yielding text deltas as they arrive
+        (a backup reply model is raced in if the first token is late)
+        Raises StreamInterrupted if the stream fails after yielding text
+        """
+        messages = self._messages(system_prompt, user_message)
+        produced = False
+        
+        try:
+            # The slot is held until the stream ends
+            async with llm_scheduler.slot(Priority.INTERACTIVE):
+                # Generation time covers the whole stream
+                with bot_metrics.stage("llm_generation"):
+                    with bot_metrics.stage("llm_first_token"):
+                        first_delta, chunks, stream = await model_router.run(
+                            REPLY,
+                            lambda model: self._open_stream(model, messages),
+                            hedge_after=settings.llm_hedge_after_seconds,
+                            discard=self._close_stream,
+                            hedge_slot=lambda: llm_scheduler.try_slot(Priority.INTERACTIVE)
+                        )
+                    
+                    try:
+                        if first_delta:
+                            produced = True
+                            yield first_delta
+                        
+                        async for chunk in chunks:
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                produced = True
+                                yield delta
+                    finally:
+                        await stream.close()
+        
+        except SchedulerBusy:
+            yield BUSY_RESPONSE
+        
+        except Exception as e:
+            logger.error(f"LLM streaming failed: {str(e)}")
+            # Part of the answer is out: the caller must not take it for the whole
+            if produced:
+                raise StreamInterrupted(str(e)) from e
+            yield FALLBACK_RESPONSE
     
-    async def generate_memory_summary(self, conversation_history: str, new_exchange: str) -> str:
+    async def generate_memory_summary(self, conversation_history: str, new_exchanges: str) -> str:
         """
         Generate a concise rolling summary of the conversation for context
+        (new_exchanges may hold several exchanges batched together)
         """
         prompt = f"""You are a conversation context manager. Create a BRIEF summary that captures the essence of conversations.
 
@@ -52,8 +161,8 @@ RULES:
 EXISTING CONTEXT:
 {conversation_history}
 
-NEW EXCHANGE:
-{new_exchange}
+NEW EXCHANGES:
+{new_exchanges}
 
 Write a brief, updated context summary. Example format:
 "Topics covered: [topics]. User asked about: [interests]. Key info shared: [facts]."
@@ -61,17 +170,25 @@ Write a brief, updated context summary. Example format:
 Keep under 200 words."""
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300
-            )
-            return response.choices[0].message.content
+            # Summary models fail over in order of measured latency, no hedging
+            async with llm_scheduler.slot(Priority.SUMMARY):
+                opened = await model_router.run(
+                    SUMMARY,
+                    lambda model: self._open_stream(
+                        model,
+                        [{"role": "user", "content": prompt}],
+                        max_tokens=300
+                    )
+                )
+                return await self._read_stream(opened)
+        
+        except SchedulerBusy:
+            raise  # The caller keeps the exchanges for a later flush
         
         except Exception as e:
             logger.error(f"Memory summary generation failed: {str(e)}")
             # Return simple concatenation as fallback
-            return f"{conversation_history}\n\n{new_exchange}"
+            return f"{conversation_history}\n\n{new_exchanges}"
 
 
 # Global LLM client instance
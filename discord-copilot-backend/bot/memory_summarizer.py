@@ -0,0 +1,177 @@
+from config import get_settings
+from bot.llm_client import llm_client
+from db import repository
+from services.context_assembler import DEFAULT_MEMORY
+from services.llm_scheduler import SchedulerBusy, current_guild
+from services.metrics import bot_metrics
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+BUSY_BACKOFF_SECONDS = 5.0  # First pause after the scheduler sheds a flush; doubles while it keeps shedding
+
+
+class MemorySummarizer:
+    """
+    Background worker that folds conversation exchanges into each conversation's
+    rolling memory summary.
+
+    Reply handlers only enqueue; the worker waits until traffic goes quiet
+    (debounce), the batch fills up, or the oldest exchange has waited too
+    long, and then makes a single summary call per conversation in the batch.
+    When the scheduler sheds summary calls, the batch is kept and the worker
+    backs off exponentially (capped at max_delay) before trying again.
+    """
+
+    def __init__(self, batch_size: int, debounce: float, max_delay: float):
+        self.batch_size = batch_size
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        # (guild_id, channel_id) -> queued exchanges
+        self._pending: Dict[Tuple[str, str], List[str]] = {}
+        self._pending_count = 0
+        self._last_enqueued = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._deferred = False  # Set when the last flush was shed by the scheduler
+        self._busy_streak = 0
+
+        self.exchanges_enqueued = 0
+        self.summary_calls = 0
+        self.deferrals = 0
+
+    def enqueue(self, guild_id: str, channel_id: str, user_query: str, bot_response: str):
+        """Queue an exchange for summarization (returns immediately)"""
+        exchange = f"User: {user_query}\nAssistant: {bot_response}"
+        self._pending.setdefault((guild_id, channel_id), []).append(exchange)
+        self._pending_count += 1
+        self._last_enqueued = asyncio.get_running_loop().time()
+        self.exchanges_enqueued += 1
+        self._wakeup.set()
+
+    async def _wait_for_batch(self):
+        """Block until the pending batch should be flushed"""
+        loop = asyncio.get_running_loop()
+        first_seen = loop.time()
+
+        while self._pending_count < self.batch_size:
+            deadline = min(self._last_enqueued + self.debounce, first_seen + self.max_delay)
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                return
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _summarize(self, guild_id: str, channel_id: str, exchanges: List[str]):
+        """Fold one conversation's exchanges into its stored summary with one LLM call"""
+        current_guild.set(guild_id)  # Count the summary call against its guild's limit
+        try:
+            with bot_metrics.stage("memory_update"):
+                memory = await repository.get_memory(guild_id, channel_id)
+                current_memory = (memory or {}).get("summary") or DEFAULT_MEMORY
+
+                new_summary = await llm_client.generate_memory_summary(current_memory, "\n\n".join(exchanges))
+                self.summary_calls += 1
+
+                # Atomic upsert-and-increment, so concurrent writers never lose counts
+                memory = await repository.upsert_memory(guild_id, channel_id, new_summary, len(exchanges))
+            logger.info(
+                f"✅ Memory updated for {guild_id or '-'}/{channel_id} from {len(exchanges)} exchanges. "
+                f"Message count: {memory['message_count']}"
+            )
+
+        except asyncio.CancelledError:
+            # Interrupted mid-flush (shutdown): keep the batch for the final flush
+            self._requeue(guild_id, channel_id, exchanges)
+            raise
+
+        except SchedulerBusy:
+            # Shed while interactive traffic has the provider: retry after a backoff
+            logger.info(f"Memory summary for {guild_id or '-'}/{channel_id} deferred (provider busy)")
+            self._requeue(guild_id, channel_id, exchanges)
+            self._deferred = True
+            self.deferrals += 1
+
+        except Exception as e:
+            logger.error(f"Failed to update memory: {str(e)}")
+
+    def _requeue(self, guild_id: str, channel_id: str, exchanges: List[str]):
+        """Put exchanges back at the front of their conversation's queue"""
+        self._pending.setdefault((guild_id, channel_id), [])[:0] = exchanges
+        self._pending_count += len(exchanges)
+
+    async def flush(self):
+        """Summarize every pending conversation"""
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        self._pending_count = 0
+        self._deferred = False
+
+        await asyncio.gather(*(
+            self._summarize(guild_id, channel_id, exchanges)
+            for (guild_id, channel_id), exchanges in batch.items()
+        ))
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._pending:
+                self._wakeup.clear()
+                continue
+
+            await self._wait_for_batch()
+            await self.flush()
+
+            if not self._deferred:
+                self._busy_streak = 0
+                continue
+
+            # The requeued batch would flush again at once: pause, then retry it
+            self._busy_streak += 1
+            delay = min(BUSY_BACKOFF_SECONDS * 2 ** (self._busy_streak - 1), self.max_delay)
+            self._wakeup.clear()
+            await asyncio.sleep(delay)
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker and flush anything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending_count,
+            "pending_conversations": len(self._pending),
+            "exchanges_enqueued": self.exchanges_enqueued,
+            "summary_calls": self.summary_calls,
+            "deferrals": self.deferrals
+        }
+
+
+# Global memory summarizer instance
+memory_summarizer = MemorySummarizer(
+    settings.memory_batch_size,
+    settings.memory_debounce_seconds,
+    settings.memory_max_delay_seconds
+)
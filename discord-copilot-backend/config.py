@@ -9,26 +9,123 @@ class Settings(BaseSettings):
     supabase_anon_key: str
     database_url: str
     
+    # Postgres pool (asyncpg)
+    db_pool_min_size: int = 2
+    db_pool_max_size: int = 10
+    db_statement_cache_size: int = 100  # Set to 0 behind PgBouncer transaction pooling
+    db_command_timeout: float = 30.0
+    
+    # Config cache invalidation (LISTEN needs a direct/session connection, not a transaction pooler)
+    database_listen_url: str | None = None
+    config_listener_check_interval: float = 5.0
+    
     # Discord
     discord_bot_token: str
     
     # AI APIs (using OpenRouter)
     openrouter_api_key: str
+    openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    
+    # OpenRouter HTTP transport (one keep-alive pool shared by chat and embeddings)
+    openrouter_http2: bool = True
+    openrouter_max_connections: int = 50
+    openrouter_max_keepalive_connections: int = 20
+    openrouter_keepalive_expiry: float = 30.0
+    openrouter_connect_timeout: float = 5.0
+    openrouter_read_timeout: float = 60.0  # Longest silence per read, including between streamed tokens
+    openrouter_max_retries: int = 1  # Client-level; routing fails over and ingestion backs off on top
+    openrouter_breaker_failures: int = 5  # Consecutive failures that open the circuit
+    openrouter_breaker_reset_seconds: float = 30.0  # Open time before a probe call is let through
     
     # LLM Choice (use OpenRouter model names like: openai/gpt-4, anthropic/claude-3-opus, google/gemini-pro)
     llm_provider: str 
     
+    # Model routing (comma-separated OpenRouter models per task, best measured latency first; empty = llm_provider)
+    llm_reply_models: str = ""
+    llm_summary_models: str = ""  # e.g. a small fast model
+    llm_hedge_after_seconds: float = 3.0  # Race the next reply model if the first token is later than this
+    
+    # OpenRouter admission control (interactive replies, then memory summaries, then ingestion embeddings)
+    llm_max_concurrency: int = 16
+    llm_max_concurrency_per_guild: int = 4
+    llm_queue_max_size: int = 200
+    llm_max_wait_interactive: float = 10.0  # Shed with a "busy" reply rather than queue longer
+    llm_max_wait_summary: float = 120.0
+    llm_max_wait_ingestion: float = 0.0  # 0 = wait as long as it takes
+    
     # Embedding model
     embedding_model: str = "text-embedding-3-small"
     embedding_dimensions: int = 1536
     
+    # Ingestion embedding batches
+    embedding_batch_max_tokens: int = 50000
+    embedding_batch_max_items: int = 256
+    embedding_concurrency: int = 4
+    embedding_max_retries: int = 5
+    embedding_retry_base_delay: float = 1.0
+    
     # RAG settings
     chunk_size: int = 600
     chunk_overlap: int = 100
     top_k_retrieval: int = 5
+    hybrid_search_enabled: bool = True  # Fuse full-text and vector ranks (RRF)
+    hybrid_candidate_count: int = 40  # Candidates taken from each ranking before fusion
+    hybrid_rrf_k: int = 60
+    min_similarity: float = 0.5  # Vector hits below this never leave the database
+    
+    # Semantic answer cache (near-duplicate questions per channel skip retrieval and the LLM)
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = 0.95  # Cosine similarity between questions
+    answer_cache_max_entries: int = 256  # Per channel
+    answer_cache_ttl_seconds: int = 3600
+    
+    # Prompt token budgets (system prompt; the user's message is counted but not cut)
+    prompt_max_tokens: int = 3000
+    prompt_instructions_tokens: int = 1000
+    prompt_memory_tokens: int = 500
+    prompt_knowledge_tokens: int = 1500
+    
+    # PDF uploads (spooled to disk; None = system temp dir)
+    max_upload_size_mb: int = 10
+    upload_spool_dir: str | None = None
+    
+    # PDF extraction (process pool; 0 workers = one per CPU core)
+    pdf_extraction_workers: int = 0
+    pdf_pages_per_task: int = 25
+    
+    # Vector index (see `python -m db.vector_index`)
+    vector_index_method: str = "auto"  # auto, hnsw or ivfflat
+    vector_hnsw_m: int = 16
+    vector_hnsw_ef_construction: int = 64
+    vector_index_maintenance_work_mem: str = "1GB"  # Per-session memory for index builds (keep the graph in memory)
+    vector_hnsw_ef_search: int = 40  # Per-query candidate list size (recall vs latency)
+    vector_ivfflat_probes: int = 10  # Per-query lists scanned (recall vs latency)
+    vector_iterative_scan: str | None = "strict_order"  # Filtered scans; only applied if pgvector 0.8+ is detected at startup
+
+    # In-process vector index (exact search over a RAM copy of document_chunks)
+    local_vector_index_enabled: bool = False
+    local_vector_index_dir: str = ".vector_index"  # Snapshot location, memory-mapped on startup
+    
+    # Query embedding cache
+    embedding_cache_size: int = 2048
+    embedding_cache_ttl_hours: int = 168
+    embedding_cache_purge_every: int = 500  # Purge expired rows every N writes
+    
+    # Chunk embedding store (purged of other models' and old rows after each ingestion)
+    embedding_store_ttl_days: int = 90
+    
+    # Response streaming (Discord allows roughly 5 edits per 5 seconds per message)
+    llm_streaming: bool = True
+    discord_stream_edit_interval: float = 1.2
+    
+    # Observability (stage histograms are always on at /metrics; spans need opentelemetry-api)
+    tracing_enabled: bool = False
     
     # Conversation settings
     max_memory_length: int = 500
+    memory_batch_size: int = 10  # Exchanges folded into one summary call
+    memory_debounce_seconds: float = 20.0  # Flush after this long without new exchanges
+    memory_max_delay_seconds: float = 120.0  # Never hold an exchange longer than this
     
     class Config:
         env_file = ".env"
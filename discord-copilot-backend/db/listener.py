@@ -0,0 +1,98 @@
+"""
+Shared Postgres LISTEN connection for in-process caches.
+
+Each cache subscribes to a NOTIFY channel with a payload handler and an
+optional reconnect handler (anything may have changed while disconnected).
+"""
+from config import get_settings
+from typing import Callable, Dict, List, Optional
+import asyncio
+import asyncpg
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class NotificationListener:
+    """One dedicated LISTEN connection, reconnecting with backoff if it drops"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._reconnect_handlers: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[asyncpg.Connection] = None
+
+    def subscribe(
+        self,
+        channel: str,
+        on_notify: Callable[[str], None],
+        on_reconnect: Optional[Callable[[], None]] = None
+    ):
+        """
+        Register handlers for a channel. Subscriptions made after start()
+        take effect on the next (re)connect.
+        """
+        self._handlers.setdefault(channel, []).append(on_notify)
+        if on_reconnect is not None:
+            self._reconnect_handlers.append(on_reconnect)
+
+        if self._conn is not None and not self._conn.is_closed():
+            # Pick it up now by forcing a reconnect
+            self._conn.terminate()
+
+    def _dispatch(self, connection, pid, channel, payload):
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception as e:
+                logger.error(f"Notification handler for {channel} failed: {str(e)}")
+
+    async def _listen_loop(self):
+        # LISTEN needs a session, so this must not go through a transaction pooler
+        dsn = settings.database_listen_url or settings.database_url
+        backoff = 1.0
+
+        while True:
+            try:
+                self._conn = await asyncpg.connect(dsn=dsn)
+                for channel in self._handlers:
+                    await self._conn.add_listener(channel, self._dispatch)
+                for handler in self._reconnect_handlers:
+                    handler()
+                backoff = 1.0
+                logger.info(f"Listening for notifications on {', '.join(self._handlers) or 'no channels'}")
+
+                while not self._conn.is_closed():
+                    await asyncio.sleep(settings.config_listener_check_interval)
+
+                logger.warning("Notification listener connection closed, reconnecting...")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification listener failed: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+            finally:
+                if self._conn is not None and not self._conn.is_closed():
+                    await self._conn.close()
+                self._conn = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global notification listener instance
+notification_listener = NotificationListener()
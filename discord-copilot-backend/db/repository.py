@@ -0,0 +1,574 @@
+"""
+Async repository layer over the asyncpg pool.
+
+All hot-path reads and writes go through here so that no request handler
+or bot event ever blocks the event loop on a synchronous HTTP call.
+"""
+from db.supabase_client import get_db_pool
+from db.vector_index import pgvector_version
+from config import get_settings
+from typing import Dict, Iterable, List, Optional
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DEFAULT_COLLECTION = "default"
+
+
+def _record_to_dict(record) -> dict:
+    """Convert an asyncpg Record to a plain dict (UUIDs as strings for the API models)"""
+    return {
+        key: str(value) if isinstance(value, uuid.UUID) else value
+        for key, value in record.items()
+    }
+
+
+# ---------------------------------------------------------------------------
+# Allowed channels
+# ---------------------------------------------------------------------------
+
+async def is_channel_allowed(channel_id: str) -> bool:
+    pool = await get_db_pool()
+    return await pool.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM allowed_channels WHERE channel_id = $1)",
+        channel_id
+    )
+
+
+async def get_channel_collections() -> Dict[str, Optional[str]]:
+    """Allowed channel ids mapped to the knowledge collection they search (None = all)"""
+    pool = await get_db_pool()
+    rows = await pool.fetch("SELECT channel_id, collection FROM allowed_channels")
+    return {row["channel_id"]: row["collection"] for row in rows}
+
+
+async def list_channels() -> List[dict]:
+    pool = await get_db_pool()
+    rows = await pool.fetch("SELECT * FROM allowed_channels ORDER BY added_at DESC")
+    return [_record_to_dict(row) for row in rows]
+
+
+async def add_channel(
+    channel_id: str,
+    channel_name: Optional[str],
+    added_by: Optional[str],
+    collection: Optional[str] = None
+) -> Optional[dict]:
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        """
+        INSERT INTO allowed_channels (channel_id, channel_name, added_by, collection)
+        VALUES ($1, $2, $3, $4)
+        RETURNING *
+        """,
+        channel_id, channel_name, added_by, collection
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def set_channel_collection(channel_id: str, collection: Optional[str]) -> Optional[dict]:
+    """Scope a channel's knowledge search to one collection (None = all)"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "UPDATE allowed_channels SET collection = $1 WHERE channel_id = $2 RETURNING *",
+        collection, channel_id
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def remove_channel(channel_id: str) -> bool:
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "DELETE FROM allowed_channels WHERE channel_id = $1 RETURNING id",
+        channel_id
+    )
+    return row is not None
+
+
+# ---------------------------------------------------------------------------
+# System instructions
+# ---------------------------------------------------------------------------
+
+async def get_latest_instructions() -> Optional[dict]:
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "SELECT * FROM system_instructions ORDER BY updated_at DESC LIMIT 1"
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def save_instructions(instructions: str, updated_by: Optional[str]) -> Optional[dict]:
+    """Update the existing instructions row, or insert one if none exists"""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            existing_id = await conn.fetchval(
+                "SELECT id FROM system_instructions ORDER BY updated_at DESC LIMIT 1 FOR UPDATE"
+            )
+            if existing_id:
+                row = await conn.fetchrow(
+                    """
+                    UPDATE system_instructions
+                    SET instructions = $1, updated_at = NOW(), updated_by = $2
+                    WHERE id = $3
+                    RETURNING *
+                    """,
+                    instructions, updated_by, existing_id
+                )
+            else:
+                row = await conn.fetchrow(
+                    """
+                    INSERT INTO system_instructions (instructions, updated_by)
+                    VALUES ($1, $2)
+                    RETURNING *
+                    """,
+                    instructions, updated_by
+                )
+    return _record_to_dict(row) if row else None
+
+
+# ---------------------------------------------------------------------------
+# Conversation memory
+# ---------------------------------------------------------------------------
+
+async def get_memory(guild_id: str, channel_id: str) -> Optional[dict]:
+    """Get the memory row for one conversation"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "SELECT * FROM conversation_memory WHERE guild_id = $1 AND channel_id = $2",
+        guild_id, channel_id
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def get_latest_memory() -> Optional[dict]:
+    """Get the most recently updated conversation memory"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "SELECT * FROM conversation_memory ORDER BY last_updated DESC NULLS LAST LIMIT 1"
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def list_memories() -> List[dict]:
+    pool = await get_db_pool()
+    rows = await pool.fetch(
+        "SELECT * FROM conversation_memory ORDER BY last_updated DESC NULLS LAST"
+    )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def ensure_memory(guild_id: str, channel_id: str, default_summary: str) -> dict:
+    """Get a conversation's memory, creating it with default_summary if missing"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        """
+        INSERT INTO conversation_memory (guild_id, channel_id, summary, message_count)
+        VALUES ($1, $2, $3, 0)
+        ON CONFLICT (guild_id, channel_id) DO NOTHING
+        RETURNING *
+        """,
+        guild_id, channel_id, default_summary
+    )
+    if row is None:
+        return await get_memory(guild_id, channel_id)
+    return _record_to_dict(row)
+
+
+async def upsert_memory(
+    guild_id: str,
+    channel_id: str,
+    summary: str,
+    message_count: int = 1,
+    increment: bool = True
+) -> Optional[dict]:
+    """
+    Write a conversation's summary through the upsert_conversation_memory RPC
+    (one atomic statement; increments the count unless increment is False)
+    """
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "SELECT * FROM upsert_conversation_memory($1, $2, $3, $4, $5)",
+        guild_id, channel_id, summary, message_count, increment
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def reset_memory(default_summary: str, guild_id: Optional[str] = None, channel_id: Optional[str] = None) -> int:
+    """Reset one conversation's memory, or every conversation when no scope is given"""
+    pool = await get_db_pool()
+    if channel_id is None:
+        result = await pool.execute(
+            "UPDATE conversation_memory SET summary = $1, message_count = 0, last_updated = NOW()",
+            default_summary
+        )
+    else:
+        result = await pool.execute(
+            """
+            UPDATE conversation_memory SET summary = $1, message_count = 0, last_updated = NOW()
+            WHERE guild_id = $2 AND channel_id = $3
+            """,
+            default_summary, guild_id or "", channel_id
+        )
+    return int(result.split()[-1])
+
+
+# ---------------------------------------------------------------------------
+# Documents and chunks
+# ---------------------------------------------------------------------------
+
+async def list_documents() -> List[dict]:
+    pool = await get_db_pool()
+    rows = await pool.fetch("SELECT * FROM pdf_documents ORDER BY upload_date DESC")
+    return [_record_to_dict(row) for row in rows]
+
+
+async def create_document(
+    document_id: str,
+    filename: str,
+    file_path: str,
+    file_size: int,
+    uploaded_by: Optional[str],
+    status: str = "processing",
+    content_hash: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION
+) -> Optional[dict]:
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        """
+        INSERT INTO pdf_documents (id, filename, file_path, file_size, uploaded_by, status, content_hash, collection)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+        RETURNING *
+        """,
+        document_id, filename, file_path, file_size, uploaded_by, status, content_hash, collection
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def get_document_path(document_id: str) -> Optional[str]:
+    pool = await get_db_pool()
+    return await pool.fetchval(
+        "SELECT file_path FROM pdf_documents WHERE id = $1",
+        document_id
+    )
+
+
+async def delete_document(document_id: str) -> bool:
+    """Delete a document; its chunks are removed via ON DELETE CASCADE"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "DELETE FROM pdf_documents WHERE id = $1 RETURNING id",
+        document_id
+    )
+    return row is not None
+
+
+async def set_document_status(document_id: str, status: str) -> Optional[dict]:
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "UPDATE pdf_documents SET status = $1 WHERE id = $2 RETURNING *",
+        status, document_id
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def start_document_processing(document_id: str) -> Optional[dict]:
+    """Mark a document as processing, or return None if it already is (or does not exist)"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        "UPDATE pdf_documents SET status = 'processing' WHERE id = $1 AND status <> 'processing' RETURNING *",
+        document_id
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def copy_chunks(document_id: str, chunks: Iterable[dict]) -> int:
+    """
+    Replace a document's chunks ({text, chunk_index, page_number, embedding})
+    with a binary COPY inside one transaction. Vectors go over the wire in
+    pgvector's binary format via the codec registered on the pool.
+    Returns the number of rows copied.
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Lock the document first so concurrent replacements run one after the
+            # other; otherwise neither DELETE sees the other's uncommitted rows
+            collection = await conn.fetchval(
+                "SELECT collection FROM pdf_documents WHERE id = $1 FOR UPDATE",
+                document_id
+            )
+            # Drop leftovers from an earlier, interrupted run
+            await conn.execute("DELETE FROM document_chunks WHERE document_id = $1", document_id)
+            result = await conn.copy_records_to_table(
+                "document_chunks",
+                columns=["document_id", "chunk_text", "chunk_index", "page_number", "embedding", "collection"],
+                records=(
+                    (document_id, chunk["text"], chunk["chunk_index"], chunk["page_number"], chunk["embedding"], collection)
+                    for chunk in chunks
+                )
+            )
+    return int(result.split()[-1])
+
+
+# hnsw/ivfflat.iterative_scan value to send; stays None until check_vector_features confirms pgvector 0.8+
+_iterative_scan: Optional[str] = None
+
+
+async def check_vector_features():
+    """
+    Enable iterative scans only if the installed pgvector has them (0.8+);
+    on older versions setting the GUC fails every search. Called once at startup.
+    """
+    global _iterative_scan
+    if not settings.vector_iterative_scan:
+        return
+
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            version = await pgvector_version(conn)
+    except Exception as e:
+        logger.error(f"Could not read the pgvector version, iterative scans disabled: {str(e)}")
+        return
+
+    if version >= (0, 8):
+        _iterative_scan = settings.vector_iterative_scan
+    else:
+        logger.error(
+            f"vector_iterative_scan={settings.vector_iterative_scan} needs pgvector 0.8+, "
+            f"found {'.'.join(map(str, version))}: iterative scans disabled, filtered searches may return short"
+        )
+
+
+async def set_vector_search_params(conn, ef_search: int, probes: int):
+    """
+    Apply per-query ANN tuning for the current transaction (HNSW and IVFFlat).
+    With iterative scans enabled, filtered searches keep scanning the index
+    until enough rows pass the filters instead of returning short.
+    """
+    await conn.execute(
+        "SELECT set_config('hnsw.ef_search', $1, true), set_config('ivfflat.probes', $2, true)",
+        str(ef_search), str(probes)
+    )
+    if _iterative_scan:
+        await conn.execute(
+            "SELECT set_config('hnsw.iterative_scan', $1, true), set_config('ivfflat.iterative_scan', $2, true)",
+            _iterative_scan,
+            # IVFFlat only supports relaxed ordering
+            "off" if _iterative_scan == "off" else "relaxed_order"
+        )
+
+
+def _document_uuids(document_ids: Optional[List[str]]) -> Optional[List[uuid.UUID]]:
+    return [uuid.UUID(document_id) for document_id in document_ids] if document_ids else None
+
+
+async def search_documents(
+    query_embedding: List[float],
+    match_count: int,
+    min_similarity: Optional[float] = None,
+    collection: Optional[str] = None,
+    document_ids: Optional[List[str]] = None
+) -> List[dict]:
+    """
+    Vector similarity search via the search_documents SQL function; the
+    similarity floor and collection/document filters are applied in the scan
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await set_vector_search_params(conn, settings.vector_hnsw_ef_search, settings.vector_ivfflat_probes)
+            rows = await conn.fetch(
+                "SELECT * FROM search_documents($1, $2, $3, $4, $5)",
+                query_embedding, match_count, min_similarity, collection, _document_uuids(document_ids)
+            )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def hybrid_search_documents(
+    query_text: str,
+    query_embedding: List[float],
+    match_count: int,
+    min_similarity: Optional[float] = None,
+    collection: Optional[str] = None,
+    document_ids: Optional[List[str]] = None
+) -> List[dict]:
+    """Lexical + vector search fused with reciprocal rank fusion in the database"""
+    candidate_count = settings.hybrid_candidate_count
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # HNSW returns at most ef_search rows, so it must cover the candidate list
+            await set_vector_search_params(
+                conn,
+                max(settings.vector_hnsw_ef_search, candidate_count),
+                settings.vector_ivfflat_probes
+            )
+            rows = await conn.fetch(
+                "SELECT * FROM hybrid_search_documents($1, $2, $3, $4, $5, $6, $7, $8)",
+                query_text, query_embedding, match_count, candidate_count, settings.hybrid_rrf_k,
+                min_similarity, collection, _document_uuids(document_ids)
+            )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def lexical_search_documents(
+    query_text: str,
+    match_count: int,
+    collection: Optional[str] = None,
+    document_ids: Optional[List[str]] = None
+) -> List[dict]:
+    """Full-text ranked chunks (the lexical half of hybrid search)"""
+    pool = await get_db_pool()
+    rows = await pool.fetch(
+        "SELECT * FROM lexical_search_documents($1, $2, $3, $4)",
+        query_text, match_count, collection, _document_uuids(document_ids)
+    )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def list_searchable_documents() -> Dict[str, dict]:
+    """
+    Completed documents with their chunk count and a fingerprint of their
+    chunk ids (changes whenever the document is reprocessed), keyed by id
+    """
+    pool = await get_db_pool()
+    rows = await pool.fetch(
+        """
+        SELECT d.id, d.filename, d.collection, count(c.id) AS chunk_count,
+               md5(string_agg(c.id::text, ',' ORDER BY c.id)) AS fingerprint
+        FROM pdf_documents d
+        JOIN document_chunks c ON c.document_id = d.id
+        WHERE d.status = 'completed'
+        GROUP BY d.id, d.filename, d.collection
+        """
+    )
+    return {str(row["id"]): _record_to_dict(row) for row in rows}
+
+
+async def get_searchable_document(document_id: str) -> Optional[dict]:
+    """One completed document's chunk count and fingerprint (as in list_searchable_documents)"""
+    pool = await get_db_pool()
+    row = await pool.fetchrow(
+        """
+        SELECT d.id, d.filename, d.collection, count(c.id) AS chunk_count,
+               md5(string_agg(c.id::text, ',' ORDER BY c.id)) AS fingerprint
+        FROM pdf_documents d
+        JOIN document_chunks c ON c.document_id = d.id
+        WHERE d.id = $1 AND d.status = 'completed'
+        GROUP BY d.id, d.filename, d.collection
+        """,
+        document_id
+    )
+    return _record_to_dict(row) if row else None
+
+
+async def get_searchable_chunks(document_id: str) -> List[dict]:
+    """All chunks of a completed document, with embeddings, for the local index"""
+    pool = await get_db_pool()
+    rows = await pool.fetch(
+        """
+        SELECT c.id, c.chunk_text, c.page_number, c.embedding
+        FROM document_chunks c
+        JOIN pdf_documents d ON c.document_id = d.id
+        WHERE c.document_id = $1 AND d.status = 'completed'
+        ORDER BY c.id
+        """,
+        document_id
+    )
+    return [_record_to_dict(row) for row in rows]
+
+
+async def get_chunk_texts(chunk_ids: List[str]) -> Dict[str, str]:
+    """chunk_text by chunk id (the local index keeps only ids and vectors on disk)"""
+    pool = await get_db_pool()
+    rows = await pool.fetch(
+        "SELECT id, chunk_text FROM document_chunks WHERE id = ANY($1::uuid[])",
+        [uuid.UUID(chunk_id) for chunk_id in chunk_ids]
+    )
+    return {str(row["id"]): row["chunk_text"] for row in rows}
+
+
+# ---------------------------------------------------------------------------
+# Query embedding cache (persistent tier)
+# ---------------------------------------------------------------------------
+
+async def get_cached_query_embedding(cache_key: str, ttl_seconds: int) -> Optional[List[float]]:
+    pool = await get_db_pool()
+    embedding = await pool.fetchval(
+        """
+        SELECT embedding FROM query_embedding_cache
+        WHERE cache_key = $1 AND created_at > NOW() - make_interval(secs => $2)
+        """,
+        cache_key, ttl_seconds
+    )
+    return embedding.tolist() if embedding is not None else None
+
+
+async def put_cached_query_embedding(cache_key: str, model: str, embedding: List[float]):
+    pool = await get_db_pool()
+    await pool.execute(
+        """
+        INSERT INTO query_embedding_cache (cache_key, model, embedding)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (cache_key) DO UPDATE
+        SET embedding = EXCLUDED.embedding, created_at = NOW()
+        """,
+        cache_key, model, embedding
+    )
+
+
+async def purge_query_embedding_cache(ttl_seconds: int) -> int:
+    """Delete expired cache rows and return how many were removed"""
+    pool = await get_db_pool()
+    result = await pool.execute(
+        "DELETE FROM query_embedding_cache WHERE created_at <= NOW() - make_interval(secs => $1)",
+        ttl_seconds
+    )
+    return int(result.split()[-1])
+
+
+# ---------------------------------------------------------------------------
+# Chunk embedding store (content-hash keyed)
+# ---------------------------------------------------------------------------
+
+async def get_stored_embeddings(content_hashes: List[str], model: str) -> Dict[str, List[float]]:
+    """Look up stored embeddings for the given chunk hashes"""
+    pool = await get_db_pool()
+    rows = await pool.fetch(
+        """
+        SELECT content_hash, embedding FROM chunk_embedding_store
+        WHERE model = $1 AND content_hash = ANY($2::text[])
+        """,
+        model, content_hashes
+    )
+    return {row["content_hash"]: row["embedding"].tolist() for row in rows}
+
+
+async def put_stored_embeddings(model: str, embeddings: Dict[str, List[float]]):
+    """Record embeddings by chunk hash (existing entries are left alone)"""
+    pool = await get_db_pool()
+    await pool.executemany(
+        """
+        INSERT INTO chunk_embedding_store (content_hash, model, embedding)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (content_hash, model) DO NOTHING
+        """,
+        [(content_hash, model, embedding) for content_hash, embedding in embeddings.items()]
+    )
+
+
+async def purge_stored_embeddings(model: str, ttl_seconds: int) -> int:
+    """Delete stored embeddings of other models or older than the TTL; returns how many were removed"""
+    pool = await get_db_pool()
+    result = await pool.execute(
+        """
+        DELETE FROM chunk_embedding_store
+        WHERE model <> $1 OR created_at <= NOW() - make_interval(secs => $2)
+        """,
+        model, ttl_seconds
+    )
+    return int(result.split()[-1])
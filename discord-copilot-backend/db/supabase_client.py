@@ -1,8 +1,9 @@
 from supabase import create_client, Client
 from config import get_settings
-import psycopg2
-from psycopg2 import pool
+from pgvector.asyncpg import register_vector
 from typing import Optional
+import asyncio
+import asyncpg
 
 settings = get_settings()
 
@@ -10,7 +11,7 @@ settings = get_settings()
 class SupabaseClient:
     """Singleton Supabase client for API operations"""
     _instance: Optional[Client] = None
-    
+
     @classmethod
     def get_client(cls) -> Client:
         if cls._instance is None:
@@ -22,41 +23,48 @@ class SupabaseClient:
 
 
 class PostgresPool:
-    """PostgreSQL connection pool for direct database operations (RAG, vectors)"""
-    _pool: Optional[pool.SimpleConnectionPool] = None
-    
+    """Async PostgreSQL connection pool for direct database operations (RAG, vectors)"""
+    _pool: Optional[asyncpg.Pool] = None
+    _lock = asyncio.Lock()
+
+    @staticmethod
+    async def _init_connection(conn: asyncpg.Connection):
+        """Register pgvector codec so embeddings round-trip as arrays"""
+        await register_vector(conn)
+
     @classmethod
-    def get_pool(cls) -> pool.SimpleConnectionPool:
-        if cls._pool is None:
-            cls._pool = pool.SimpleConnectionPool(
-                minconn=1,
-                maxconn=10,
-                dsn=settings.database_url
-            )
+    async def open(cls) -> asyncpg.Pool:
+        """Create the pool (called once at startup)"""
+        async with cls._lock:
+            if cls._pool is None:
+                cls._pool = await asyncpg.create_pool(
+                    dsn=settings.database_url,
+                    min_size=settings.db_pool_min_size,
+                    max_size=settings.db_pool_max_size,
+                    statement_cache_size=settings.db_statement_cache_size,
+                    command_timeout=settings.db_command_timeout,
+                    init=cls._init_connection
+                )
         return cls._pool
-    
+
     @classmethod
-    def get_connection(cls):
-        """Get a connection from the pool"""
-        return cls.get_pool().getconn()
-    
+    async def close(cls):
+        """Close the pool (called on shutdown)"""
+        if cls._pool is not None:
+            await cls._pool.close()
+            cls._pool = None
+
     @classmethod
-    def return_connection(cls, conn):
-        """Return a connection to the pool"""
-        cls.get_pool().putconn(conn)
+    async def get_pool(cls) -> asyncpg.Pool:
+        return cls._pool or await cls.open()
 
 
 # Convenience functions
 def get_supabase() -> Client:
-    """Get Supabase client instance"""
+    """Get Supabase client instance (used for Storage only)"""
     return SupabaseClient.get_client()
 
 
-def get_db_connection():
-    """Get PostgreSQL connection from pool"""
-    return PostgresPool.get_connection()
-
-
-def return_db_connection(conn):
-    """Return PostgreSQL connection to pool"""
-    PostgresPool.return_connection(conn)
+async def get_db_pool() -> asyncpg.Pool:
+    """Get the async PostgreSQL pool"""
+    return await PostgresPool.get_pool()
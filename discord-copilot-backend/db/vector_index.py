@@ -0,0 +1,177 @@
+"""
+Vector index maintenance for document_chunks.embedding.
+
+Usage (from discord-copilot-backend/):
+    python -m db.vector_index status
+    python -m db.vector_index ensure            # rebuild only if method/size is off
+    python -m db.vector_index rebuild [--method hnsw|ivfflat|auto] [--lists N]
+
+Rebuilds use CREATE INDEX CONCURRENTLY under a temporary name and then swap
+it in, so searches keep working throughout. They run on a dedicated
+connection with no command timeout (a large build takes far longer than
+db_command_timeout) and vector_index_maintenance_work_mem for the session.
+"""
+from db.supabase_client import PostgresPool, get_db_pool
+from config import get_settings
+from typing import Optional
+import argparse
+import asyncio
+import asyncpg
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+INDEX_NAME = "document_chunks_embedding_idx"
+BUILD_NAME = f"{INDEX_NAME}_new"
+
+
+def ivfflat_lists_for(row_count: int) -> int:
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond"""
+    if row_count <= 1_000_000:
+        return max(10, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+async def pgvector_version(conn) -> tuple:
+    """Installed pgvector version as a tuple, (0,) if the extension is missing"""
+    version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    return tuple(int(part) for part in re.findall(r"\d+", version or "0"))
+
+
+async def resolve_method(conn, method: str) -> str:
+    """Map 'auto' to HNSW when pgvector supports it (0.5.0+), else IVFFlat"""
+    if method != "auto":
+        return method
+    return "hnsw" if await pgvector_version(conn) >= (0, 5, 0) else "ivfflat"
+
+
+async def get_status() -> dict:
+    """Describe the current index and corpus size"""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        row_count = await conn.fetchval("SELECT count(*) FROM document_chunks")
+        index = await conn.fetchrow(
+            """
+            SELECT am.amname AS method, pg_get_indexdef(i.indexrelid) AS definition,
+                   pg_relation_size(i.indexrelid) AS size_bytes, i.indisvalid AS valid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE c.relname = $1
+            """,
+            INDEX_NAME
+        )
+
+    status = {"row_count": row_count, "index": dict(index) if index else None}
+    if index and index["method"] == "ivfflat":
+        match = re.search(r"lists\s*=\s*'?(\d+)", index["definition"])
+        status["index"]["lists"] = int(match.group(1)) if match else 100  # pgvector default
+    return status
+
+
+def _index_sql(name: str, method: str, lists: Optional[int]) -> str:
+    if method == "hnsw":
+        options = f"m = {settings.vector_hnsw_m}, ef_construction = {settings.vector_hnsw_ef_construction}"
+    elif method == "ivfflat":
+        options = f"lists = {lists}"
+    else:
+        raise ValueError(f"Unknown index method: {method}")
+
+    return (
+        f"CREATE INDEX CONCURRENTLY {name} ON document_chunks "
+        f"USING {method} (embedding vector_cosine_ops) WITH ({options})"
+    )
+
+
+async def rebuild(method: str = "auto", lists: Optional[int] = None):
+    """Build a new index concurrently, then swap it in for the old one"""
+    # Not a pool connection: the pool's command_timeout would cancel the build
+    conn = await asyncpg.connect(
+        dsn=settings.database_url,
+        statement_cache_size=settings.db_statement_cache_size,
+        command_timeout=None
+    )
+    try:
+        await conn.execute(
+            "SELECT set_config('maintenance_work_mem', $1, false)",
+            settings.vector_index_maintenance_work_mem
+        )
+        method = await resolve_method(conn, method)
+        if method == "ivfflat" and lists is None:
+            lists = ivfflat_lists_for(await conn.fetchval("SELECT count(*) FROM document_chunks"))
+
+        # A failed concurrent build leaves an invalid index behind
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {BUILD_NAME}")
+
+        logger.info(f"Building {method} index{f' with lists={lists}' if lists else ''}...")
+        await conn.execute(_index_sql(BUILD_NAME, method, lists))
+
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+        await conn.execute(f"ALTER INDEX {BUILD_NAME} RENAME TO {INDEX_NAME}")
+        logger.info(f"✅ {INDEX_NAME} rebuilt using {method}")
+    finally:
+        await conn.close()
+
+
+async def ensure(method: str = "auto") -> bool:
+    """
+    Rebuild the index if it is missing, invalid, uses a different method, or
+    is an IVFFlat index whose lists are off by more than 2x for the row count.
+    Returns True if a rebuild happened.
+    """
+    status = await get_status()
+    index = status["index"]
+
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        method = await resolve_method(conn, method)
+
+    reason = None
+    if index is None or not index["valid"]:
+        reason = "index missing or invalid"
+    elif index["method"] != method:
+        reason = f"method is {index['method']}, want {method}"
+    elif method == "ivfflat":
+        target = ivfflat_lists_for(status["row_count"])
+        if not target / 2 <= index["lists"] <= target * 2:
+            reason = f"lists is {index['lists']}, want ~{target} for {status['row_count']} rows"
+
+    if reason is None:
+        logger.info(f"{INDEX_NAME} is up to date ({index['method']}, {status['row_count']} rows)")
+        return False
+
+    logger.info(f"Rebuilding {INDEX_NAME}: {reason}")
+    await rebuild(method)
+    return True
+
+
+async def _main(args):
+    try:
+        if args.command == "status":
+            status = await get_status()
+            print(f"rows: {status['row_count']}")
+            print(f"index: {status['index']}")
+        elif args.command == "ensure":
+            await ensure(args.method)
+        elif args.command == "rebuild":
+            await rebuild(args.method, args.lists)
+    finally:
+        await PostgresPool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "ensure", "rebuild"])
+    parser.add_argument("--method", choices=["auto", "hnsw", "ivfflat"], default=settings.vector_index_method)
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlat lists (default: sized to row count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
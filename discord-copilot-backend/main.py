@@ -1,11 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import asyncio
 import logging
 
 from api.routes import instructions, memory, channels, knowledge, bot_query
-from bot.discord_bot import start_bot
+from api.middleware.upload_limit import UploadSizeLimitMiddleware
+from bot.discord_bot import bot, start_bot
+from config import get_settings
+from db.listener import notification_listener
+from db.supabase_client import PostgresPool
+from db import repository
+from services.openrouter import OpenRouterClient
+from services.config_cache import config_cache
+from services.local_vector_index import local_vector_index
+from services.answer_cache import answer_cache
+from services.pdf_processor import shutdown_pdf_executor
+from services.tokenizer import load_encoding
 
 # Configure logging
 logging.basicConfig(
@@ -13,24 +25,55 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown"""
-    # Startup: Start Discord bot in background
+    # Startup: Open the async database pool before anything queries it
+    await PostgresPool.open()
+    
+    # Only send the vector search settings the installed pgvector supports
+    await repository.check_vector_features()
+    
+    # Load the tokenizer off the event loop (a cold cache downloads it)
+    await asyncio.to_thread(load_encoding)
+    
+    # One OpenRouter client (and connection pool) for chat and embeddings
+    OpenRouterClient.open()
+    
+    # Keep the config cache in sync with admin edits made on other replicas
+    config_cache.start_listener()
+    
+    # Load the in-process vector index replica (searches use the RPC until it is ready)
+    if settings.local_vector_index_enabled:
+        local_vector_index.start()
+    
+    # Drop cached answers whenever knowledge or config changes
+    if settings.answer_cache_enabled:
+        answer_cache.start()
+    
+    # Start Discord bot in background
     logger.info("Starting Discord bot...")
     bot_task = asyncio.create_task(start_bot())
     
     yield
     
-    # Shutdown: Cancel bot task
+    # Shutdown: Close the bot (flushes queued memory updates), then cancel its task
     logger.info("Shutting down Discord bot...")
+    await bot.close()
     bot_task.cancel()
     try:
         await bot_task
     except asyncio.CancelledError:
         pass
+    
+    await local_vector_index.stop()
+    await notification_listener.stop()
+    shutdown_pdf_executor()
+    await OpenRouterClient.close()
+    await PostgresPool.close()
 
 
 # Create FastAPI app
@@ -41,6 +84,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Refuse oversized uploads before the multipart form is parsed
+# (added first so CORS still wraps its 413 responses)
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -67,6 +114,12 @@ async def health_check():
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (per-stage latency histograms, counters, queue gauges)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
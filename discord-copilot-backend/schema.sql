@@ -20,9 +20,14 @@ CREATE TABLE IF NOT EXISTS pdf_documents (
   file_size INTEGER,
   upload_date TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
   uploaded_by UUID REFERENCES auth.users(id),
-  status TEXT DEFAULT 'processing' -- processing, completed, failed
+  status TEXT DEFAULT 'processing', -- processing, completed, failed
+  content_hash TEXT, -- sha256 of the uploaded file
+  collection TEXT NOT NULL DEFAULT 'default' -- Knowledge collection (channels can be scoped to one)
 );
 
+ALTER TABLE pdf_documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE pdf_documents ADD COLUMN IF NOT EXISTS collection TEXT NOT NULL DEFAULT 'default';
+
 -- Document Chunks Table (for RAG)
 CREATE TABLE IF NOT EXISTS document_chunks (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -31,30 +36,135 @@ CREATE TABLE IF NOT EXISTS document_chunks (
   chunk_index INTEGER,
   page_number INTEGER,
   embedding vector(1536), -- Dimension for OpenAI text-embedding-3-small
+  chunk_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', chunk_text)) STORED, -- Lexical half of hybrid search
+  collection TEXT NOT NULL DEFAULT 'default', -- Copied from pdf_documents so filters apply inside the index scan
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS collection TEXT NOT NULL DEFAULT 'default';
+
+CREATE INDEX IF NOT EXISTS document_chunks_collection_idx
+ON document_chunks (collection);
+
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS chunk_tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('english', chunk_text)) STORED;
+
+CREATE INDEX IF NOT EXISTS document_chunks_tsv_idx
+ON document_chunks USING gin (chunk_tsv);
+
 -- Create index for vector similarity search
-CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx 
-ON document_chunks USING ivfflat (embedding vector_cosine_ops);
+-- HNSW needs no training data, so it is safe to create on an empty table.
+-- Use `python -m db.vector_index ensure` to switch method or resize an
+-- IVFFlat index (lists sized to row count) as the corpus grows.
+CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx
+ON document_chunks USING hnsw (embedding vector_cosine_ops);
 
 -- Conversation Memory Table
+-- One row per conversation, keyed by Discord guild + channel
+-- ('' / '' is the unscoped row kept from single-row deployments)
 CREATE TABLE IF NOT EXISTS conversation_memory (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  guild_id TEXT NOT NULL DEFAULT '',
+  channel_id TEXT NOT NULL DEFAULT '',
   summary TEXT,
   last_updated TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
   message_count INTEGER DEFAULT 0
 );
 
+-- Upgrade single-row deployments in place
+ALTER TABLE conversation_memory ADD COLUMN IF NOT EXISTS guild_id TEXT NOT NULL DEFAULT '';
+ALTER TABLE conversation_memory ADD COLUMN IF NOT EXISTS channel_id TEXT NOT NULL DEFAULT '';
+
+-- Re-running the old seed added a row each time (there was no unique key):
+-- keep only the newest row per conversation so the unique index can be built
+DELETE FROM conversation_memory older
+USING conversation_memory newer
+WHERE older.guild_id = newer.guild_id
+  AND older.channel_id = newer.channel_id
+  AND (COALESCE(older.last_updated, '-infinity'), older.id)
+    < (COALESCE(newer.last_updated, '-infinity'), newer.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS conversation_memory_scope_idx
+ON conversation_memory (guild_id, channel_id);
+
+-- Query Embedding Cache (persistent tier behind the in-memory LRU)
+CREATE TABLE IF NOT EXISTS query_embedding_cache (
+  cache_key TEXT PRIMARY KEY, -- sha256 of model + normalized query text
+  model TEXT NOT NULL,
+  embedding vector(1536) NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS query_embedding_cache_created_at_idx
+ON query_embedding_cache (created_at);
+
+-- Chunk Embedding Store (reuse embeddings for byte-identical chunk text)
+CREATE TABLE IF NOT EXISTS chunk_embedding_store (
+  content_hash TEXT NOT NULL, -- sha256 of the chunk text
+  model TEXT NOT NULL,
+  embedding vector(1536) NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (content_hash, model)
+);
+
+CREATE INDEX IF NOT EXISTS chunk_embedding_store_created_at_idx
+ON chunk_embedding_store (created_at);
+
 -- Allowed Channels Table
 CREATE TABLE IF NOT EXISTS allowed_channels (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
   channel_id TEXT UNIQUE NOT NULL,
   channel_name TEXT,
+  collection TEXT, -- Knowledge collection this channel searches (NULL = all)
   added_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
   added_by UUID REFERENCES auth.users(id)
 );
 
+ALTER TABLE allowed_channels ADD COLUMN IF NOT EXISTS collection TEXT;
+
+-- Notify listening replicas when admin-managed config changes
+-- (payload is the table name so each cache only drops what changed)
+CREATE OR REPLACE FUNCTION notify_config_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM pg_notify('config_changed', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS allowed_channels_config_changed ON allowed_channels;
+CREATE TRIGGER allowed_channels_config_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON allowed_channels
+FOR EACH STATEMENT EXECUTE FUNCTION notify_config_changed();
+
+DROP TRIGGER IF EXISTS system_instructions_config_changed ON system_instructions;
+CREATE TRIGGER system_instructions_config_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON system_instructions
+FOR EACH STATEMENT EXECUTE FUNCTION notify_config_changed();
+
+-- Notify listening replicas when a document becomes searchable or goes away
+-- (payload is the document id; in-process vector indexes resync just that one)
+CREATE OR REPLACE FUNCTION notify_knowledge_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    PERFORM pg_notify('knowledge_changed', OLD.id::text);
+  ELSIF NEW.status IS DISTINCT FROM OLD.status THEN
+    PERFORM pg_notify('knowledge_changed', NEW.id::text);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS pdf_documents_knowledge_changed ON pdf_documents;
+CREATE TRIGGER pdf_documents_knowledge_changed
+AFTER UPDATE OF status OR DELETE ON pdf_documents
+FOR EACH ROW EXECUTE FUNCTION notify_knowledge_changed();
+
 -- Insert default system instruction
 INSERT INTO system_instructions (instructions, updated_at)
 VALUES ('You are a helpful Discord assistant. Answer questions clearly and concisely.', NOW())
@@ -65,10 +175,48 @@ INSERT INTO conversation_memory (summary, message_count)
 VALUES ('No conversation history yet.', 0)
 ON CONFLICT DO NOTHING;
 
+-- Atomic upsert for a conversation's memory. With p_increment the message
+-- count is bumped by p_message_count; otherwise it is set to it. Replaces
+-- select-then-update pairs that lost updates under concurrency.
+CREATE OR REPLACE FUNCTION upsert_conversation_memory(
+  p_guild_id text,
+  p_channel_id text,
+  p_summary text,
+  p_message_count int DEFAULT 1,
+  p_increment boolean DEFAULT true
+)
+RETURNS SETOF conversation_memory
+LANGUAGE sql
+AS $$
+  INSERT INTO conversation_memory (guild_id, channel_id, summary, message_count, last_updated)
+  VALUES (p_guild_id, p_channel_id, p_summary, p_message_count, NOW())
+  ON CONFLICT (guild_id, channel_id) DO UPDATE
+  SET summary = EXCLUDED.summary,
+      message_count = CASE
+        WHEN p_increment THEN COALESCE(conversation_memory.message_count, 0) + EXCLUDED.message_count
+        ELSE EXCLUDED.message_count
+      END,
+      last_updated = NOW()
+  RETURNING *;
+$$;
+
+-- Search RPCs filter inside the index scan: collection / document filters and
+-- the similarity floor are part of the WHERE clause, so with
+-- hnsw.iterative_scan (pgvector 0.8+) the scan keeps going until enough
+-- matching rows are found, and only rows worth prompting leave the database.
+-- NULL filter arguments mean "no filter". Drop the pre-filter signatures so
+-- calls with defaulted arguments stay unambiguous.
+DROP FUNCTION IF EXISTS search_documents(vector, int);
+DROP FUNCTION IF EXISTS hybrid_search_documents(text, vector, int, int, int);
+DROP FUNCTION IF EXISTS lexical_search_documents(text, int);
+
 -- RPC function for vector similarity search (callable via REST API)
 CREATE OR REPLACE FUNCTION search_documents(
   query_embedding vector(1536),
-  match_count int DEFAULT 5
+  match_count int DEFAULT 5,
+  min_similarity float DEFAULT NULL,
+  filter_collection text DEFAULT NULL,
+  filter_document_ids uuid[] DEFAULT NULL
 )
 RETURNS TABLE (
   chunk_text text,
@@ -88,7 +236,112 @@ BEGIN
   FROM document_chunks c
   JOIN pdf_documents d ON c.document_id = d.id
   WHERE d.status = 'completed'
+    AND (filter_collection IS NULL OR c.collection = filter_collection)
+    AND (filter_document_ids IS NULL OR c.document_id = ANY(filter_document_ids))
+    AND (min_similarity IS NULL OR c.embedding <=> query_embedding <= 1 - min_similarity)
   ORDER BY c.embedding <=> query_embedding
   LIMIT match_count;
 END;
 $$;
+
+-- Hybrid search: vector and full-text candidates fused with reciprocal rank
+-- fusion (score = sum of 1 / (rrf_k + rank) over both rankings), so exact
+-- identifiers such as error codes and command names surface even when their
+-- embedding is a weak match. lexical_rank is NULL for vector-only hits.
+-- min_similarity applies to vector candidates only; keyword hits always compete.
+CREATE OR REPLACE FUNCTION hybrid_search_documents(
+  query_text text,
+  query_embedding vector(1536),
+  match_count int DEFAULT 5,
+  candidate_count int DEFAULT 40,
+  rrf_k int DEFAULT 60,
+  min_similarity float DEFAULT NULL,
+  filter_collection text DEFAULT NULL,
+  filter_document_ids uuid[] DEFAULT NULL
+)
+RETURNS TABLE (
+  chunk_text text,
+  page_number int,
+  filename text,
+  similarity float,
+  lexical_rank int,
+  score float
+)
+LANGUAGE sql STABLE
+AS $$
+  WITH vector_hits AS (
+    SELECT id, row_number() OVER (ORDER BY distance) AS rank
+    FROM (
+      SELECT c.id, c.embedding <=> query_embedding AS distance
+      FROM document_chunks c
+      JOIN pdf_documents d ON c.document_id = d.id
+      WHERE d.status = 'completed'
+        AND (filter_collection IS NULL OR c.collection = filter_collection)
+        AND (filter_document_ids IS NULL OR c.document_id = ANY(filter_document_ids))
+        AND (min_similarity IS NULL OR c.embedding <=> query_embedding <= 1 - min_similarity)
+      ORDER BY c.embedding <=> query_embedding
+      LIMIT candidate_count
+    ) nearest
+  ),
+  lexical_hits AS (
+    SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank
+    FROM (
+      SELECT c.id, ts_rank_cd(c.chunk_tsv, q) AS text_rank
+      FROM document_chunks c
+      JOIN pdf_documents d ON c.document_id = d.id,
+           websearch_to_tsquery('english', query_text) q
+      WHERE d.status = 'completed' AND c.chunk_tsv @@ q
+        AND (filter_collection IS NULL OR c.collection = filter_collection)
+        AND (filter_document_ids IS NULL OR c.document_id = ANY(filter_document_ids))
+      ORDER BY text_rank DESC
+      LIMIT candidate_count
+    ) matching
+  ),
+  fused AS (
+    SELECT
+      COALESCE(v.id, l.id) AS id,
+      l.rank AS lexical_rank,
+      COALESCE(1.0 / (rrf_k + v.rank), 0) + COALESCE(1.0 / (rrf_k + l.rank), 0) AS score
+    FROM vector_hits v
+    FULL OUTER JOIN lexical_hits l ON v.id = l.id
+  )
+  SELECT
+    c.chunk_text,
+    c.page_number,
+    d.filename,
+    1 - (c.embedding <=> query_embedding) AS similarity,
+    f.lexical_rank::int,
+    f.score::float
+  FROM fused f
+  JOIN document_chunks c ON c.id = f.id
+  JOIN pdf_documents d ON c.document_id = d.id
+  ORDER BY f.score DESC
+  LIMIT match_count;
+$$;
+
+-- Full-text half of hybrid_search_documents, for replicas that run the
+-- vector half against their in-process index and fuse locally
+CREATE OR REPLACE FUNCTION lexical_search_documents(
+  query_text text,
+  match_count int DEFAULT 40,
+  filter_collection text DEFAULT NULL,
+  filter_document_ids uuid[] DEFAULT NULL
+)
+RETURNS TABLE (
+  id uuid,
+  chunk_text text,
+  page_number int,
+  filename text
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT c.id, c.chunk_text, c.page_number, d.filename
+  FROM document_chunks c
+  JOIN pdf_documents d ON c.document_id = d.id,
+       websearch_to_tsquery('english', query_text) q
+  WHERE d.status = 'completed' AND c.chunk_tsv @@ q
+    AND (filter_collection IS NULL OR c.collection = filter_collection)
+    AND (filter_document_ids IS NULL OR c.document_id = ANY(filter_document_ids))
+  ORDER BY ts_rank_cd(c.chunk_tsv, q) DESC
+  LIMIT match_count;
+$$;
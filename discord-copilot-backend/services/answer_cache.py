@@ -0,0 +1,152 @@
+from db.listener import notification_listener
+from services.config_cache import CONFIG_CHANNEL
+from services.local_vector_index import KNOWLEDGE_CHANNEL
+from config import get_settings
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray  # Unit-normalized query embedding
+    query: str
+    answer: str
+    version: tuple
+    created_at: float
+
+
+class AnswerCache:
+    """
+    Semantic cache of bot answers, per channel.
+
+    A new question is answered from the cache when its embedding is within
+    the similarity threshold of an earlier question in the same channel. The
+    answer must also have been produced under the same version: the same
+    system instructions and the same knowledge-base revision. The revision
+    is bumped locally when ingestion completes or a document is reprocessed
+    or deleted, and by knowledge_changed notifications for changes made on
+    other replicas.
+    Allow-list changes clear the cache outright.
+    """
+
+    def __init__(self, threshold: float, max_entries_per_channel: int, ttl_seconds: int):
+        self.threshold = threshold
+        self.max_entries = max_entries_per_channel
+        self.ttl_seconds = ttl_seconds
+        self._channels: Dict[str, "OrderedDict[int, _Entry]"] = {}
+        self._matrices: Dict[str, tuple] = {}  # channel_id -> (keys, stacked embeddings), rebuilt on change
+        self._next_key = 0
+        self._kb_revision = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, instructions: str) -> tuple:
+        """Version an answer depends on: active instructions and knowledge-base revision"""
+        return (hashlib.sha256(instructions.encode("utf-8")).hexdigest(), self._kb_revision)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _matrix(self, channel_id: str, entries: "OrderedDict[int, _Entry]") -> tuple:
+        cached = self._matrices.get(channel_id)
+        if cached is None:
+            keys = list(entries)
+            cached = (keys, np.stack([entries[key].embedding for key in keys]))
+            self._matrices[channel_id] = cached
+        return cached
+
+    def get(self, channel_id: str, query_embedding: List[float], version: tuple) -> Optional[str]:
+        """Cached answer for a near-duplicate question in this channel, if any"""
+        entries = self._channels.get(channel_id)
+        if not entries:
+            self.misses += 1
+            return None
+
+        keys, matrix = self._matrix(channel_id, entries)
+        scores = matrix @ self._normalize(query_embedding)
+
+        now = time.monotonic()
+        for i in np.argsort(-scores):
+            if scores[i] < self.threshold:
+                break
+            entry = entries[keys[i]]
+            if entry.version == version and now - entry.created_at <= self.ttl_seconds:
+                entries.move_to_end(keys[i])
+                self.hits += 1
+                logger.info(f"Answer cache hit in channel {channel_id} (similarity {scores[i]:.3f}, cached query: {entry.query[:50]})")
+                return entry.answer
+
+        self.misses += 1
+        return None
+
+    def put(self, channel_id: str, query: str, query_embedding: List[float], answer: str, version: tuple):
+        """
+        Cache an answer under the version taken before it was generated, so an
+        answer that raced a knowledge or instructions change is never served
+        """
+        entries = self._channels.setdefault(channel_id, OrderedDict())
+        self._next_key += 1
+        entries[self._next_key] = _Entry(
+            embedding=self._normalize(query_embedding),
+            query=query,
+            answer=answer,
+            version=version,
+            created_at=time.monotonic()
+        )
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._matrices.pop(channel_id, None)
+
+    def bump_knowledge_revision(self):
+        """Knowledge changed: answers produced before now no longer match the version"""
+        self._kb_revision += 1
+        # Entries from older revisions can never hit again
+        self.clear()
+
+    def clear(self):
+        self._channels.clear()
+        self._matrices.clear()
+
+    def _on_knowledge_changed(self, payload: str):
+        self.bump_knowledge_revision()
+
+    def _on_config_changed(self, payload: str):
+        # Instruction edits already change the version; allow-list and collection
+        # changes don't, and either way old entries are dead weight
+        self.clear()
+
+    def start(self):
+        """Subscribe to knowledge and config notifications on the shared LISTEN connection"""
+        notification_listener.subscribe(KNOWLEDGE_CHANNEL, self._on_knowledge_changed, on_reconnect=self.bump_knowledge_revision)
+        notification_listener.subscribe(CONFIG_CHANNEL, self._on_config_changed)
+        notification_listener.start()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "channels": len(self._channels),
+            "entries": sum(len(entries) for entries in self._channels.values()),
+            "knowledge_revision": self._kb_revision
+        }
+
+
+# Global answer cache instance
+answer_cache = AnswerCache(
+    threshold=settings.answer_cache_threshold,
+    max_entries_per_channel=settings.answer_cache_max_entries,
+    ttl_seconds=settings.answer_cache_ttl_seconds
+)
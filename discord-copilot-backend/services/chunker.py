@@ -0,0 +1,131 @@
+"""
+Token-aware streaming chunker.
+
+Text is broken into units at the coarsest boundary that fits the chunk size
+(paragraph, then sentence, then word, then raw tokens for unbroken runs
+such as base64 or long URLs). Units are packed into chunks of at most
+chunk_size tokens. Each chunk starts with the trailing units of the previous
+one (up to overlap tokens). Every unit enters and leaves the window once, so
+the whole pass is linear in the input.
+
+A unit is measured both on its own (as the head of a chunk) and as joined
+after the separator before it: with cl100k a leading space can add a token
+(" 123" is two tokens, "123" one), so bare counts would undercount chunks
+of numbers or symbols.
+
+Chunks may span pages; a chunk's page_number is the page it starts on.
+"""
+from services.tokenizer import count_tokens, get_encoding
+from collections import deque
+from typing import Iterable, Iterator, NamedTuple, Tuple
+import re
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+PARAGRAPH_SEPARATOR = "\n\n"
+
+
+class _Unit(NamedTuple):
+    text: str
+    tokens: int  # On its own, as the first unit of a chunk
+    joined_tokens: int  # After the separator _join puts before it
+    page_number: int
+    starts_paragraph: bool
+
+
+def _split_tokens(text: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """Last resort for a single 'word' longer than a chunk: cut it at token boundaries"""
+    encoding = get_encoding()
+    tokens = encoding.encode(text, disallowed_special=())
+    for start in range(0, len(tokens), max_tokens):
+        piece = tokens[start:start + max_tokens]
+        yield encoding.decode(piece), len(piece)
+
+
+def _split_words(sentence: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    for word in sentence.split(" "):
+        tokens = count_tokens(word)
+        if tokens <= max_tokens:
+            yield word, tokens
+        else:
+            yield from _split_tokens(word, max_tokens)
+
+
+def _unit(text: str, tokens: int, page_number: int, starts_paragraph: bool) -> _Unit:
+    separator = PARAGRAPH_SEPARATOR if starts_paragraph else " "
+    joined_tokens = count_tokens(separator + text)
+    return _Unit(text, tokens, joined_tokens, page_number, starts_paragraph)
+
+
+def _units(pages: Iterable[Tuple[int, str]], max_tokens: int) -> Iterator[_Unit]:
+    """Split pages into units no larger than max_tokens, coarsest boundary first"""
+    for page_number, page_text in pages:
+        for paragraph in PARAGRAPH_BREAK.split(page_text):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+
+            starts_paragraph = True
+            tokens = count_tokens(paragraph)
+            if tokens <= max_tokens:
+                yield _unit(paragraph, tokens, page_number, starts_paragraph)
+                continue
+
+            for sentence in SENTENCE_END.split(paragraph):
+                tokens = count_tokens(sentence)
+                if tokens <= max_tokens:
+                    pieces = [(sentence, tokens)]
+                else:
+                    pieces = _split_words(sentence, max_tokens)
+
+                for text, tokens in pieces:
+                    yield _unit(text, tokens, page_number, starts_paragraph)
+                    starts_paragraph = False
+
+
+def _join(window: Iterable[_Unit]) -> str:
+    parts = []
+    for unit in window:
+        if parts:
+            parts.append(PARAGRAPH_SEPARATOR if unit.starts_paragraph else " ")
+        parts.append(unit.text)
+    return "".join(parts)
+
+
+def _cost(unit: _Unit, window_empty: bool) -> int:
+    """Tokens a unit adds to a window, counting the separator before it"""
+    return unit.tokens if window_empty else unit.joined_tokens
+
+
+def iter_chunks(pages: Iterable[Tuple[int, str]], chunk_size: int = 600, overlap: int = 100) -> Iterator[dict]:
+    """
+    Yield {"text", "page_number"} chunks of at most chunk_size tokens from
+    (page_number, text) pairs, consecutive chunks sharing up to overlap tokens
+    """
+    overlap = min(overlap, chunk_size // 2)
+    window = deque()
+    window_tokens = 0
+    emitted = True  # Whether the current window contents were already yielded
+
+    for unit in _units(pages, chunk_size):
+        if window and window_tokens + _cost(unit, False) > chunk_size:
+            if not emitted:
+                yield {"text": _join(window), "page_number": window[0].page_number}
+
+            # Keep the tail as overlap, and make room for the incoming unit
+            while window and (
+                window_tokens > overlap
+                or window_tokens + _cost(unit, False) > chunk_size
+            ):
+                window_tokens -= window.popleft().tokens
+                if window:
+                    head = window[0]
+                    window_tokens -= head.joined_tokens - head.tokens  # The new head has no separator before it
+
+        window_tokens += _cost(unit, not window)
+        window.append(unit)
+        emitted = False
+
+    if window and not emitted:
+        yield {"text": _join(window), "page_number": window[0].page_number}
@@ -0,0 +1,107 @@
+from db import repository
+from db.listener import notification_listener
+from config import get_settings
+from typing import Dict, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DEFAULT_INSTRUCTIONS = "You are a helpful Discord assistant."
+
+# Postgres NOTIFY channel fired by the triggers in schema.sql
+CONFIG_CHANNEL = "config_changed"
+
+
+class ConfigCache:
+    """
+    In-process snapshot of the channel allow-list (with each channel's
+    knowledge collection) and the active system instructions.
+
+    Snapshots are loaded lazily and dropped whenever an admin write happens,
+    either locally (routes call invalidate) or on another replica (Postgres
+    LISTEN/NOTIFY on the config_changed channel).
+    """
+
+    def __init__(self):
+        self._channels: Optional[Dict[str, Optional[str]]] = None  # channel_id -> collection
+        self._instructions: Optional[str] = None
+        # Bumped on every invalidation so a load that raced a write is discarded
+        self._channels_generation = 0
+        self._instructions_generation = 0
+        self._lock = asyncio.Lock()
+
+    async def is_channel_allowed(self, channel_id: str) -> bool:
+        """Check the allow-list snapshot (no round trip once loaded)"""
+        channels = self._channels
+        if channels is None:
+            channels = await self._load_channels()
+        return channel_id in channels
+
+    async def get_channel_collection(self, channel_id: str) -> Optional[str]:
+        """Knowledge collection a channel is scoped to (None = search everything)"""
+        channels = self._channels
+        if channels is None:
+            channels = await self._load_channels()
+        return channels.get(channel_id)
+
+    async def get_instructions(self) -> str:
+        """Get the active system instructions from the snapshot"""
+        instructions = self._instructions
+        if instructions is None:
+            instructions = await self._load_instructions()
+        return instructions
+
+    async def _load_channels(self) -> Dict[str, Optional[str]]:
+        async with self._lock:
+            if self._channels is not None:
+                return self._channels
+            generation = self._channels_generation
+            channels = await repository.get_channel_collections()
+            if generation == self._channels_generation:
+                self._channels = channels
+            return channels
+
+    async def _load_instructions(self) -> str:
+        async with self._lock:
+            if self._instructions is not None:
+                return self._instructions
+            generation = self._instructions_generation
+            row = await repository.get_latest_instructions()
+            instructions = row["instructions"] if row else DEFAULT_INSTRUCTIONS
+            if generation == self._instructions_generation:
+                self._instructions = instructions
+            return instructions
+
+    def invalidate_channels(self):
+        self._channels_generation += 1
+        self._channels = None
+
+    def invalidate_instructions(self):
+        self._instructions_generation += 1
+        self._instructions = None
+
+    def invalidate(self, table: Optional[str] = None):
+        """Drop the snapshot for one table, or everything when table is None"""
+        if table in (None, "allowed_channels"):
+            self.invalidate_channels()
+        if table in (None, "system_instructions"):
+            self.invalidate_instructions()
+
+    # ------------------------------------------------------------------
+    # Cross-replica invalidation via LISTEN/NOTIFY
+    # ------------------------------------------------------------------
+
+    def _on_notify(self, payload: str):
+        logger.info(f"Config change notification received for {payload or 'all tables'}")
+        self.invalidate(payload or None)
+
+    def start_listener(self):
+        """Subscribe to config_changed on the shared LISTEN connection"""
+        notification_listener.subscribe(CONFIG_CHANNEL, self._on_notify, on_reconnect=self.invalidate)
+        notification_listener.start()
+
+
+# Global config cache instance
+config_cache = ConfigCache()
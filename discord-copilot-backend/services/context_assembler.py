@@ -0,0 +1,92 @@
+from db import repository
+from services.config_cache import config_cache
+from services.rag_service import search_knowledge
+from services.metrics import bot_metrics
+from config import get_settings
+from typing import List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DEFAULT_MEMORY = "No conversation history yet."
+
+
+class ContextAssembler:
+    """
+    Builds the LLM context for a query: allow-list gate, system instructions,
+    the conversation's memory (per guild/channel) and knowledge search.
+
+    Shared by the Discord bot and /api/bot/query. After the gate, the
+    independent fetches run concurrently, so latency is that of the slowest
+    stage rather than the sum. Per-stage timings (ms) are returned alongside.
+    """
+
+    async def _timed(self, timings: dict, stage: str, coro):
+        started = time.perf_counter()
+        try:
+            with bot_metrics.stage(stage):
+                return await coro
+        finally:
+            timings[stage] = (time.perf_counter() - started) * 1000
+
+    async def _get_memory(self, guild_id: str, channel_id: str) -> str:
+        memory = await repository.get_memory(guild_id, channel_id)
+        if memory and memory["summary"]:
+            return memory["summary"]
+        return DEFAULT_MEMORY
+
+    async def assemble(
+        self,
+        query: str,
+        channel_id: str,
+        guild_id: str = "",
+        document_ids: Optional[List[str]] = None
+    ) -> dict:
+        timings = {}
+        started = time.perf_counter()
+
+        # 1. Allow-list gate (in-memory, so disallowed channels cost nothing)
+        is_allowed = await self._timed(timings, "allow_list", config_cache.is_channel_allowed(channel_id))
+
+        if not is_allowed:
+            timings["total"] = (time.perf_counter() - started) * 1000
+            return {
+                "system_instructions": "",
+                "conversation_memory": "",
+                "relevant_knowledge": [],
+                "is_allowed_channel": False,
+                "timings": timings
+            }
+
+        # 2. Instructions, memory and embed-plus-search (scoped to the channel's collection) in parallel
+        collection = await config_cache.get_channel_collection(channel_id)
+        system_instructions, conversation_memory, knowledge_chunks = await asyncio.gather(
+            self._timed(timings, "instructions", config_cache.get_instructions()),
+            self._timed(timings, "memory", self._get_memory(guild_id, channel_id)),
+            self._timed(timings, "knowledge", search_knowledge(
+                query,
+                settings.top_k_retrieval,
+                timings,
+                collection=collection,
+                document_ids=document_ids
+            ))
+        )
+
+        timings["total"] = (time.perf_counter() - started) * 1000
+        stages = ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in timings.items() if stage != "total")
+        logger.info(f"Context assembled in {timings['total']:.1f}ms ({stages})")
+
+        return {
+            "system_instructions": system_instructions,
+            "conversation_memory": conversation_memory,
+            "relevant_knowledge": knowledge_chunks,
+            "is_allowed_channel": True,
+            "timings": timings
+        }
+
+
+# Global context assembler instance
+context_assembler = ContextAssembler()
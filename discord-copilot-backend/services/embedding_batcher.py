@@ -0,0 +1,105 @@
+from services.rag_service import generate_embeddings
+from services.llm_scheduler import Priority, SchedulerBusy
+from services.tokenizer import count_tokens
+from config import get_settings
+from typing import Awaitable, Callable, List, Optional
+import openai
+import asyncio
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Provider errors worth retrying; anything else (bad request, auth) fails fast
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    SchedulerBusy,  # Evicted from the provider queue by interactive traffic
+)
+
+BatchCallback = Callable[[List[int], List[List[float]]], Awaitable[None]]
+
+
+class EmbeddingBatcher:
+    """
+    Embeds many texts by packing them into provider-sized batches.
+
+    Batches are bounded by total tokens and item count, a limited number run
+    concurrently, and transient failures are retried with exponential backoff.
+    on_batch_done is awaited as each batch finishes so callers can persist
+    progress and resume instead of re-embedding from scratch.
+    """
+
+    def __init__(self, max_batch_tokens: int, max_batch_items: int, concurrency: int, max_retries: int, retry_base_delay: float):
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+    def pack(self, texts: List[str]) -> List[List[int]]:
+        """Group text indexes into batches that respect the token and item limits"""
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for index, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_items):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await generate_embeddings(texts, Priority.INGESTION)
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_base_delay * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"Embedding batch failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str], on_batch_done: Optional[BatchCallback] = None) -> List[List[float]]:
+        """Embed texts in batches; returns embeddings in input order"""
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch: List[int]):
+            async with semaphore:
+                vectors = await self._embed_batch([texts[i] for i in batch])
+                for index, vector in zip(batch, vectors):
+                    embeddings[index] = vector
+                if on_batch_done is not None:
+                    await on_batch_done(batch, vectors)
+
+        tasks = [asyncio.create_task(run(batch)) for batch in self.pack(texts)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # One batch failing for good stops the rest
+            for task in tasks:
+                task.cancel()
+
+        return embeddings
+
+
+# Global embedding batcher instance
+embedding_batcher = EmbeddingBatcher(
+    settings.embedding_batch_max_tokens,
+    settings.embedding_batch_max_items,
+    settings.embedding_concurrency,
+    settings.embedding_max_retries,
+    settings.embedding_retry_base_delay
+)
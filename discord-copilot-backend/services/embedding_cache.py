@@ -0,0 +1,119 @@
+from db import repository
+from config import get_settings
+from collections import OrderedDict
+from typing import List, Optional, Set
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MAX_PENDING_WRITES = 100  # Beyond this (database slow or down) new entries stay memory-only
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold and collapse whitespace so trivially different queries share an entry"""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings.
+
+    Tier 1 is a bounded in-memory LRU; tier 2 is the query_embedding_cache
+    table, whose rows expire after embedding_cache_ttl_hours. Keys include
+    the embedding model so a model switch never serves stale vectors.
+    Writes to tier 2 (and its periodic purge) run in the background, off the
+    request that missed.
+    """
+
+    def __init__(self, max_size: int, ttl_hours: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_hours * 3600
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._writes = 0
+        self._pending: Set[asyncio.Task] = set()
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, text: str, model: str) -> Optional[List[float]]:
+        key = self.make_key(text, model)
+
+        embedding = self._entries.get(key)
+        if embedding is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return embedding
+
+        try:
+            embedding = await repository.get_cached_query_embedding(key, self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            embedding = None
+
+        if embedding is not None:
+            self._remember(key, embedding)
+            self.db_hits += 1
+            return embedding
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, model: str, embedding: List[float]):
+        key = self.make_key(text, model)
+        self._remember(key, embedding)
+
+        if len(self._pending) >= MAX_PENDING_WRITES:
+            return
+        self._spawn(self._persist(key, model, embedding))
+
+        self._writes += 1
+        if self._writes % settings.embedding_cache_purge_every == 0:
+            self._spawn(self._purge())
+
+    def _spawn(self, work):
+        task = asyncio.create_task(work)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _persist(self, key: str, model: str, embedding: List[float]):
+        try:
+            await repository.put_cached_query_embedding(key, model, embedding)
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    async def _purge(self):
+        try:
+            purged = await repository.purge_query_embedding_cache(self.ttl_seconds)
+            logger.info(f"Purged {purged} expired query embeddings")
+        except Exception as e:
+            logger.warning(f"Embedding cache purge failed: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "pending_writes": len(self._pending),
+            "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0
+        }
+
+
+# Global embedding cache instance
+embedding_cache = EmbeddingCache(settings.embedding_cache_size, settings.embedding_cache_ttl_hours)
@@ -0,0 +1,242 @@
+from config import get_settings
+from services.metrics import LLM_ACTIVE_CALLS, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT_SECONDS
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+WAIT_SAMPLES = 1000  # Recent queue waits kept per priority for the percentiles
+HOLD_EWMA_ALPHA = 0.2
+
+
+class Priority(IntEnum):
+    """Lower runs first"""
+    INTERACTIVE = 0  # Discord replies (query embedding and generation)
+    SUMMARY = 1  # Background memory summaries
+    INGESTION = 2  # PDF chunk embeddings
+
+
+class SchedulerBusy(Exception):
+    """The call was shed instead of queued: the provider budget is saturated"""
+
+
+# Guild the current request belongs to; calls without one only count against the global limit
+current_guild: ContextVar[str] = ContextVar("current_guild", default="")
+
+
+@dataclass(eq=False)
+class _Waiter:
+    priority: Priority
+    guild_id: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LLMScheduler:
+    """
+    Admission control for OpenRouter calls (chat and embeddings).
+
+    At most max_concurrency calls run at once, and at most max_per_guild for
+    any one guild, so a spike in one busy guild cannot take the whole rate
+    limit. Calls beyond that wait in a bounded queue ordered by priority
+    (interactive, then summaries, then ingestion) and FIFO within one.
+
+    Waiting is time-aware: a call is shed up front with SchedulerBusy when
+    its estimated queue time (calls ahead of it times the average slot hold,
+    spread over the slots) exceeds its priority's max wait, and again if it
+    actually waits that long. When the queue is full, a newcomer evicts the
+    newest lower-priority waiter or is shed itself.
+    """
+
+    def __init__(self, max_concurrency: int, max_per_guild: int, max_queue: int, max_wait: Dict[Priority, float]):
+        self.max_concurrency = max_concurrency
+        self.max_per_guild = max_per_guild
+        self.max_queue = max_queue
+        self.max_wait = max_wait  # 0 = wait as long as it takes
+
+        self._queues: Dict[Priority, Deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self._active = 0
+        self._active_per_guild: Dict[str, int] = {}
+        self._hold_ewma = 0.0  # Seconds a call keeps its slot
+
+        self.admitted = {priority: 0 for priority in Priority}
+        self.shed = {priority: 0 for priority in Priority}
+        self._waits: Dict[Priority, Deque[float]] = {priority: deque(maxlen=WAIT_SAMPLES) for priority in Priority}
+
+    def _queued(self, up_to: Priority = Priority.INGESTION) -> int:
+        return sum(len(self._queues[priority]) for priority in Priority if priority <= up_to)
+
+    def _can_run(self, guild_id: str) -> bool:
+        if self._active >= self.max_concurrency:
+            return False
+        return not guild_id or self._active_per_guild.get(guild_id, 0) < self.max_per_guild
+
+    def _start(self, guild_id: str):
+        self._active += 1
+        if guild_id:
+            self._active_per_guild[guild_id] = self._active_per_guild.get(guild_id, 0) + 1
+
+    def _release(self, guild_id: str):
+        self._active -= 1
+        if guild_id:
+            remaining = self._active_per_guild[guild_id] - 1
+            if remaining:
+                self._active_per_guild[guild_id] = remaining
+            else:
+                del self._active_per_guild[guild_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to the best waiters whose guild is under its limit"""
+        for priority in Priority:
+            queue = self._queues[priority]
+            for waiter in list(queue):
+                if self._active >= self.max_concurrency:
+                    return
+                if waiter.future.done():
+                    queue.remove(waiter)
+                    continue
+                if self._can_run(waiter.guild_id):
+                    queue.remove(waiter)
+                    self._start(waiter.guild_id)
+                    waiter.future.set_result(None)
+
+    def _shed(self, priority: Priority, reason: str):
+        self.shed[priority] += 1
+        logger.warning(f"Shedding {priority.name.lower()} OpenRouter call: {reason}")
+        raise SchedulerBusy(reason)
+
+    def _check_admission(self, priority: Priority):
+        """Shed up front when the call could never start within its max wait"""
+        max_wait = self.max_wait.get(priority, 0)
+        if max_wait and self._hold_ewma:
+            estimate = (self._queued(priority) + 1) * self._hold_ewma / self.max_concurrency
+            if estimate > max_wait:
+                self._shed(priority, f"estimated wait {estimate:.1f}s exceeds {max_wait:.1f}s")
+
+        if self._queued() >= self.max_queue:
+            # Make room by evicting the newest waiter of the lowest priority below this one
+            for lower in reversed(Priority):
+                if lower <= priority:
+                    break
+                queue = self._queues[lower]
+                if queue:
+                    victim = queue.pop()
+                    self.shed[lower] += 1
+                    victim.future.set_exception(SchedulerBusy("evicted by a higher-priority call"))
+                    return
+            self._shed(priority, f"queue full ({self.max_queue} waiting)")
+
+    async def _acquire(self, priority: Priority, guild_id: str):
+        # Free slots only ever sit idle next to waiters whose guild is at its limit
+        if self._can_run(guild_id):
+            self._start(guild_id)
+            self._record_wait(priority, 0.0)
+            return
+
+        self._check_admission(priority)
+        waiter = _Waiter(priority, guild_id, asyncio.get_running_loop().create_future())
+        self._queues[priority].append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait.get(priority) or None)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self._shed(priority, f"waited longer than {self.max_wait[priority]:.1f}s")
+        except asyncio.CancelledError:
+            self._forget(waiter)
+            raise
+        finally:
+            self._record_wait(priority, time.monotonic() - waiter.enqueued_at)
+
+    def _record_wait(self, priority: Priority, seconds: float):
+        self._waits[priority].append(seconds)
+        LLM_QUEUE_WAIT_SECONDS.labels(priority.name.lower()).observe(seconds)
+
+    def _forget(self, waiter: _Waiter):
+        """Drop a waiter that gave up, returning its slot if one was handed over meanwhile"""
+        if waiter in self._queues[waiter.priority]:
+            self._queues[waiter.priority].remove(waiter)
+        elif waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+            self._release(waiter.guild_id)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority) -> AsyncIterator[None]:
+        """Hold one OpenRouter call slot for the body (raises SchedulerBusy if shed)"""
+        guild_id = current_guild.get()
+        await self._acquire(priority, guild_id)
+        self.admitted[priority] += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._hold_ewma = held if not self._hold_ewma else (1 - HOLD_EWMA_ALPHA) * self._hold_ewma + HOLD_EWMA_ALPHA * held
+            self._release(guild_id)
+
+    def try_slot(self, priority: Priority) -> Optional[Callable[[], None]]:
+        """
+        Take a slot for optional extra work (a hedged request) only if one is
+        free right now and nothing is queued; returns its release callback,
+        or None. Never waits and never sheds.
+        """
+        guild_id = current_guild.get()
+        if self._queued() or not self._can_run(guild_id):
+            return None
+        self._start(guild_id)
+        self.admitted[priority] += 1
+        return lambda: self._release(guild_id)
+
+    def stats(self) -> dict:
+        priorities = {}
+        for priority in Priority:
+            waits = list(self._waits[priority])
+            priorities[priority.name.lower()] = {
+                "queued": len(self._queues[priority]),
+                "admitted": self.admitted[priority],
+                "shed": self.shed[priority],
+                "wait_p50_ms": _percentile(waits, 0.50) * 1000,
+                "wait_p95_ms": _percentile(waits, 0.95) * 1000,
+                "wait_max_ms": max(waits, default=0.0) * 1000
+            }
+        return {
+            "active": self._active,
+            "queued": self._queued(),
+            "busiest_guilds": sorted(self._active_per_guild.items(), key=lambda item: item[1], reverse=True)[:5],
+            "hold_ewma_ms": self._hold_ewma * 1000,
+            "priorities": priorities
+        }
+
+
+# Global LLM scheduler instance (shared by chat and embedding calls)
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    max_per_guild=settings.llm_max_concurrency_per_guild,
+    max_queue=settings.llm_queue_max_size,
+    max_wait={
+        Priority.INTERACTIVE: settings.llm_max_wait_interactive,
+        Priority.SUMMARY: settings.llm_max_wait_summary,
+        Priority.INGESTION: settings.llm_max_wait_ingestion
+    }
+)
+
+# Queue gauges are read from the scheduler at scrape time
+for _priority in Priority:
+    LLM_QUEUE_DEPTH.labels(_priority.name.lower()).set_function(lambda priority=_priority: len(llm_scheduler._queues[priority]))
+LLM_ACTIVE_CALLS.set_function(lambda: llm_scheduler._active)
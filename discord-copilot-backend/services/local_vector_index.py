@@ -0,0 +1,420 @@
+"""
+In-process replica of the document_chunks vector index.
+
+Keeps every searchable chunk embedding in one contiguous float32 matrix
+(unit-normalized rows) and answers top-k queries with a single matrix-vector
+product, so retrieval skips the database round trip entirely. The matrix is
+snapshotted to disk (with chunk ids and page numbers, not text) and
+memory-mapped on startup. A startup sync, ingestion and deletes on this
+replica, and knowledge_changed notifications keep it in step with the
+database.
+"""
+from db import repository
+from db.listener import notification_listener
+from config import get_settings
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Postgres NOTIFY channel fired by the pdf_documents trigger in schema.sql
+KNOWLEDGE_CHANNEL = "knowledge_changed"
+
+MATRIX_FILE = "embeddings.npy"
+META_FILE = "meta.json"
+SNAPSHOT_FORMAT = 4  # Bump when the row layout changes; older snapshots are rebuilt
+
+
+@dataclass(frozen=True)
+class _IndexState:
+    """Immutable snapshot; updates build a new one and swap it in"""
+    matrix: np.ndarray  # (rows, dimensions) float32, unit-normalized
+    document_ids: np.ndarray  # (rows,) document id per row
+    chunk_ids: List[str]  # Per row
+    page_numbers: List[int]  # Per row
+    documents: Dict[str, dict] = field(default_factory=dict)  # id -> filename, collection, fingerprint, offset, chunk_count
+    positions: Dict[str, int] = field(default_factory=dict)  # chunk_id -> row
+
+    @classmethod
+    def build(cls, matrix, document_ids, chunk_ids, page_numbers, documents) -> "_IndexState":
+        positions = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+        return cls(
+            matrix=matrix,
+            document_ids=document_ids,
+            chunk_ids=chunk_ids,
+            page_numbers=page_numbers,
+            documents=documents,
+            positions=positions
+        )
+
+    def document_rows(self, document_id: str) -> slice:
+        """Each document's rows are contiguous"""
+        info = self.documents[document_id]
+        return slice(info["offset"], info["offset"] + info["chunk_count"])
+
+
+def _empty_state() -> _IndexState:
+    return _IndexState(
+        matrix=np.empty((0, settings.embedding_dimensions), dtype=np.float32),
+        document_ids=np.empty(0, dtype=object),
+        chunk_ids=[],
+        page_numbers=[]
+    )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _rebuild(state: _IndexState, keep: List[str], loaded: List[tuple]) -> _IndexState:
+    """
+    New state holding the kept documents' rows plus the loaded
+    (document_id, info, chunks) ones, copied into one preallocated matrix in
+    a single pass; runs in a worker thread
+    """
+    blocks = []  # (document_id, info, vectors, chunk_ids, page_numbers)
+    for document_id in keep:
+        rows = state.document_rows(document_id)
+        blocks.append((
+            document_id,
+            state.documents[document_id],
+            state.matrix[rows],
+            state.chunk_ids[rows],
+            state.page_numbers[rows]
+        ))
+    for document_id, info, chunks in loaded:
+        blocks.append((
+            document_id,
+            info,
+            _normalize(np.array([chunk["embedding"] for chunk in chunks], dtype=np.float32)),
+            [chunk["id"] for chunk in chunks],
+            [chunk["page_number"] for chunk in chunks]
+        ))
+
+    total = sum(len(block[3]) for block in blocks)
+    matrix = np.empty((total, settings.embedding_dimensions), dtype=np.float32)
+    document_ids = np.empty(total, dtype=object)
+    chunk_ids: List[str] = []
+    page_numbers: List[int] = []
+    documents = {}
+
+    offset = 0
+    for document_id, info, vectors, block_chunk_ids, block_page_numbers in blocks:
+        end = offset + len(block_chunk_ids)
+        matrix[offset:end] = vectors
+        document_ids[offset:end] = document_id
+        chunk_ids.extend(block_chunk_ids)
+        page_numbers.extend(block_page_numbers)
+        documents[document_id] = {
+            "filename": info["filename"],
+            "collection": info["collection"],
+            "fingerprint": info["fingerprint"],
+            "offset": offset,
+            "chunk_count": end - offset
+        }
+        offset = end
+
+    return _IndexState.build(matrix, document_ids, chunk_ids, page_numbers, documents)
+
+
+def _top_k(
+    state: _IndexState,
+    query: np.ndarray,
+    top_k: int,
+    min_similarity: Optional[float] = None,
+    document_ids: Optional[Set[str]] = None
+) -> List[Tuple[int, float]]:
+    """
+    Exact cosine top-k as (row, similarity), optionally restricted to some
+    documents and a similarity floor; runs in a worker thread (numpy
+    releases the GIL)
+    """
+    count = state.matrix.shape[0]
+    if count == 0:
+        return []
+
+    scores = state.matrix @ query
+    if document_ids is not None:
+        scores = np.where(np.isin(state.document_ids, list(document_ids)), scores, -np.inf)
+    if min_similarity is not None:
+        scores = np.where(scores >= min_similarity, scores, -np.inf)
+
+    if top_k < count:
+        best = np.argpartition(scores, -top_k)[-top_k:]
+        best = best[np.argsort(-scores[best])]
+    else:
+        best = np.argsort(-scores)
+
+    results = []
+    for i in best:
+        if scores[i] == -np.inf:
+            break  # Everything after this was filtered out
+        results.append((int(i), float(scores[i])))
+    return results
+
+
+class LocalVectorIndex:
+    """
+    Exact in-memory vector search over all completed documents.
+
+    Not ready until the snapshot is loaded and synced; callers fall back to
+    the search_documents RPC until then. Chunk text is not part of the
+    snapshot: it is kept for chunks loaded from the database and fetched by
+    id (then kept) for chunks restored from disk.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._state = _empty_state()
+        self._texts: Dict[str, str] = {}  # chunk_id -> chunk_text
+        self._ready = False
+        self._dirty = False
+        # Serializes updates; searches never wait on it
+        self._update_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+        self._pending: set = set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    async def _chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in self._texts]
+        if missing:
+            self._texts.update(await repository.get_chunk_texts(missing))
+        return self._texts
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        min_similarity: Optional[float] = None,
+        collection: Optional[str] = None,
+        document_ids: Optional[List[str]] = None
+    ) -> List[dict]:
+        """Top-k chunks by cosine similarity, shaped (and filtered) like search_documents rows"""
+        state = self._state
+        allowed = None
+        if collection is not None or document_ids is not None:
+            allowed = {
+                document_id
+                for document_id, info in state.documents.items()
+                if (collection is None or info["collection"] == collection)
+                and (document_ids is None or document_id in document_ids)
+            }
+            if not allowed:
+                return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        best = await asyncio.to_thread(_top_k, state, query, top_k, min_similarity, allowed)
+        texts = await self._chunk_texts([state.chunk_ids[i] for i, _ in best])
+
+        results = []
+        for i, similarity in best:
+            chunk_id = state.chunk_ids[i]
+            if chunk_id not in texts:
+                continue  # Deleted since this state was built
+            results.append({
+                "id": chunk_id,
+                "chunk_text": texts[chunk_id],
+                "page_number": state.page_numbers[i],
+                "filename": state.documents[state.document_ids[i]]["filename"],
+                "similarity": similarity
+            })
+        return results
+
+    def similarities(self, query_embedding: List[float], chunk_ids: List[str]) -> Dict[str, float]:
+        """Cosine similarity of the query to specific chunks (those present in the index)"""
+        state = self._state
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        return {
+            chunk_id: float(state.matrix[state.positions[chunk_id]] @ query)
+            for chunk_id in chunk_ids
+            if chunk_id in state.positions
+        }
+
+    # ------------------------------------------------------------------
+    # Snapshot persistence
+    # ------------------------------------------------------------------
+
+    def _load_snapshot(self) -> _IndexState:
+        matrix_path = os.path.join(self.directory, MATRIX_FILE)
+        meta_path = os.path.join(self.directory, META_FILE)
+        if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+            return _empty_state()
+
+        with open(meta_path, "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("model") != settings.embedding_model or meta.get("format") != SNAPSHOT_FORMAT:
+            logger.info("Vector index snapshot is from another embedding model or format, ignoring it")
+            return _empty_state()
+
+        # Memory-mapped: pages come from the OS page cache instead of being copied in
+        matrix = np.load(matrix_path, mmap_mode="r")
+        chunk_ids = meta["chunk_ids"]
+        if matrix.shape[0] != len(chunk_ids):
+            logger.warning("Vector index snapshot is inconsistent, ignoring it")
+            return _empty_state()
+
+        document_ids = np.empty(len(chunk_ids), dtype=object)
+        for document_id, info in meta["documents"].items():
+            document_ids[info["offset"]:info["offset"] + info["chunk_count"]] = document_id
+        return _IndexState.build(matrix, document_ids, chunk_ids, meta["page_numbers"], meta["documents"])
+
+    def _save_snapshot(self, state: _IndexState):
+        os.makedirs(self.directory, exist_ok=True)
+        matrix_path = os.path.join(self.directory, MATRIX_FILE)
+        meta_path = os.path.join(self.directory, META_FILE)
+
+        # Write then rename, so a crash never leaves a half-written snapshot
+        # (a mapped old file stays valid after the rename)
+        with open(matrix_path + ".tmp", "wb") as matrix_file:
+            np.save(matrix_file, np.ascontiguousarray(state.matrix))
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as meta_file:
+            json.dump({
+                "model": settings.embedding_model,
+                "format": SNAPSHOT_FORMAT,
+                "documents": state.documents,
+                "chunk_ids": state.chunk_ids,
+                "page_numbers": state.page_numbers
+            }, meta_file)
+
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    async def save(self):
+        """Persist the current state if it changed since the last save"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        started = time.perf_counter()
+        await asyncio.to_thread(self._save_snapshot, self._state)
+        logger.info(f"Saved vector index snapshot ({len(self._state.chunk_ids)} chunks) in {time.perf_counter() - started:.2f}s")
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+
+    async def _swap(self, keep: List[str], loaded: List[tuple]):
+        """Rebuild off the event loop with only the kept and loaded documents, then swap it in"""
+        state = self._state
+        self._state = await asyncio.to_thread(_rebuild, state, keep, loaded)
+        self._dirty = True
+
+        kept = set(keep)
+        for document_id in state.documents:
+            if document_id not in kept:
+                for chunk_id in state.chunk_ids[state.document_rows(document_id)]:
+                    self._texts.pop(chunk_id, None)
+        for _, _, chunks in loaded:
+            self._texts.update((chunk["id"], chunk["chunk_text"]) for chunk in chunks)
+
+    async def sync(self):
+        """Reconcile every document against the database (startup and after reconnects)"""
+        async with self._update_lock:
+            started = time.perf_counter()
+            current = await repository.list_searchable_documents()
+            state = self._state
+
+            keep = []
+            loaded = []
+            for document_id, info in current.items():
+                known = state.documents.get(document_id)
+                if known is not None and known["fingerprint"] == info["fingerprint"]:
+                    keep.append(document_id)
+                    continue
+                chunks = await repository.get_searchable_chunks(document_id)
+                if chunks:
+                    loaded.append((document_id, info, chunks))
+            removed = sum(1 for document_id in state.documents if document_id not in current)
+
+            if loaded or removed:
+                await self._swap(keep, loaded)
+            logger.info(
+                f"Vector index synced: {len(self._state.chunk_ids)} chunks from {len(self._state.documents)} documents "
+                f"({len(loaded)} loaded, {removed} removed) in {time.perf_counter() - started:.2f}s"
+            )
+
+    async def sync_document(self, document_id: str):
+        """Reload one document if it changed and is searchable, otherwise drop it"""
+        if self._sync_task is None:
+            return  # Not started (index disabled)
+        try:
+            async with self._update_lock:
+                info = await repository.get_searchable_document(document_id)
+                known = self._state.documents.get(document_id)
+                if info is None and known is None:
+                    return
+                if info is not None and known is not None and known["fingerprint"] == info["fingerprint"]:
+                    return  # Already current, e.g. the NOTIFY for a change applied here
+
+                loaded = []
+                if info is not None:
+                    chunks = await repository.get_searchable_chunks(document_id)
+                    if chunks:
+                        loaded.append((document_id, info, chunks))
+                await self._swap([known_id for known_id in self._state.documents if known_id != document_id], loaded)
+                logger.info(f"Vector index updated for document {document_id} ({len(self._state.chunk_ids)} chunks)")
+        except Exception as e:
+            logger.error(f"Failed to update vector index for document {document_id}: {str(e)}")
+
+    def _on_notify(self, payload: str):
+        if not payload:
+            return
+        task = asyncio.create_task(self.sync_document(payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _on_reconnect(self):
+        # Notifications may have been missed while disconnected
+        if self._ready:
+            task = asyncio.create_task(self.sync())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def _start(self):
+        try:
+            started = time.perf_counter()
+            self._state = await asyncio.to_thread(self._load_snapshot)
+            logger.info(f"Loaded vector index snapshot ({len(self._state.chunk_ids)} chunks) in {time.perf_counter() - started:.2f}s")
+            await self.sync()
+            self._ready = True
+            await self.save()
+        except Exception as e:
+            logger.error(f"Failed to start local vector index, using database search: {str(e)}")
+
+    def start(self):
+        """Load the snapshot and sync in the background; search falls back to the RPC meanwhile"""
+        notification_listener.subscribe(KNOWLEDGE_CHANNEL, self._on_notify, on_reconnect=self._on_reconnect)
+        notification_listener.start()
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._start())
+
+    async def stop(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        for task in list(self._pending):
+            task.cancel()
+        if self._ready:
+            await self.save()
+
+
+# Global local vector index instance
+local_vector_index = LocalVectorIndex(settings.local_vector_index_dir)
@@ -0,0 +1,100 @@
+"""
+Prometheus metrics for the bot and ingestion pipelines.
+
+Every stage is timed into a per-pipeline histogram (labelled by stage) and
+counts its failures, so SLOs can be set per stage and regressions show up in
+the latency percentiles. Exported on /metrics (see main.py).
+
+When tracing_enabled is set and the OpenTelemetry API is installed, each
+stage also opens a span, exported by whatever tracer provider the process
+is configured with (e.g. opentelemetry-instrument); otherwise spans cost
+nothing.
+"""
+from config import get_settings
+from contextlib import contextmanager, nullcontext
+from prometheus_client import Counter, Gauge, Histogram
+from typing import Iterator
+import time
+
+settings = get_settings()
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+_tracer = trace.get_tracer("discord-copilot") if trace is not None and settings.tracing_enabled else None
+
+BOT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+INGESTION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+STAGE_ERRORS = Counter(
+    "copilot_stage_errors_total",
+    "Stages that raised, by pipeline and stage",
+    ["pipeline", "stage"]
+)
+
+BOT_MESSAGES = Counter(
+    "copilot_bot_messages_total",
+    "Bot mentions handled, by outcome",
+    ["outcome"]  # answered, cached, coalesced, not_allowed, busy, fallback, interrupted, error
+)
+
+INGESTED_CHUNKS = Counter(
+    "copilot_ingested_chunks_total",
+    "Chunks stored by ingestion, by embedding source",
+    ["source"]  # embedded, reused
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    "copilot_llm_queue_depth",
+    "OpenRouter calls waiting for a slot, by priority",
+    ["priority"]
+)
+
+LLM_ACTIVE_CALLS = Gauge(
+    "copilot_llm_active_calls",
+    "OpenRouter calls holding a slot"
+)
+
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "copilot_llm_queue_wait_seconds",
+    "Time OpenRouter calls waited for a slot, by priority",
+    ["priority"],
+    buckets=BOT_BUCKETS
+)
+
+
+class PipelineMetrics:
+    """Stage timings (histogram) and failures (counter) for one pipeline"""
+
+    def __init__(self, pipeline: str, buckets: tuple):
+        self.pipeline = pipeline
+        self.seconds = Histogram(
+            f"copilot_{pipeline}_stage_seconds",
+            f"Time spent in each {pipeline} pipeline stage",
+            ["stage"],
+            buckets=buckets
+        )
+
+    def observe(self, stage: str, seconds: float):
+        self.seconds.labels(stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Time the body as one stage (and trace it, if tracing is on)"""
+        span = _tracer.start_as_current_span(f"{self.pipeline}.{stage}") if _tracer is not None else nullcontext()
+        started = time.perf_counter()
+        with span:
+            try:
+                yield
+            except Exception:
+                STAGE_ERRORS.labels(self.pipeline, stage).inc()
+                raise
+            finally:
+                self.observe(stage, time.perf_counter() - started)
+
+
+# Global pipeline metrics instances
+bot_metrics = PipelineMetrics("bot", BOT_BUCKETS)
+ingestion_metrics = PipelineMetrics("ingestion", INGESTION_BUCKETS)
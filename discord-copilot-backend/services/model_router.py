@@ -0,0 +1,217 @@
+from config import get_settings
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+T = TypeVar("T")
+
+LATENCY_EWMA_ALPHA = 0.2
+FAILURE_EWMA_ALPHA = 0.1
+FAILURE_PENALTY = 4.0  # A model failing every call ranks as if it were 5x slower
+
+# Tasks the bot routes models for
+REPLY = "reply"
+SUMMARY = "summary"
+
+# Takes a concurrency slot for a hedged request: returns its release callback, or None if none is free
+HedgeSlot = Callable[[], Optional[Callable[[], None]]]
+
+
+@dataclass
+class ModelStats:
+    latency_ewma: float = 0.0  # Seconds to first token (chat calls always stream)
+    failure_ewma: float = 0.0  # Recent failure rate
+    calls: int = 0
+    failures: int = 0
+    cancelled: int = 0  # Lost a hedge race
+    backup_wins: int = 0  # Answered in place of the primary (hedge or failover)
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        self.failure_ewma = (1 - FAILURE_EWMA_ALPHA) * self.failure_ewma + FAILURE_EWMA_ALPHA * (0.0 if ok else 1.0)
+        if ok:
+            if self.latency_ewma:
+                self.latency_ewma = (1 - LATENCY_EWMA_ALPHA) * self.latency_ewma + LATENCY_EWMA_ALPHA * latency
+            else:
+                self.latency_ewma = latency
+        else:
+            self.failures += 1
+
+    def score(self) -> float:
+        """Expected latency with failures priced in (lower is better)"""
+        # A model that has only ever failed is as slow as a timeout
+        latency = self.latency_ewma or settings.openrouter_read_timeout
+        return latency * (1 + FAILURE_PENALTY * self.failure_ewma)
+
+
+def _parse_models(value: str) -> List[str]:
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+
+class ModelRouter:
+    """
+    Picks the OpenRouter model order for each task from measured latency.
+
+    Every task has a configured model list (falling back to llm_provider).
+    Models are tried in order of expected latency, with the failure rate
+    priced in, so a degraded primary drops behind its backups until it
+    recovers. Models with no measurements yet keep their configured order
+    ahead of measured ones, so each gets sampled.
+    """
+
+    def __init__(self, models: Dict[str, List[str]], default_model: str):
+        self.models = {task: task_models or [default_model] for task, task_models in models.items()}
+        self.default_model = default_model
+        self._stats: Dict[str, ModelStats] = {}
+        self.hedges = 0
+        self.hedges_skipped = 0  # No free concurrency slot when the budget ran out
+
+    def stats_for(self, model: str) -> ModelStats:
+        return self._stats.setdefault(model, ModelStats())
+
+    def candidates(self, task: str) -> List[str]:
+        """Models for a task, best first"""
+        models = self.models.get(task) or [self.default_model]
+        return sorted(
+            models,
+            key=lambda model: (self.stats_for(model).calls > 0, self.stats_for(model).score())
+        )
+
+    async def timed(self, model: str, call: Awaitable[T]) -> T:
+        """
+        Await one model call, recording its latency and outcome
+        (a cancelled call is recorded by run, and only if it lost a hedge race)
+        """
+        stats = self.stats_for(model)
+        started = time.perf_counter()
+        try:
+            result = await call
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats.record(time.perf_counter() - started, ok=False)
+            raise
+        stats.record(time.perf_counter() - started, ok=True)
+        return result
+
+    async def run(
+        self,
+        task: str,
+        attempt: Callable[[str], Awaitable[T]],
+        hedge_after: Optional[float] = None,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+        hedge_slot: Optional[HedgeSlot] = None
+    ) -> T:
+        """
+        Run attempt(model) on the task's best model, failing over down the list
+        With hedge_after set, a backup model is started if the primary has not
+        returned within that many seconds; the first to succeed wins and the
+        other is cancelled (or, if it succeeded too, handed to discard)
+        The backup runs alongside the caller's own concurrency slot, so it needs
+        one from hedge_slot for the length of the race; without a free slot the
+        primary is left to finish on its own rather than adding load
+        """
+        models = iter(self.candidates(task))
+        pending: Dict[asyncio.Task, str] = {}
+        started: Dict[asyncio.Task, float] = {}
+        last_error: Optional[BaseException] = None
+        release_hedge_slot: Optional[Callable[[], None]] = None
+        won = False
+
+        def launch() -> bool:
+            model = next(models, None)
+            if model is None:
+                return False
+            call = asyncio.create_task(self.timed(model, attempt(model)))
+            pending[call] = model
+            started[call] = time.perf_counter()
+            return True
+
+        launch()
+        primary = next(iter(pending.values()))
+        try:
+            while pending:
+                timeout = hedge_after if hedge_after and len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Latency budget missed: race the next model against the slow one
+                    if release_hedge_slot is None and hedge_slot is not None:
+                        release_hedge_slot = hedge_slot()
+                        if release_hedge_slot is None:
+                            self.hedges_skipped += 1
+                            hedge_after = None
+                            continue
+                    if launch():
+                        self.hedges += 1
+                        logger.info(f"Hedging {task}: {primary} missed its {hedge_after:.1f}s budget")
+                    else:
+                        hedge_after = None
+                        if release_hedge_slot is not None:
+                            release_hedge_slot()
+                            release_hedge_slot = None
+                    continue
+
+                for finished in done:
+                    model = pending.pop(finished)
+                    if finished.exception() is None:
+                        if model != primary:
+                            self.stats_for(model).backup_wins += 1
+                        won = True
+                        return finished.result()
+                    last_error = finished.exception()
+                    logger.warning(f"Model {model} failed for {task}: {str(last_error)}")
+
+                if not pending:
+                    launch()  # Fail over to the next model
+
+            raise last_error
+
+        finally:
+            for loser in pending:
+                if not loser.done():
+                    loser.cancel()
+                    if won:
+                        # Lost the hedge race: it was at least this slow. A call
+                        # cancelled from outside says nothing about the model
+                        stats = self.stats_for(pending[loser])
+                        stats.cancelled += 1
+                        stats.record(time.perf_counter() - started[loser], ok=True)
+                elif not loser.cancelled() and loser.exception() is None:
+                    if discard is not None:
+                        await discard(loser.result())
+            if release_hedge_slot is not None:
+                release_hedge_slot()
+
+    def stats(self) -> dict:
+        return {
+            "routes": {task: self.candidates(task) for task in self.models},
+            "hedges": self.hedges,
+            "hedges_skipped": self.hedges_skipped,
+            "models": {
+                model: {
+                    "latency_ewma_ms": stats.latency_ewma * 1000,
+                    "failure_rate": stats.failure_ewma,
+                    "calls": stats.calls,
+                    "failures": stats.failures,
+                    "cancelled": stats.cancelled,
+                    "backup_wins": stats.backup_wins
+                }
+                for model, stats in self._stats.items()
+            }
+        }
+
+
+# Global model router instance
+model_router = ModelRouter(
+    {
+        REPLY: _parse_models(settings.llm_reply_models),
+        SUMMARY: _parse_models(settings.llm_summary_models)
+    },
+    default_model=settings.llm_provider
+)
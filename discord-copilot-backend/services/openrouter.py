@@ -0,0 +1,195 @@
+from config import get_settings
+from openai import AsyncOpenAI
+from typing import Optional
+import httpx
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class CircuitBreaker:
+    """
+    Fails OpenRouter calls fast while the provider is degraded.
+
+    After failure_threshold consecutive failures (connection errors,
+    timeouts, 5xx) the circuit opens and calls are rejected without touching
+    the network. After reset_seconds one probe call is let through: success
+    closes the circuit, failure re-opens it for another reset_seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record(self, ok: bool):
+        if ok:
+            if self.state != self.CLOSED:
+                logger.info("OpenRouter circuit closed")
+            self.state = self.CLOSED
+            self._failures = 0
+            return
+
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"OpenRouter circuit opened after {self._failures} consecutive failures")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def abandon(self):
+        """A call ended without a verdict (cancelled): free the half-open probe"""
+        self._probing = False
+
+
+class OpenRouterTransport(httpx.AsyncBaseTransport):
+    """
+    Keep-alive (HTTP/2 when available) transport behind the circuit breaker.
+
+    Counts requests against new TCP connections, so the reuse rate shows
+    whether the pool is sized for the traffic.
+    """
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self._transport = httpx.AsyncHTTPTransport(
+            http2=settings.openrouter_http2,
+            limits=httpx.Limits(
+                max_connections=settings.openrouter_max_connections,
+                max_keepalive_connections=settings.openrouter_max_keepalive_connections,
+                keepalive_expiry=settings.openrouter_keepalive_expiry
+            )
+        )
+        self.requests = 0
+        self.connections_opened = 0
+        self.rejected = 0
+
+    async def _trace(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    @staticmethod
+    def _circuit_open_response(request: httpx.Request) -> httpx.Response:
+        # A 503 the OpenAI client will not retry: callers fail over or fail fast
+        return httpx.Response(
+            503,
+            headers={"content-type": "application/json", "x-should-retry": "false"},
+            content=json.dumps({"error": {"message": "OpenRouter circuit open: provider degraded, failing fast"}}).encode(),
+            request=request
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self.breaker.allow():
+            self.rejected += 1
+            return self._circuit_open_response(request)
+
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            self.breaker.record(ok=False)
+            raise
+        except BaseException:
+            # Cancelled (hedge loser, shutdown): otherwise a half-open probe would never finish
+            self.breaker.abandon()
+            raise
+        self.breaker.record(ok=response.status_code < 500)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def stats(self) -> dict:
+        pool = getattr(self._transport, "_pool", None)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connection_reuse_rate": 1 - self.connections_opened / self.requests if self.requests else 0.0,
+            "open_connections": len(pool.connections) if pool is not None else 0,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "rejected": self.rejected
+        }
+
+
+class OpenRouterClient:
+    """
+    Shared OpenRouter client (chat and embeddings) over one connection pool.
+    The app lifespan owns it: once closed on shutdown it is not recreated,
+    so a late call fails instead of opening a pool nothing will close.
+    """
+    _client: Optional[AsyncOpenAI] = None
+    _transport: Optional[OpenRouterTransport] = None
+    _closed = False
+
+    @classmethod
+    def open(cls) -> AsyncOpenAI:
+        """Create the client (called once at startup)"""
+        cls._closed = False
+        if cls._client is None:
+            cls._transport = OpenRouterTransport(CircuitBreaker(
+                settings.openrouter_breaker_failures,
+                settings.openrouter_breaker_reset_seconds
+            ))
+            cls._client = AsyncOpenAI(
+                base_url=settings.openrouter_base_url,
+                api_key=settings.openrouter_api_key,
+                max_retries=settings.openrouter_max_retries,
+                http_client=httpx.AsyncClient(
+                    transport=cls._transport,
+                    timeout=httpx.Timeout(
+                        settings.openrouter_read_timeout,
+                        connect=settings.openrouter_connect_timeout
+                    )
+                )
+            )
+        return cls._client
+
+    @classmethod
+    async def close(cls):
+        """Close the client and its connections (called on shutdown)"""
+        cls._closed = True
+        if cls._client is not None:
+            await cls._client.close()
+            cls._client = None
+            cls._transport = None
+
+    @classmethod
+    def get_client(cls) -> AsyncOpenAI:
+        if cls._client is None and cls._closed:
+            raise RuntimeError("OpenRouter client is closed (shutting down)")
+        return cls._client or cls.open()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls._transport.stats() if cls._transport is not None else {}
+
+
+def get_openrouter() -> AsyncOpenAI:
+    """Get the shared OpenRouter client"""
+    return OpenRouterClient.get_client()
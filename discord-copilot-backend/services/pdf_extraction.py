@@ -0,0 +1,88 @@
+"""
+PDF text extraction that runs in worker processes.
+
+Kept free of app imports (settings, database clients) so spawned workers
+start quickly and the functions here can be benchmarked standalone.
+"""
+import PyPDF2
+import pdfplumber
+import asyncio
+import io
+import logging
+import mmap
+from concurrent.futures import Executor
+from typing import List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Raw PDF bytes or a path to the PDF on local disk (preferred: nothing is pickled to workers)
+PdfSource = Union[bytes, str]
+
+
+def _open_stream(source: PdfSource):
+    """Open the PDF as a seekable stream; files are memory-mapped so workers share the page cache"""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    with open(source, "rb") as pdf_file:
+        return mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def count_pages(source: PdfSource) -> int:
+    """Return the number of pages in the PDF"""
+    with _open_stream(source) as stream:
+        return len(PyPDF2.PdfReader(stream).pages)
+
+
+def extract_page_range(source: PdfSource, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract text for pages [start, end) and return (page_number, text) tuples.
+    Uses PyPDF2 (fast) per page and re-parses with pdfplumber only the pages
+    where PyPDF2 returned nothing.
+    """
+    pages = []
+    missing = []
+
+    with _open_stream(source) as stream:
+        reader = PyPDF2.PdfReader(stream)
+        for page_index in range(start, end):
+            try:
+                text = reader.pages[page_index].extract_text() or ""
+            except Exception as e:
+                logger.warning(f"PyPDF2 failed on page {page_index + 1}: {str(e)}")
+                text = ""
+
+            if text.strip():
+                pages.append((page_index + 1, text))
+            else:
+                missing.append(page_index)
+
+    if missing:
+        with _open_stream(source) as stream, pdfplumber.open(stream) as pdf:
+            for page_index in missing:
+                text = pdf.pages[page_index].extract_text()
+                if text and text.strip():
+                    pages.append((page_index + 1, text))
+
+        pages.sort()
+
+    return pages
+
+
+async def extract_pages(source: PdfSource, executor: Executor, pages_per_task: int) -> List[Tuple[int, str]]:
+    """
+    Extract text from the whole PDF on the given executor, splitting it into
+    page ranges that are processed in parallel. Returns pages in order.
+    """
+    loop = asyncio.get_running_loop()
+    page_count = await loop.run_in_executor(executor, count_pages, source)
+
+    ranges = [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+    results = await asyncio.gather(*(
+        loop.run_in_executor(executor, extract_page_range, source, start, end)
+        for start, end in ranges
+    ))
+
+    return [page for result in results for page in result]
@@ -1,54 +1,65 @@
-import PyPDF2
-import pdfplumber
-import io
-from typing import List, Tuple
-from db.supabase_client import get_supabase
-from services.rag_service import generate_embeddings, chunk_text
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from db import repository
+from services.answer_cache import answer_cache
+from services.chunker import iter_chunks
+from services.local_vector_index import local_vector_index
+from services.embedding_batcher import embedding_batcher
+from services.pdf_extraction import PdfSource, extract_pages
+from services.metrics import ingestion_metrics, INGESTED_CHUNKS
 from config import get_settings
+import hashlib
+import multiprocessing
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+_executor: Optional[ProcessPoolExecutor] = None
 
-def extract_text_from_pdf(pdf_content: bytes) -> List[Tuple[int, str]]:
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """Get the shared process pool for PDF extraction (created on first use)"""
+    global _executor
+    if _executor is None:
+        # spawn rather than fork: the parent runs an event loop and threads
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.pdf_extraction_workers or None,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_pdf_executor():
+    """Shut down the PDF extraction pool (called on app shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def remove_spool_file(path: str):
+    """Delete a spooled upload, ignoring files that are already gone"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove spooled upload {path}: {str(e)}")
+
+
+async def extract_text_from_pdf(source: PdfSource) -> List[Tuple[int, str]]:
     """
     Extract text from PDF and return list of (page_number, text) tuples.
-    Tries PyPDF2 first, then falls back to pdfplumber for better extraction.
+    Runs in the process pool, split into page ranges across workers; PyPDF2
+    is tried first per page, with pdfplumber as a per-page fallback.
     """
-    pages = []
-    
     try:
-        # Try PyPDF2 first (faster)
-        pdf_file = io.BytesIO(pdf_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text = page.extract_text()
-            
-            if text.strip():
-                pages.append((page_num + 1, text))
-        
-        # If PyPDF2 extracted text, return it
-        if pages:
-            logger.info(f"Extracted text using PyPDF2: {len(pages)} pages")
-            return pages
-        
-        # Fallback to pdfplumber for better extraction
-        logger.info("PyPDF2 extracted no text, trying pdfplumber...")
-        pdf_file = io.BytesIO(pdf_content)
-        
-        with pdfplumber.open(pdf_file) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                
-                if text and text.strip():
-                    pages.append((page_num + 1, text))
-        
-        if pages:
-            logger.info(f"Extracted text using pdfplumber: {len(pages)} pages")
-        
+        started = time.perf_counter()
+        pages = await extract_pages(source, get_pdf_executor(), settings.pdf_pages_per_task)
+        logger.info(f"Extracted text from {len(pages)} pages in {time.perf_counter() - started:.2f}s")
         return pages
     
     except Exception as e:
@@ -56,85 +67,114 @@ def extract_text_from_pdf(pdf_content: bytes) -> List[Tuple[int, str]]:
         raise
 
 
-async def process_pdf_document(document_id: str, storage_path: str, pdf_content: bytes):
+async def process_pdf_document(document_id: str, spool_path: str):
     """
     Background task to process PDF: extract text, chunk, embed, and store
+    Reads the spooled upload at spool_path and deletes it when done
+    Embeddings computed by an earlier, failed run are reused, not recomputed
     """
-    supabase = get_supabase()
-    
     try:
         logger.info(f"Processing document {document_id}")
         
         # 1. Extract text from PDF
-        pages = extract_text_from_pdf(pdf_content)
+        with ingestion_metrics.stage("extract"):
+            pages = await extract_text_from_pdf(spool_path)
         
         if not pages:
             # Update status to failed
-            supabase.table("pdf_documents").update({
-                "status": "failed"
-            }).eq("id", document_id).execute()
+            await repository.set_document_status(document_id, "failed")
             logger.error(f"No text extracted from document {document_id}")
             return
         
         logger.info(f"Extracted {len(pages)} pages from document {document_id}")
         
-        # 2. Chunk text
+        # 2. Chunk text in one pass over all pages (chunks may cross page breaks
+        # and keep the page they start on)
         all_chunks = []
-        chunk_index = 0
-        
-        for page_num, page_text in pages:
-            chunks = chunk_text(page_text, settings.chunk_size, settings.chunk_overlap)
-            
-            for chunk in chunks:
-                all_chunks.append({
-                    "text": chunk,
-                    "page_number": page_num,
-                    "chunk_index": chunk_index
-                })
-                chunk_index += 1
+        
+        with ingestion_metrics.stage("chunk"):
+            for chunk_index, chunk in enumerate(iter_chunks(pages, settings.chunk_size, settings.chunk_overlap)):
+                chunk["chunk_index"] = chunk_index
+                all_chunks.append(chunk)
         
         logger.info(f"Created {len(all_chunks)} chunks from document {document_id}")
         
-        # 3. Generate embeddings for all chunks
-        chunk_texts = [c["text"] for c in all_chunks]
-        embeddings = await generate_embeddings(chunk_texts)
-        
-        logger.info(f"Generated {len(embeddings)} embeddings for document {document_id}")
-        
-        # 4. Store chunks with embeddings in database using Supabase REST API
-        # Prepare data for batch insert
-        chunks_to_insert = []
-        for i, chunk_data in enumerate(all_chunks):
-            chunks_to_insert.append({
-                "document_id": document_id,
-                "chunk_text": chunk_data["text"],
-                "chunk_index": chunk_data["chunk_index"],
-                "page_number": chunk_data["page_number"],
-                "embedding": embeddings[i]  # List of floats
-            })
-        
-        # Insert chunks in batches (Supabase has limits)
-        batch_size = 50
-        for i in range(0, len(chunks_to_insert), batch_size):
-            batch = chunks_to_insert[i:i + batch_size]
-            supabase.table("document_chunks").insert(batch).execute()
-        
-        logger.info(f"Stored {len(all_chunks)} chunks for document {document_id}")
-        
-        # 5. Update document status to completed
-        supabase.table("pdf_documents").update({
-            "status": "completed"
-        }).eq("id", document_id).execute()
+        # 3. Reuse stored embeddings for byte-identical chunk text (e.g. revised
+        # handbooks, or batches already embedded by an earlier failed run)
+        for chunk_data in all_chunks:
+            chunk_data["content_hash"] = hashlib.sha256(chunk_data["text"].encode("utf-8")).hexdigest()
+        
+        with ingestion_metrics.stage("embedding_lookup"):
+            stored = await repository.get_stored_embeddings(
+                list({c["content_hash"] for c in all_chunks}),
+                settings.embedding_model
+            )
+        
+        # Misses grouped by hash, so repeated text (headers, footers, boilerplate
+        # pages) is embedded once and shared by every chunk that has it
+        missing: Dict[str, List[dict]] = {}
+        for chunk_data in all_chunks:
+            if chunk_data["content_hash"] in stored:
+                chunk_data["embedding"] = stored[chunk_data["content_hash"]]
+            else:
+                missing.setdefault(chunk_data["content_hash"], []).append(chunk_data)
+        to_embed = list(missing)
+        reused_count = len(all_chunks) - len(to_embed)
+        
+        # 4. Embed the misses in token-bounded batches, recording each batch in the
+        # embedding store as it completes so a retry resumes where this run stopped
+        async def store_batch(batch: List[int], embeddings: List[List[float]]):
+            batch_hashes = [to_embed[i] for i in batch]
+            for content_hash, embedding in zip(batch_hashes, embeddings):
+                for chunk_data in missing[content_hash]:
+                    chunk_data["embedding"] = embedding  # List of floats
+            await repository.put_stored_embeddings(settings.embedding_model, dict(zip(batch_hashes, embeddings)))
+        
+        started = time.perf_counter()
+        with ingestion_metrics.stage("embed"):
+            await embedding_batcher.embed([missing[h][0]["text"] for h in to_embed], on_batch_done=store_batch)
+        elapsed = time.perf_counter() - started
+        INGESTED_CHUNKS.labels("embedded").inc(len(to_embed))
+        INGESTED_CHUNKS.labels("reused").inc(reused_count)
+        
+        throughput = len(to_embed) / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"Embeddings for document {document_id}: {reused_count} reused, "
+            f"{len(to_embed)} newly embedded in {elapsed:.2f}s ({throughput:.1f} chunks/s)"
+        )
+        
+        # 5. Bulk-load all chunks with one binary COPY in a single transaction
+        started = time.perf_counter()
+        with ingestion_metrics.stage("store"):
+            copied = await repository.copy_chunks(document_id, all_chunks)
+        logger.info(f"Stored {copied} chunks for document {document_id} in {time.perf_counter() - started:.2f}s")
+        
+        # 6. Update document status to completed
+        await repository.set_document_status(document_id, "completed")
+        answer_cache.bump_knowledge_revision()
+        await local_vector_index.sync_document(document_id)
         
         logger.info(f"Successfully processed document {document_id}")
+        
+        # 7. Drop stored embeddings of retired models and old text (non-fatal)
+        try:
+            purged = await repository.purge_stored_embeddings(
+                settings.embedding_model,
+                settings.embedding_store_ttl_days * 86400
+            )
+            if purged:
+                logger.info(f"Purged {purged} stored chunk embeddings")
+        except Exception as e:
+            logger.warning(f"Embedding store purge failed: {str(e)}")
     
     except Exception as e:
         logger.error(f"Failed to process document {document_id}: {str(e)}")
         
         # Update status to failed
         try:
-            supabase.table("pdf_documents").update({
-                "status": "failed"
-            }).eq("id", document_id).execute()
+            await repository.set_document_status(document_id, "failed")
         except:
             pass
+    
+    finally:
+        remove_spool_file(spool_path)
@@ -0,0 +1,136 @@
+from services.context_assembler import DEFAULT_MEMORY
+from services.tokenizer import count_tokens, truncate_tokens
+from config import get_settings
+from functools import lru_cache
+from typing import List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MEMORY_HEADER = "\n**Previous Conversation Summary:**\n"
+KNOWLEDGE_HEADER = "\n**Relevant Knowledge:**\n"
+SECTION_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=4096)
+def _cached_count(text: str) -> int:
+    """Token count for text that repeats across prompts (instructions, headers, popular chunks)"""
+    return count_tokens(text)
+
+
+@lru_cache(maxsize=16)
+def _truncate_instructions(instructions: str, max_tokens: int) -> str:
+    logger.warning(f"System instructions exceed {max_tokens} tokens and were truncated")
+    return truncate_tokens(instructions, max_tokens)
+
+
+def _format_chunk(chunk: dict) -> str:
+    return f"\n[From {chunk['source']}]\n{chunk['text']}\n"
+
+
+class PromptBuilder:
+    """
+    Assembles the system prompt within a token budget.
+
+    Each section has its own cap (instructions, memory, knowledge) and the
+    whole prompt has an overall cap. Instructions are cut at their cap,
+    memory keeps its most recent part, and knowledge chunks are added whole,
+    best-scored first, while they still fit. Counts for text that repeats
+    across prompts are cached, so steady-state cost is counting the memory.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        instructions_tokens: int,
+        memory_tokens: int,
+        knowledge_tokens: int
+    ):
+        self.max_tokens = max_tokens
+        self.instructions_tokens = instructions_tokens
+        self.memory_tokens = memory_tokens
+        self.knowledge_tokens = knowledge_tokens
+
+    def _fit_instructions(self, instructions: str) -> str:
+        if _cached_count(instructions) <= self.instructions_tokens:
+            return instructions
+        return _truncate_instructions(instructions, self.instructions_tokens)
+
+    def _fit_memory(self, memory: str, budget: int) -> Tuple[str, int]:
+        """Return the memory section and its token count"""
+        budget -= _cached_count(SECTION_SEPARATOR) + _cached_count(MEMORY_HEADER)
+        if budget <= 1:
+            return "", 0
+        tokens = count_tokens(memory)
+        if tokens > budget:
+            # Keep the end: summaries are rewritten with the latest exchanges last
+            memory = "..." + truncate_tokens(memory, budget - 1, keep_end=True)
+            tokens = budget
+        return MEMORY_HEADER + memory, _cached_count(SECTION_SEPARATOR) + _cached_count(MEMORY_HEADER) + tokens
+
+    def _fit_knowledge(self, knowledge_chunks: List[dict], budget: int) -> Tuple[List[str], int]:
+        """Return the best-scored chunks that fit whole, and their token count"""
+        overhead = _cached_count(SECTION_SEPARATOR) + _cached_count(KNOWLEDGE_HEADER)
+        budget -= overhead
+
+        selected = []
+        used = 0
+        for chunk in sorted(knowledge_chunks, key=lambda chunk: chunk["score"], reverse=True):
+            text = _format_chunk(chunk)
+            tokens = _cached_count(text)
+            if used + tokens <= budget:
+                selected.append(text)
+                used += tokens
+        return selected, (overhead + used if selected else 0)
+
+    def build(
+        self,
+        system_instructions: str,
+        conversation_memory: str,
+        knowledge_chunks: List[dict],
+        query: str
+    ) -> str:
+        """Assemble the system prompt for the LLM, trimmed to the configured budgets"""
+        instructions = self._fit_instructions(system_instructions)
+        prompt_tokens = _cached_count(instructions)
+        prompt_parts = [instructions]
+
+        # Add conversation context
+        memory_tokens = 0
+        if conversation_memory and conversation_memory != DEFAULT_MEMORY:
+            memory_section, memory_tokens = self._fit_memory(
+                conversation_memory,
+                min(self.memory_tokens, self.max_tokens - prompt_tokens)
+            )
+            if memory_section:
+                prompt_parts.append(memory_section)
+                prompt_tokens += memory_tokens
+
+        # Add relevant knowledge (already filtered by similarity during the search)
+        knowledge = []
+        if knowledge_chunks:
+            knowledge, knowledge_tokens = self._fit_knowledge(
+                knowledge_chunks,
+                min(self.knowledge_tokens, self.max_tokens - prompt_tokens)
+            )
+            if knowledge:
+                prompt_parts.append(KNOWLEDGE_HEADER + "".join(knowledge))
+                prompt_tokens += knowledge_tokens
+
+        query_tokens = count_tokens(query)
+        logger.info(
+            f"Prompt built: {prompt_tokens + query_tokens} tokens "
+            f"(system {prompt_tokens}, memory {memory_tokens}, query {query_tokens}; "
+            f"{len(knowledge)}/{len(knowledge_chunks)} knowledge chunks)"
+        )
+        return SECTION_SEPARATOR.join(prompt_parts)
+
+
+# Global prompt builder instance
+prompt_builder = PromptBuilder(
+    max_tokens=settings.prompt_max_tokens,
+    instructions_tokens=settings.prompt_instructions_tokens,
+    memory_tokens=settings.prompt_memory_tokens,
+    knowledge_tokens=settings.prompt_knowledge_tokens
+)
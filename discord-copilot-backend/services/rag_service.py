@@ -1,81 +1,40 @@
-from openai import AsyncOpenAI
 from config import get_settings
-from typing import List
+from services.embedding_cache import embedding_cache
+from services.local_vector_index import local_vector_index
+from services.chunker import iter_chunks
+from services.openrouter import get_openrouter
+from services.llm_scheduler import llm_scheduler, Priority, SchedulerBusy
+from services.metrics import bot_metrics
+from typing import List, Optional
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Initialize OpenAI client for embeddings (OpenRouter also supports OpenAI embeddings API)
-openai_client = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=settings.openrouter_api_key
-)
-
 
 def chunk_text(text: str, chunk_size: int = 600, overlap: int = 100) -> List[str]:
     """
-    Split text into overlapping chunks based on token count (approximately)
-    Using simple word-based chunking (4 chars ≈ 1 token heuristic)
+    Split text into overlapping chunks of at most chunk_size tokens
+    (see services.chunker, which also streams across pages)
     """
-    # Approximate tokens by characters (rough estimate: 4 chars = 1 token)
-    chars_per_chunk = chunk_size * 4
-    overlap_chars = overlap * 4
-    
-    # Split by sentences first (better semantic boundaries)
-    sentences = text.replace('\n', ' ').split('. ')
-    
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-        
-        sentence_length = len(sentence)
-        
-        if current_length + sentence_length > chars_per_chunk and current_chunk:
-            # Create chunk
-            chunk_text = '. '.join(current_chunk) + '.'
-            chunks.append(chunk_text)
-            
-            # Start new chunk with overlap
-            # Keep last few sentences for context
-            overlap_sentences = []
-            overlap_length = 0
-            for sent in reversed(current_chunk):
-                if overlap_length + len(sent) <= overlap_chars:
-                    overlap_sentences.insert(0, sent)
-                    overlap_length += len(sent)
-                else:
-                    break
-            
-            current_chunk = overlap_sentences
-            current_length = overlap_length
-        
-        current_chunk.append(sentence)
-        current_length += sentence_length
-    
-    # Add final chunk
-    if current_chunk:
-        chunk_text = '. '.join(current_chunk) + '.'
-        chunks.append(chunk_text)
-    
-    return chunks
+    return [chunk["text"] for chunk in iter_chunks([(1, text)], chunk_size, overlap)]
 
 
-async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+async def generate_embeddings(texts: List[str], priority: Priority = Priority.INTERACTIVE) -> List[List[float]]:
     """
     Generate embeddings for a list of texts using OpenAI
+    (scheduled at the given priority; raises SchedulerBusy if shed)
     """
     try:
         # OpenAI supports batch embedding (max 2048 texts)
-        response = await openai_client.embeddings.create(
-            model=settings.embedding_model,
-            input=texts
-        )
+        async with llm_scheduler.slot(priority):
+            # OpenRouter also supports the OpenAI embeddings API
+            response = await get_openrouter().embeddings.create(
+                model=settings.embedding_model,
+                input=texts
+            )
         
         embeddings = [item.embedding for item in response.data]
         return embeddings
@@ -85,41 +44,117 @@ async def generate_embeddings(texts: List[str]) -> List[List[float]]:
         raise
 
 
-async def search_knowledge(query: str, top_k: int = 5) -> List[dict]:
+async def embed_query(query: str) -> List[float]:
+    """
+    Embed a single search query, going through the query embedding cache
+    """
+    cached = await embedding_cache.get(query, settings.embedding_model)
+    if cached is not None:
+        return cached
+    
+    with bot_metrics.stage("query_embedding"):
+        query_embedding = (await generate_embeddings([query]))[0]
+    embedding_cache.put(query, settings.embedding_model, query_embedding)
+    return query_embedding
+
+
+def fuse_rankings(vector_rows: List[dict], lexical_rows: List[dict], rrf_k: int, top_k: int) -> List[dict]:
+    """
+    Reciprocal rank fusion of vector and lexical results keyed by chunk id
+    (the same scoring hybrid_search_documents does in SQL)
+    """
+    fused = {}
+    for rank, row in enumerate(vector_rows, start=1):
+        fused[row["id"]] = {**row, "lexical_rank": None, "score": 1.0 / (rrf_k + rank)}
+    for rank, row in enumerate(lexical_rows, start=1):
+        entry = fused.setdefault(row["id"], {**row, "similarity": None, "score": 0.0})
+        entry["lexical_rank"] = rank
+        entry["score"] += 1.0 / (rrf_k + rank)
+    
+    return sorted(fused.values(), key=lambda row: row["score"], reverse=True)[:top_k]
+
+
+async def _local_hybrid_search(query: str, query_embedding: List[float], top_k: int, filters: dict) -> List[dict]:
+    """Vector half in-process, lexical half via RPC, fused here"""
+    from db import repository
+    
+    candidates = settings.hybrid_candidate_count
+    vector_rows, lexical_rows = await asyncio.gather(
+        local_vector_index.search(query_embedding, candidates, **filters),
+        repository.lexical_search_documents(
+            query, candidates, collection=filters["collection"], document_ids=filters["document_ids"]
+        )
+    )
+    rows = fuse_rankings(vector_rows, lexical_rows, settings.hybrid_rrf_k, top_k)
+    
+    # Lexical-only hits still need a cosine similarity for the prompt threshold
+    missing = [row["id"] for row in rows if row["similarity"] is None]
+    if missing:
+        similarities = local_vector_index.similarities(query_embedding, missing)
+        for row in rows:
+            if row["similarity"] is None:
+                row["similarity"] = similarities.get(row["id"], 0.0)
+    return rows
+
+
+async def search_knowledge(
+    query: str,
+    top_k: int = 5,
+    timings: Optional[dict] = None,
+    collection: Optional[str] = None,
+    document_ids: Optional[List[str]] = None,
+    min_similarity: Optional[float] = settings.min_similarity
+) -> List[dict]:
     """
-    Search knowledge base using vector similarity via Supabase RPC
+    Search knowledge base, fusing full-text and vector rankings when hybrid
+    search is enabled; the vector half runs in-process when the local index
+    is enabled and loaded, otherwise in the database
+    Only chunks in the given collection / documents are considered, and vector
+    hits below min_similarity are dropped before they leave the search
     Returns list of relevant chunks with metadata
+    If a timings dict is given, embedding and search durations (ms) are recorded in it
     """
     try:
-        from db.supabase_client import get_supabase
+        from db import repository
         
-        # 1. Generate query embedding
-        query_embeddings = await generate_embeddings([query])
-        query_embedding = query_embeddings[0]
+        # 1. Generate query embedding (cached for repeated questions)
+        started = time.perf_counter()
+        query_embedding = await embed_query(query)
+        embedded = time.perf_counter()
         
-        # 2. Search using Supabase RPC function
-        supabase = get_supabase()
+        # 2. Search the in-process replica, falling back to the SQL functions
+        filters = {"min_similarity": min_similarity, "collection": collection, "document_ids": document_ids}
+        with bot_metrics.stage("vector_search"):
+            if settings.hybrid_search_enabled:
+                if local_vector_index.ready:
+                    rows = await _local_hybrid_search(query, query_embedding, top_k, filters)
+                else:
+                    rows = await repository.hybrid_search_documents(query, query_embedding, top_k, **filters)
+            elif local_vector_index.ready:
+                rows = await local_vector_index.search(query_embedding, top_k, **filters)
+            else:
+                rows = await repository.search_documents(query_embedding, top_k, **filters)
         
-        # Call the search_documents RPC function
-        response = supabase.rpc(
-            "search_documents",
-            {
-                "query_embedding": query_embedding,
-                "match_count": top_k
-            }
-        ).execute()
+        if timings is not None:
+            timings["embedding"] = (embedded - started) * 1000
+            timings["vector_search"] = (time.perf_counter() - embedded) * 1000
         
         knowledge_chunks = []
-        for row in response.data:
+        for row in rows:
             knowledge_chunks.append({
                 "text": row["chunk_text"],
                 "page_number": row["page_number"],
                 "source": f"{row['filename']} (page {row['page_number']})",
-                "similarity": float(row["similarity"])
+                "similarity": float(row["similarity"]),
+                "score": float(row.get("score", row["similarity"])),  # Ranking score (RRF when hybrid)
+                "lexical_match": row.get("lexical_rank") is not None
             })
         
         return knowledge_chunks
     
+    except SchedulerBusy:
+        raise  # Overloaded: answering without knowledge would be worse than a fast "busy"
+    
     except Exception as e:
         logger.error(f"Failed to search knowledge: {str(e)}")
         return []  # Return empty list on error, don't fail the bot
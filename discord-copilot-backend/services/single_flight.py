@@ -0,0 +1,53 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) starts the work as its own task;
+    callers arriving while it runs (followers) await the same result. The
+    task is shielded, so a follower being cancelled never cancels the work
+    for everyone else. Once the task finishes, the key is free again.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run work() once per in-flight key; returns (result, True if this caller led)"""
+        result, leader = self.join(key, work)
+        return await result, leader
+
+    def join(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Tuple[Awaitable[Any], bool]:
+        """
+        Like run, but returns (awaitable result, True if this caller led) without
+        waiting, so the caller can do its own work alongside. Cancelling the
+        awaitable only stops this caller waiting.
+        """
+        task = self._in_flight.get(key)
+        leader = task is None
+
+        if leader:
+            self.leaders += 1
+            task = asyncio.create_task(work())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.followers += 1
+            logger.info(f"Coalesced duplicate request onto in-flight {key}")
+
+        return asyncio.shield(task), leader
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
@@ -0,0 +1,71 @@
+"""
+Token counting for chunking, embedding batches and prompt budgets.
+
+tiktoken downloads the encoding on first use (cached under
+TIKTOKEN_CACHE_DIR), so the server loads it once at startup off the event
+loop; prefetch it at build time with `python -m services.tokenizer`. If it
+cannot be loaded, counts fall back to a 4 characters per token estimate.
+"""
+import tiktoken
+from typing import List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+# cl100k_base is the tokenizer for text-embedding-3-* and the GPT-4 family;
+# for other providers it is a close enough estimate for budgeting
+ENCODING_NAME = "cl100k_base"
+CHARS_PER_TOKEN = 4
+
+
+class EstimatedEncoding:
+    """Stand-in when tiktoken is unavailable: every 4 characters count as a token"""
+
+    name = "chars/4 estimate"
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+_encoding: Optional[Union[tiktoken.Encoding, EstimatedEncoding]] = None
+
+
+def load_encoding() -> Union[tiktoken.Encoding, EstimatedEncoding]:
+    """Load the encoding once (may download it; blocking), falling back to the estimate"""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:
+            # Remembered, so later calls don't retry the download on every message
+            logger.error(f"Failed to load tokenizer {ENCODING_NAME}, estimating 4 chars per token: {str(e)}")
+            _encoding = EstimatedEncoding()
+    return _encoding
+
+
+def get_encoding() -> Union[tiktoken.Encoding, EstimatedEncoding]:
+    return _encoding if _encoding is not None else load_encoding()
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text"""
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut text to at most max_tokens, keeping the start (or the end with keep_end)"""
+    if max_tokens <= 0:
+        return ""
+    tokens = get_encoding().encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[-max_tokens:] if keep_end else tokens[:max_tokens])
+
+
+if __name__ == "__main__":
+    # Build step: download the encoding into TIKTOKEN_CACHE_DIR
+    logging.basicConfig(level=logging.INFO)
+    print(f"Tokenizer ready: {load_encoding().name}")